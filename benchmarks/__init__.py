@@ -0,0 +1,17 @@
+# Benchmarks for the web app.
+# Unlike pipeline, these import the social package, so they start the app
+# against the configured Neo4j database.
+import os
+
+# root of the repository and the folder holding the csv exports
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.environ.get("RECFLIX_DATA_DIR", os.path.join(BASE_DIR, "Data"))
+
+
+# Function: Percentile
+# Inputs: sorted list of latencies, percentile
+# Output: latency at that percentile
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
@@ -0,0 +1,188 @@
+# Import libraries
+import argparse
+import csv
+import multiprocessing
+import os
+import threading
+import time
+from . import DATA_DIR, percentile
+from .store import StandInGraph, install
+
+# Login throughput against browse traffic.
+# Runs browse clients (index and movie pages) alone for a baseline, then
+# again alongside login clients, and reports throughput and latency
+# percentiles for both, so the cost of logins to everyone else shows up.
+# It runs the way gunicorn does (gunicorn.conf.py): the models are loaded
+# once, then --processes web processes are forked, each starting its own
+# hashing pool, and the clients are spread across them. Run it once with
+# --workers 0 (bcrypt in the request thread) and once with the hashing
+# pools to compare. Runs on a stand-in store seeded from Data/
+# (benchmarks/store.py), so no Neo4j is needed and the login users
+# (bench_auth_N) are registered in it rather than in a real database. Each
+# web process has its own copy of the store.
+#
+# Usage: python -m benchmarks.auth [--processes 4] [--workers 1] [--logins 8]
+#        [--browsers 8] [--seconds 10] [--rtt 0.5]
+
+PASSWORD = "benchmark"
+
+
+# Function: Movie Ids
+# Inputs: ratings csv path, how many
+# Output: list of the first distinct movie ids in the ratings
+def movie_ids(path, n):
+    found = []
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            if row["movieId"] not in found:
+                found.append(row["movieId"])
+                if len(found) == n:
+                    break
+    return found
+
+
+# Function: Run
+# Inputs: flask app, login users, movie ids, numbers of this process's
+# login threads, numbers of its browse threads, monotonic time to stop at
+# Output: dict of "login"/"browse" -> list of latencies in seconds
+# Process: every thread has its own test client and loops until time is up
+def run(app, users, movies, logins, browsers, deadline):
+    latencies = {"login": [], "browse": []}
+    lock = threading.Lock()
+
+    def login_loop(n):
+        client = app.test_client()
+        username = users[n % len(users)]
+        times = []
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            client.post("/login", data={"username": username, "password": PASSWORD},
+                        environ_base={"REMOTE_ADDR": "10.0.0.%d" % n})
+            times.append(time.monotonic() - started)
+        with lock:
+            latencies["login"].extend(times)
+
+    def browse_loop(n):
+        client = app.test_client()
+        times = []
+        i = n
+        while time.monotonic() < deadline:
+            path = "/" if i % 2 else "/movie/%s" % movies[i % len(movies)]
+            started = time.monotonic()
+            client.get(path)
+            times.append(time.monotonic() - started)
+            i += 1
+        with lock:
+            latencies["browse"].extend(times)
+
+    threads = ([threading.Thread(target=login_loop, args=(n,)) for n in logins] +
+               [threading.Thread(target=browse_loop, args=(n,)) for n in browsers])
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+# Function: Run Forked
+# Inputs: flask app, login users, movie ids, login threads, browse threads,
+# seconds to run, web processes
+# Output: dict of "login"/"browse" -> list of latencies in seconds, from
+# every process
+# Process: forks the web processes, which start their hashing pools like a
+# gunicorn worker, deals the client threads out between them and runs them
+# all until the same deadline
+def run_forked(app, users, movies, logins, browsers, seconds, processes):
+    from social import auth_pool, forked
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    ready = context.Barrier(processes + 1)
+
+    def web_process(k):
+        forked()
+        ready.wait()
+        deadline = time.monotonic() + seconds
+        results.put(run(app, users, movies, range(k, logins, processes),
+                        range(k, browsers, processes), deadline))
+        # the process can only exit once its hashing processes have
+        auth_pool.executor.shutdown()
+
+    children = [context.Process(target=web_process, args=(k,)) for k in range(processes)]
+    for child in children:
+        child.start()
+    ready.wait()
+    latencies = {"login": [], "browse": []}
+    for _ in children:
+        for kind, times in results.get().items():
+            latencies[kind].extend(times)
+    for child in children:
+        child.join()
+    return latencies
+
+
+# Function: Report
+# Inputs: label, dict of latencies, seconds run
+# Output: None
+def report(label, latencies, seconds):
+    for kind, times in latencies.items():
+        if not times:
+            continue
+        times = sorted(times)
+        print("%-14s %-6s %7.1f req/s  p50 %7.1fms  p95 %7.1fms  p99 %7.1fms"
+              % (label, kind, len(times) / seconds, percentile(times, 50) * 1000,
+                 percentile(times, 95) * 1000, percentile(times, 99) * 1000))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure login throughput against browse traffic")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1,
+                        help="web processes, as gunicorn's WEB_CONCURRENCY")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="hashing processes per web process, 0 hashes in the request "
+                             "thread, defaults to the app's")
+    parser.add_argument("--logins", type=int, default=8, help="login threads")
+    parser.add_argument("--browsers", type=int, default=8, help="browse threads")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--data", default=DATA_DIR)
+    parser.add_argument("--rtt", type=float, default=0.5,
+                        help="milliseconds each database round trip waits")
+    args = parser.parse_args(argv)
+
+    # settings are read when the app is imported. install turns the hashing
+    # pool off, which is what this measures, so put back what was asked for
+    workers = os.environ.get("RECFLIX_AUTH_WORKERS")
+    os.environ["WEB_CONCURRENCY"] = str(args.processes)
+    install(StandInGraph(rtt=args.rtt / 1000.0).seed(args.data))
+    if args.workers is not None:
+        os.environ["RECFLIX_AUTH_WORKERS"] = str(args.workers)
+    elif workers is None:
+        del os.environ["RECFLIX_AUTH_WORKERS"]
+    else:
+        os.environ["RECFLIX_AUTH_WORKERS"] = workers
+    # measure hashing, not the attempt limits
+    os.environ["RECFLIX_LOGIN_USER_LIMIT"] = os.environ["RECFLIX_LOGIN_IP_LIMIT"] = "1000000000"
+    from social import app, auth_pool, config, graph, load, schema
+    app.secret_key = os.urandom(24)
+    schema.migrate(graph)
+    # like wsgi.py, the master loads the models and leaves hashing to the
+    # web processes, so the login users are registered here hashing inline
+    load()
+    users = ["bench_auth_%d" % n for n in range(max(1, args.logins))]
+    client = app.test_client()
+    pooled, auth_pool.workers = auth_pool.workers, 0
+    for username in users:
+        client.post("/register", data={"username": username, "password": PASSWORD})
+    auth_pool.workers = pooled
+    movies = movie_ids(os.path.join(args.data, "ratings.csv"), 100)
+
+    print("web processes: %d, auth workers: %d each (%d in all), bcrypt cost: %d"
+          % (args.processes, config.AUTH_WORKERS, args.processes * config.AUTH_WORKERS,
+             config.BCRYPT_ROUNDS))
+    report("browse only", run_forked(app, users, movies, 0, args.browsers, args.seconds,
+                                     args.processes), args.seconds)
+    report("with logins", run_forked(app, users, movies, args.logins, args.browsers,
+                                     args.seconds, args.processes), args.seconds)
+
+
+if __name__ == "__main__":
+    main()
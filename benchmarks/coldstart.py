@@ -0,0 +1,178 @@
+# Import libraries
+import argparse
+import gc
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from . import DATA_DIR
+from .store import StandInGraph, install
+
+# Cold start benchmark for the prefork serving mode.
+# Each run is a fresh interpreter on a StandInGraph seeded from Data/ (no
+# Neo4j needed) that does what wsgi.py does: imports the app, times every
+# step of load(), freezes the collector and forks --workers workers. Each
+# worker runs forked(), serves / and a movie page, and reports how long it
+# took from the fork to its first response and how much memory it holds
+# privately, the rest being shared with the master copy on write.
+#
+# The median over --runs of import plus load is checked against the startup
+# budget (RECFLIX_STARTUP_BUDGET unless --budget is given), the run exits
+# non-zero when it is over.
+#
+# Usage: python -m benchmarks.coldstart [--runs 3] [--workers 4] [--budget 30]
+
+# pages each forked worker serves first
+FIRST_PAGES = ("/", "/movie/1")
+
+
+# Function: Memory
+# Inputs: None
+# Output: (resident MB, private MB) of this process, zeros where /proc
+# doesnt have them
+def memory():
+    values = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                name, _, rest = line.partition(":")
+                if rest.strip().endswith("kB"):
+                    values[name] = int(rest.split()[0]) / 1024.0
+    except OSError:
+        pass
+    return (values.get("Rss", 0.0),
+            values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0))
+
+
+# Function: Serve First
+# Inputs: app, forked function, fork time, pipe to write to
+# Output: None, exits the worker
+# Process: runs in a forked worker
+def serve_first(app, forked, started, pipe):
+    status = 1
+    try:
+        forked()
+        client = app.test_client()
+        codes = [client.get(page).status_code for page in FIRST_PAGES]
+        first = time.perf_counter() - started
+        rss, private = memory()
+        os.write(pipe, (json.dumps({"first_s": first, "codes": codes, "rss_mb": rss,
+                                    "private_mb": private}) + "\n").encode("utf-8"))
+        status = 0
+    finally:
+        os._exit(status)
+
+
+# Function: Child
+# Inputs: parsed arguments
+# Output: dict of what the run measured
+# Process: one cold start, run in its own interpreter by main
+def child(args):
+    store = StandInGraph(rtt=args.rtt / 1000.0).seed(args.data)
+    install(store)
+    started = time.perf_counter()
+    import social
+    imported = time.perf_counter() - started
+    social.schema.migrate(social.graph)
+    timings = social.load()
+    gc.freeze()
+    rss, _ = memory()
+
+    read, write = os.pipe()
+    pids = []
+    for _ in range(args.workers):
+        forked_at = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read)
+            serve_first(social.app, social.forked, forked_at, write)
+        pids.append(pid)
+    os.close(write)
+    with os.fdopen(read) as f:
+        workers = [json.loads(line) for line in f]
+    for pid in pids:
+        os.waitpid(pid, 0)
+    return {"import_s": imported, "steps": timings, "master_rss_mb": rss, "workers": workers,
+            "crashed": args.workers - len(workers)}
+
+
+# Function: Report
+# Inputs: list of child results
+# Output: median seconds of import plus load
+def report(runs):
+    steps = ["import_s"] + list(runs[0]["steps"])
+    print("%-14s %9s %9s %9s" % ("step", "median s", "min s", "max s"))
+    totals = []
+    for step in steps:
+        values = [r["import_s"] if step == "import_s" else r["steps"][step] for r in runs]
+        print("%-14s %9.3f %9.3f %9.3f" % (step, statistics.median(values), min(values),
+                                          max(values)))
+    for r in runs:
+        totals.append(r["import_s"] + sum(r["steps"].values()))
+    print("%-14s %9.3f %9.3f %9.3f" % ("total", statistics.median(totals), min(totals),
+                                      max(totals)))
+    workers = [w for r in runs for w in r["workers"]]
+    if workers:
+        first = sorted(w["first_s"] for w in workers)
+        print("workers: first response %.0fms median, %.0fms max after the fork"
+              % (statistics.median(first) * 1000, first[-1] * 1000))
+        print("workers: %.1fMB private of %.1fMB resident on average, master %.1fMB"
+              % (statistics.mean(w["private_mb"] for w in workers),
+                 statistics.mean(w["rss_mb"] for w in workers),
+                 statistics.mean(r["master_rss_mb"] for r in runs)))
+    return statistics.median(totals)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the prefork cold start")
+    parser.add_argument("--data", default=DATA_DIR)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rtt", type=float, default=0.5,
+                        help="milliseconds each database round trip waits")
+    parser.add_argument("--budget", type=float, default=None,
+                        help="seconds import plus load may take (default: RECFLIX_STARTUP_BUDGET)")
+    parser.add_argument("--out", help="write the results to this json file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(child(args)))
+        return
+
+    # keep the runs self contained, these are read when the app is imported
+    env = dict(os.environ, RECFLIX_SEARCH_SNAPSHOT="", RECFLIX_AUTH_WORKERS="0")
+    command = [sys.executable, "-m", "benchmarks.coldstart", "--child", "--data", args.data,
+               "--workers", str(args.workers), "--rtt", str(args.rtt)]
+    runs = []
+    for _ in range(args.runs):
+        out = subprocess.run(command, env=env, check=True, stdout=subprocess.PIPE).stdout
+        runs.append(json.loads(out.decode("utf-8").strip().splitlines()[-1]))
+    crashed = sum(r["crashed"] for r in runs)
+    bad = [c for r in runs for w in r["workers"] for c in w["codes"] if c != 200]
+    total = report(runs)
+
+    budget = args.budget
+    if budget is None:
+        from social import config
+        budget = config.STARTUP_BUDGET
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"meta": {"runs": args.runs, "workers": args.workers, "rtt_ms": args.rtt,
+                                "budget_s": budget, "time": int(time.time())},
+                       "runs": runs}, f, indent=2)
+    problems = []
+    if budget and total > budget:
+        problems.append("cold start took %.2fs, over its %.1fs budget" % (total, budget))
+    if crashed or bad:
+        problems.append("%d workers crashed and %d first pages failed" % (crashed, len(bad)))
+    for problem in problems:
+        print("REGRESSION", problem)
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,497 @@
+# Import libraries
+import argparse
+import csv
+import json
+import math
+import multiprocessing
+import os
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from datetime import date
+import numpy as np
+from . import DATA_DIR
+
+# Offline evaluation of the recommenders.
+# Splits ratings.csv into train and test by time, fits every model on the
+# train part only and asks each for the top k films of every user, scoring
+# the lists against the films the user went on to rate at least --relevant
+# in the test part:
+#  - precision@k, recall@k and NDCG@k, averaged over users with at least
+#    one relevant test film
+#  - coverage: share of the train catalog recommended to anyone
+#  - novelty: mean -log2 of the share of train users who rated each film
+#    recommended, higher is less obvious
+# Users are scored in a process pool. Each model also reports its fit time,
+# the memory it allocated while fitting (peak) and still holds (kept),
+# and how many recommendation lists one process serves per second.
+#
+# Splits: "user" holds out the latest --test-fraction of each user's
+# ratings, "global" holds out everything rated after one cut-off time.
+# Times come from a timestamp column in ratings.csv, else from reviews.csv
+# (one review per rating, written by pipeline.etl). Without either the split
+# falls back to a seeded random holdout, which the report says, and the
+# recent model is skipped as it needs real times.
+#
+# Models, one per recommender in social/models.py:
+#  - svd, nmf: the matrix factorisation behind Movie.recommend_films
+#  - snapshot: the SIMILAR walk it falls back to
+#  - recent: Movie.recommend_recent_films, SIMILAR neighbours of every rated
+#    film unless reviewed since the start of the month before the split
+#  - similar: Movie.get_similar_films of the user's latest film
+#  - popular: most liked films the user hasnt rated, as a baseline
+#
+# Usage: python -m benchmarks.evaluate [--split user] [--k 10]
+#        [--models svd,nmf,snapshot,recent,similar,popular] [--out results.json]
+
+# users with fewer ratings are kept whole in train by the user split
+MIN_RATINGS = 5
+
+# models, users and test films shared with the worker processes, set before
+# the pool forks
+_shared = {}
+
+
+# Function: Read CSV
+# Inputs: csv path
+# Output: list of row dicts, empty if the file doesnt exist
+def read_csv(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+class Ratings:
+    # Function: Constructor Function
+    # Inputs: Self, arrays of user ids, movie ids, ratings and times
+    # Output: None
+    def __init__(self, users, movies, ratings, times):
+        self.users = users
+        self.movies = movies
+        self.ratings = ratings
+        self.times = times
+
+    # Function: Take
+    # Inputs: Self, boolean mask or index array
+    # Output: Ratings holding just those rows
+    def take(self, rows):
+        return Ratings(self.users[rows], self.movies[rows], self.ratings[rows], self.times[rows])
+
+    # Function: By User
+    # Inputs: Self
+    # Output: dict of user id -> list of (movie id, rating, time) in time order
+    def by_user(self):
+        grouped = defaultdict(list)
+        for i in np.lexsort((self.times, self.users)).tolist():
+            grouped[int(self.users[i])].append(
+                (int(self.movies[i]), float(self.ratings[i]), float(self.times[i])))
+        return grouped
+
+
+# Function: Load Ratings
+# Inputs: data folder, reviews csv path
+# Output: (Ratings, where the times came from: "ratings", "reviews" or None)
+# Process: ratings without a review get the earliest time so they only ever
+# land in train
+def load_ratings(data_dir, reviews_path):
+    rows = read_csv(os.path.join(data_dir, "ratings.csv"))
+    users = np.array([int(r["userId"]) for r in rows], dtype=np.int64)
+    movies = np.array([int(float(r["movieId"])) for r in rows], dtype=np.int64)
+    ratings = np.array([float(r["rating"]) for r in rows], dtype=np.float32)
+    if rows and rows[0].get("timestamp"):
+        times = np.array([float(r["timestamp"]) for r in rows])
+        return Ratings(users, movies, ratings, times), "ratings"
+    reviewed = {(int(r["userId"]), int(float(r["movieId"]))): float(r["timestamp"])
+                for r in read_csv(reviews_path) if r.get("timestamp")}
+    if not reviewed:
+        return Ratings(users, movies, ratings, np.zeros(len(rows))), None
+    times = np.array([reviewed.get(key, -1.0) for key in zip(users.tolist(), movies.tolist())])
+    return Ratings(users, movies, ratings, times), "reviews"
+
+
+# Function: Split
+# Inputs: Ratings, "user" or "global", share of ratings held out, whether
+# the times are real, random seed
+# Output: (train Ratings, test Ratings)
+def split(data, mode, test_fraction, dated, seed=1):
+    times = data.times
+    if not dated:
+        times = np.random.RandomState(seed).permutation(len(times)).astype(np.float64)
+        data = Ratings(data.users, data.movies, data.ratings, times)
+    if mode == "global":
+        cut = np.quantile(times[times >= 0], 1 - test_fraction)
+        test = times >= cut
+    else:
+        order = np.lexsort((times, data.users))
+        users = data.users[order]
+        starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+        counts = np.diff(np.r_[starts, len(users)])
+        position = np.arange(len(users)) - np.repeat(starts, counts)
+        count = np.repeat(counts, counts)
+        held = (count >= MIN_RATINGS) & (position >= np.ceil(count * (1 - test_fraction)))
+        test = np.zeros(len(times), dtype=bool)
+        test[order[held]] = True
+    return data.take(~test), data.take(test)
+
+
+# Function: Read Side Data
+# Inputs: data folder
+# Output: dict of the graph's other exports in GraphSnapshot.build's shapes
+def read_side(data_dir):
+    from social.snapshot import to_int
+    path = lambda name: os.path.join(data_dir, name)
+    return {
+        "genres": {to_int(r["GenreId"]): r["Name"] for r in read_csv(path("genresinfo.csv"))},
+        "users": [to_int(r["userID"]) for r in read_csv(path("users.csv"))],
+        "similar": [(to_int(r["MovieId"]), to_int(r["SimMovieId"]), float(r.get("Score") or 0))
+                    for r in read_csv(path("movie_sim.csv"))],
+        "keywords": [(to_int(r["movieId"]), r["keywords"])
+                     for r in read_csv(path("movie_keys.csv"))],
+        "has_genre": [(to_int(r["movieId"]), to_int(r["code"]))
+                      for r in read_csv(path("genres.csv"))],
+    }
+
+
+class Model:
+    # the common recommender interface: fit once on the train ratings, then
+    # recommend(user id, n) returns up to n movie ids best first
+    name = None
+
+    # Function: Fit
+    # Inputs: Self, train Ratings, side data from read_side
+    # Output: None
+    def fit(self, train, side):
+        raise NotImplementedError
+
+    # Function: Recommend
+    # Inputs: Self, user id, number of films
+    # Output: list of movie ids, empty if the model has nothing for the user
+    def recommend(self, user_id, n):
+        raise NotImplementedError
+
+
+class FactorModel(Model):
+    # Function: Constructor Function
+    # Inputs: Self, "svd" or "nmf", number of factors, top n to precompute
+    # Output: None
+    def __init__(self, method, factors, top_n):
+        self.name = method
+        self.method, self.factors, self.top_n = method, factors, top_n
+
+    def fit(self, train, side):
+        from social.recommender import Recommender
+        self.engine = Recommender(method=self.method, factors=self.factors, top_n=self.top_n)
+        self.engine.fit(train.users, train.movies, train.ratings)
+
+    def recommend(self, user_id, n):
+        return self.engine.recommend(user_id, n) or []
+
+
+class SnapshotModel(Model):
+    name = "snapshot"
+
+    # Function: Fit
+    # Inputs: Self, train Ratings, side data
+    # Output: None
+    # Process: a GraphSnapshot whose RATED edges are the train ratings
+    def fit(self, train, side):
+        from social.snapshot import GraphSnapshot
+        rated = zip(train.users.tolist(), train.movies.tolist(), train.ratings.tolist())
+        self.snapshot = GraphSnapshot().build({}, side["genres"], side["users"], rated,
+                                              side["similar"], side["keywords"],
+                                              side["has_genre"])
+
+    def recommend(self, user_id, n):
+        return self.snapshot.recommend(user_id, n) or []
+
+
+class RecentModel(Model):
+    name = "recent"
+
+    # Function: Fit
+    # Inputs: Self, train Ratings, side data
+    # Output: None
+    # Process: keeps each user's films in rating order, when the user's test
+    # ratings begin, and the SIMILAR rows in the snapshot's best first order
+    def fit(self, train, side):
+        self.rated = train.by_user()
+        self.now = {u: films[-1][2] for u, films in self.rated.items()}
+        self.similar = defaultdict(list)
+        for movie, other, score in sorted(side["similar"], key=lambda s: (s[0], -s[2])):
+            self.similar[movie].append(other)
+
+    # Function: Recommend
+    # Inputs: Self, user id, number of films
+    # Output: list of movie ids, repeats kept as the query returns them
+    # Process: same walk as the Cypher in Movie.recommend_recent_films, with
+    # "today" being the user's last train rating
+    def recommend(self, user_id, n):
+        films = self.rated.get(user_id)
+        if not films:
+            return []
+        first = date.fromtimestamp(self.now[user_id]).replace(day=1)
+        since = time.mktime((first - date.resolution).replace(day=1).timetuple())
+        reviewed = {m for m, _, t in films if t > since}
+        if not reviewed:
+            return []
+        found = []
+        for movie, _, _ in films:
+            for other in self.similar.get(movie, ()):
+                if other not in reviewed:
+                    found.append(other)
+                    if len(found) == n:
+                        return found
+        return found
+
+
+class SimilarModel(SnapshotModel):
+    name = "similar"
+
+    # Function: Fit
+    # Inputs: Self, train Ratings, side data
+    # Output: None
+    def fit(self, train, side):
+        super().fit(train, side)
+        self.latest = {u: films[-1][0] for u, films in train.by_user().items()}
+
+    # Function: Recommend
+    # Inputs: Self, user id, number of films
+    # Output: list of movie ids
+    # Process: Movie.get_similar_films of the film the user rated last
+    def recommend(self, user_id, n):
+        movie = self.latest.get(user_id)
+        if movie is None:
+            return []
+        return self.snapshot.similar_films(movie, n) or self.snapshot.related_films(movie, n)
+
+
+class PopularModel(Model):
+    name = "popular"
+
+    # Function: Constructor Function
+    # Inputs: Self, ratings that count as liked
+    # Output: None
+    def __init__(self, relevant):
+        self.relevant = relevant
+
+    def fit(self, train, side):
+        liked = Counter(train.movies[train.ratings >= self.relevant].tolist())
+        self.ranked = [m for m, _ in liked.most_common()]
+        self.seen = defaultdict(set)
+        for user, movie in zip(train.users.tolist(), train.movies.tolist()):
+            self.seen[user].add(movie)
+
+    def recommend(self, user_id, n):
+        seen = self.seen.get(user_id, ())
+        found = []
+        for movie in self.ranked:
+            if movie not in seen:
+                found.append(movie)
+                if len(found) == n:
+                    break
+        return found
+
+
+# Function: Make Models
+# Inputs: list of model names, parsed arguments
+# Output: list of unfitted models
+def make_models(names, args):
+    from social import config
+    made = {
+        "svd": lambda: FactorModel("svd", config.RECOMMENDER_FACTORS, config.RECOMMENDER_TOP_N),
+        "nmf": lambda: FactorModel("nmf", config.RECOMMENDER_FACTORS, config.RECOMMENDER_TOP_N),
+        "snapshot": SnapshotModel,
+        "recent": RecentModel,
+        "similar": SimilarModel,
+        "popular": lambda: PopularModel(args.relevant),
+    }
+    unknown = [n for n in names if n not in made]
+    if unknown:
+        raise SystemExit("unknown models: %s" % ", ".join(unknown))
+    return [made[n]() for n in names]
+
+
+# Function: Fit Models
+# Inputs: list of models, train Ratings, side data
+# Output: dict of model name -> {fit_s, peak_mb, kept_mb}
+# Process: traces the allocations of each fit on its own
+def fit_models(models, train, side):
+    costs = {}
+    for model in models:
+        tracemalloc.start()
+        started = time.perf_counter()
+        model.fit(train, side)
+        fit_time = time.perf_counter() - started
+        kept, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        costs[model.name] = {"fit_s": fit_time, "peak_mb": peak / 2 ** 20, "kept_mb": kept / 2 ** 20}
+        print("fitted %-8s in %.1fs, %.1fMB peak" % (model.name, fit_time, peak / 2 ** 20))
+    return costs
+
+
+# Function: Score List
+# Inputs: recommended movie ids, set of relevant test films, k
+# Output: (precision, recall, ndcg)
+# Process: repeated films take a slot but only score once
+def score_list(films, relevant, k):
+    seen, gains = set(), []
+    for movie in films[:k]:
+        gains.append(1.0 if movie in relevant and movie not in seen else 0.0)
+        seen.add(movie)
+    hits = sum(gains)
+    dcg = sum(g / math.log2(i + 2) for i, g in enumerate(gains))
+    ideal = sum(1.0 / math.log2(i + 2) for i in range(min(k, len(relevant))))
+    return hits / k, hits / len(relevant), dcg / ideal
+
+
+# Function: Score Users
+# Inputs: list of user ids
+# Output: dict of model name -> sums of the metrics over those users
+# Process: runs in a worker, reading the models from _shared
+def score_users(user_ids):
+    models, relevant, k = _shared["models"], _shared["relevant"], _shared["k"]
+    popularity, n_users = _shared["popularity"], _shared["n_users"]
+    sums = {}
+    for model in models:
+        s = sums[model.name] = {"users": 0, "answered": 0, "precision": 0.0, "recall": 0.0,
+                                "ndcg": 0.0, "novelty": 0.0, "films": 0, "seconds": 0.0,
+                                "recommended": set()}
+        for user in user_ids:
+            started = time.perf_counter()
+            films = model.recommend(user, k)
+            s["seconds"] += time.perf_counter() - started
+            s["users"] += 1
+            if films:
+                s["answered"] += 1
+            s["recommended"].update(films)
+            s["films"] += len(films)
+            s["novelty"] += sum(-math.log2(max(popularity.get(m, 0), 1) / n_users)
+                                for m in films)
+            precision, recall, ndcg = score_list(films, relevant[user], k)
+            s["precision"] += precision
+            s["recall"] += recall
+            s["ndcg"] += ndcg
+    return sums
+
+
+# Function: Score
+# Inputs: list of fitted models, dict of user id -> set of relevant test
+# films, k, train Ratings, number of worker processes
+# Output: (dict of model name -> summed metrics, wall seconds)
+def score(models, relevant, k, train, processes):
+    users = sorted(relevant)
+    popularity = Counter()
+    for user, movie in set(zip(train.users.tolist(), train.movies.tolist())):
+        popularity[movie] += 1
+    _shared.update(models=models, relevant=relevant, k=k, popularity=popularity,
+                   n_users=len(np.unique(train.users)))
+    chunks = [users[i::processes * 4] for i in range(processes * 4)]
+    started = time.perf_counter()
+    if processes > 1:
+        with multiprocessing.Pool(processes) as pool:
+            parts = pool.map(score_users, [c for c in chunks if c])
+    else:
+        parts = [score_users(users)]
+    wall = time.perf_counter() - started
+    _shared.clear()
+    totals = {}
+    for part in parts:
+        for name, s in part.items():
+            total = totals.setdefault(name, {"recommended": set()})
+            for key, value in s.items():
+                if key == "recommended":
+                    total[key] |= value
+                else:
+                    total[key] = total.get(key, 0) + value
+    return totals, wall
+
+
+# Function: Summarise
+# Inputs: summed metrics from score, fit costs, k, catalog size
+# Output: dict of model name -> metrics
+def summarise(totals, costs, k, catalog):
+    summary = {}
+    for name, s in totals.items():
+        users = max(s["users"], 1)
+        summary[name] = dict(costs[name], **{
+            "precision@%d" % k: s["precision"] / users,
+            "recall@%d" % k: s["recall"] / users,
+            "ndcg@%d" % k: s["ndcg"] / users,
+            "coverage": len(s["recommended"]) / max(catalog, 1),
+            "novelty": s["novelty"] / max(s["films"], 1),
+            "answered": s["answered"] / users,
+            "recs_per_s": s["users"] / s["seconds"] if s["seconds"] else 0.0,
+        })
+    return summary
+
+
+# Function: Report
+# Inputs: summary, k
+# Output: None
+def report(summary, k):
+    columns = [("precision@%d" % k, "%12.4f"), ("recall@%d" % k, "%12.4f"),
+               ("ndcg@%d" % k, "%12.4f"), ("coverage", "%12.4f"), ("novelty", "%12.2f"),
+               ("answered", "%12.2f"), ("recs_per_s", "%12.0f"), ("fit_s", "%12.1f"),
+               ("peak_mb", "%12.1f"), ("kept_mb", "%12.1f")]
+    print("%-9s" % "model" + "".join("%12s" % c for c, _ in columns))
+    for name, s in summary.items():
+        print("%-9s" % name + "".join(fmt % s[c] for c, fmt in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate the recommenders offline")
+    parser.add_argument("--data", default=DATA_DIR)
+    parser.add_argument("--reviews", help="reviews csv with the rating times "
+                                          "(default: reviews.csv in --data)")
+    parser.add_argument("--split", choices=("user", "global"), default="user")
+    parser.add_argument("--test-fraction", type=float, default=0.2)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--relevant", type=float, default=4.0,
+                        help="test ratings at least this count as relevant")
+    parser.add_argument("--models", default="svd,nmf,snapshot,recent,similar,popular")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write the results to this json file")
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in args.models.split(",") if n.strip()]
+    data, dated = load_ratings(args.data, args.reviews or os.path.join(args.data, "reviews.csv"))
+    if not dated:
+        print("no rating times found, falling back to a random holdout")
+        if "recent" in names:
+            print("skipping the recent model, it needs rating times")
+            names.remove("recent")
+    train, test = split(data, args.split, args.test_fraction, dated, seed=args.seed)
+    known = set(np.unique(train.users).tolist())
+    relevant = defaultdict(set)
+    for user, movie, rating in zip(test.users.tolist(), test.movies.tolist(),
+                                   test.ratings.tolist()):
+        if rating >= args.relevant and user in known:
+            relevant[user].add(movie)
+    catalog = len(np.unique(train.movies))
+    print("%s split on %s times: %d train and %d test ratings, %d users to score, "
+          "%d films in the catalog" % (args.split, dated or "random", len(train.users),
+                                       len(test.users), len(relevant), catalog))
+
+    models = make_models(names, args)
+    costs = fit_models(models, train, read_side(args.data))
+    processes = args.processes or os.cpu_count() or 1
+    totals, wall = score(models, dict(relevant), args.k, train, processes)
+    summary = summarise(totals, costs, args.k, catalog)
+    print("scored %d users with %d models in %.1fs across %d processes"
+          % (len(relevant), len(models), wall, processes))
+    report(summary, args.k)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"meta": {"split": args.split, "times": dated or "random",
+                                "test_fraction": args.test_fraction, "k": args.k,
+                                "relevant": args.relevant, "users": len(relevant),
+                                "catalog": catalog, "processes": processes,
+                                "score_s": wall, "seed": args.seed, "time": int(time.time())},
+                       "models": summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+# Import libraries
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlencode
+from . import DATA_DIR, percentile
+from .store import StandInGraph, install
+
+# Load test for the Flask routes.
+# Starts the real app on a StandInGraph seeded from Data/ (no Neo4j needed)
+# and replays a traffic mix over /, /profile/<username>, /movie/<movie_id>,
+# /results, /browse, /add_post and /like_post. Users are picked in proportion to
+# how many films they rated in ratings.csv and films in proportion to how
+# often they were rated, search terms are pieces of titles and usernames.
+#
+# A first pass sends a few requests per route one at a time to count the
+# database round trips each makes, then the timed pass runs the whole mix
+# across client threads. Per route p50/p95/p99 latency, throughput and
+# round trips are printed and saved as json; --compare checks them against
+# an earlier run and exits non-zero if a route got slower or chattier.
+#
+# Usage: python -m benchmarks.routes [--requests 2000] [--threads 8]
+#        [--rtt 0.5] [--out results.json] [--compare baseline.json]
+
+# share of requests per route
+MIX = {"index": 30, "movie": 30, "profile": 15, "results": 10, "like_post": 10,
+       "add_post": 5, "browse": 5}
+
+# requests per route in the round trip counting pass
+TRACE = 20
+
+
+# Function: Weighted Counts
+# Inputs: ratings csv path
+# Output: (Counter of userid -> ratings, Counter of movie id -> ratings)
+def weighted_counts(path):
+    users, movies = Counter(), Counter()
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            users[int(float(row["userId"]))] += 1
+            movies[int(float(row["movieId"]))] += 1
+    return users, movies
+
+
+class TrafficMix:
+    # Function: Constructor Function
+    # Inputs: Self, StandInGraph seeded from the data, ratings csv path,
+    # dict of route -> share, random seed
+    # Output: None
+    def __init__(self, store, ratings, mix=None, seed=1):
+        self.rng = random.Random(seed)
+        self.mix = mix or MIX
+        user_counts, movie_counts = weighted_counts(ratings)
+        self.users = [store.user_names[u] for u in user_counts if u in store.user_names]
+        self.user_weights = [user_counts[store.users[u]["userid"]] for u in self.users]
+        self.movies = [m for m in movie_counts if m in store.movies]
+        self.movie_weights = [movie_counts[m] for m in self.movies]
+        self.titles = [store.movies[m]["title"] for m in self.movies]
+        self.posts = [p["post"]["postid"] for p in store._latest()]
+        self.tags = sorted({t for p in store.posts.values() for t in p["tags"]}) or ["good"]
+        self.genres = sorted(store.genres.values())
+        self.store = store
+
+    def _user(self):
+        return self.rng.choices(self.users, self.user_weights)[0]
+
+    def _movie(self):
+        return self.rng.choices(self.movies, self.movie_weights)[0]
+
+    # Function: Term
+    # Inputs: Self, text to take it from
+    # Output: 3 to 6 letters from the start of one of the text's words
+    def _term(self, text):
+        words = [w for w in str(text).lower().split() if len(w) >= 3] or [str(text).lower()]
+        word = self.rng.choice(words)
+        return word[:self.rng.randint(3, 6)]
+
+    # Function: Request
+    # Inputs: Self, route name
+    # Output: dict of route, method, path, form data and session username
+    def request(self, route):
+        username = self._user()
+        if route == "index":
+            return {"route": route, "method": "GET", "path": "/", "user": username}
+        if route == "movie":
+            return {"route": route, "method": "GET", "path": "/movie/%d" % self._movie(),
+                    "user": username}
+        if route == "profile":
+            # mostly people checking their own page
+            other = username if self.rng.random() < 0.6 else self._user()
+            return {"route": route, "method": "GET", "path": "/profile/%s" % other,
+                    "user": username}
+        if route == "results":
+            if self.rng.random() < 0.7:
+                data = {"title": self._term(self.rng.choice(self.titles)), "searchobj": "Movie"}
+            else:
+                data = {"title": self._term(self.rng.choice(self.users)), "searchobj": "User"}
+            return {"route": route, "method": "POST", "path": "/results", "data": data,
+                    "user": username}
+        if route == "browse":
+            # one or two facets, sometimes a rating floor
+            params = [("genre", self.rng.choice(self.genres))] if self.genres else []
+            if self.rng.random() < 0.5:
+                params.append(("decade", self.rng.choice(range(1950, 2020, 10))))
+            if self.rng.random() < 0.5:
+                params.append(("min_rating", self.rng.choice((3, 3.5, 4))))
+            params.append(("sort", self.rng.choice(("rating", "reviews", "recent"))))
+            return {"route": route, "method": "GET", "user": username,
+                    "path": "/browse?" + urlencode(params)}
+        if route == "like_post":
+            # recent posts get most of the likes
+            postid = self.posts[min(int(self.rng.expovariate(1 / 50.0)), len(self.posts) - 1)]
+            return {"route": route, "method": "GET", "path": "/like_post/%s" % postid,
+                    "user": username}
+        movie = self._movie()
+        # the user's own rating of the film where they have one
+        userid = self.store.users[username]["userid"]
+        rating = int(round(self.store.rated.get((userid, movie), 3.0)))
+        data = {"title": "Benchmark review", "tags": ",".join(self.rng.sample(self.tags, 2)),
+                "rating": str(max(1, min(5, rating))), "text": "Posted by the benchmark",
+                "movieID": str(movie)}
+        return {"route": route, "method": "POST", "path": "/add_post", "data": data,
+                "user": username}
+
+    # Function: Plan
+    # Inputs: Self, number of requests
+    # Output: list of request dicts following the mix
+    def plan(self, n):
+        routes = list(self.mix)
+        weights = [self.mix[r] for r in routes]
+        return [self.request(self.rng.choices(routes, weights)[0]) for _ in range(n)]
+
+
+# Function: Send
+# Inputs: flask test client, request dict
+# Output: (status code, seconds taken)
+# Process: logs the client in as the request's user, then times the request
+def send(client, req):
+    with client.session_transaction() as session:
+        session["username"] = req["user"]
+    headers = {"Referer": "/"}
+    started = time.perf_counter()
+    if req["method"] == "GET":
+        response = client.get(req["path"], headers=headers)
+    else:
+        response = client.post(req["path"], data=req.get("data"), headers=headers)
+    elapsed = time.perf_counter() - started
+    return response.status_code, elapsed
+
+
+# Function: Trace
+# Inputs: flask app, StandInGraph, TrafficMix
+# Output: dict of route -> average round trips per request
+# Process: one request at a time, so the store's counter only sees that
+# request's queries
+def trace(app, store, mix):
+    client = app.test_client()
+    trips = {}
+    for route in mix.mix:
+        counts = []
+        for _ in range(TRACE):
+            before = store.round_trips
+            send(client, mix.request(route))
+            counts.append(store.round_trips - before)
+        trips[route] = sum(counts) / float(len(counts))
+    return trips
+
+
+# Function: Run
+# Inputs: flask app, list of requests, client threads
+# Output: (dict of route -> list of (status, seconds), wall seconds)
+def run(app, plan, threads):
+    results = {}
+    lock = threading.Lock()
+
+    def worker(requests):
+        client = app.test_client()
+        mine = [(req["route"], send(client, req)) for req in requests]
+        with lock:
+            for route, result in mine:
+                results.setdefault(route, []).append(result)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(plan[i::threads],)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+# Function: Summarise
+# Inputs: results from run, wall seconds, round trips from trace
+# Output: dict of route -> stats, with an "all" entry
+def summarise(results, wall, trips):
+    summary = {}
+    everything = []
+    for route, rows in sorted(results.items()):
+        times = sorted(t for _, t in rows)
+        everything.extend(times)
+        summary[route] = {
+            "requests": len(rows),
+            "errors": sum(1 for status, _ in rows if status >= 500),
+            "p50_ms": percentile(times, 50) * 1000,
+            "p95_ms": percentile(times, 95) * 1000,
+            "p99_ms": percentile(times, 99) * 1000,
+            "throughput": len(rows) / wall,
+            "round_trips": trips.get(route, 0.0),
+        }
+    everything.sort()
+    summary["all"] = {
+        "requests": len(everything),
+        "errors": sum(s["errors"] for s in summary.values()),
+        "p50_ms": percentile(everything, 50) * 1000,
+        "p95_ms": percentile(everything, 95) * 1000,
+        "p99_ms": percentile(everything, 99) * 1000,
+        "throughput": len(everything) / wall,
+        "round_trips": sum(trips.get(r, 0.0) * MIX.get(r, 0) for r in trips) /
+                       float(sum(MIX.get(r, 0) for r in trips) or 1),
+    }
+    return summary
+
+
+# Function: Report
+# Inputs: summary
+# Output: None
+def report(summary):
+    print("%-10s %8s %6s %9s %9s %9s %10s %8s" % (
+        "route", "requests", "errors", "p50 ms", "p95 ms", "p99 ms", "req/s", "trips"))
+    for route, s in summary.items():
+        print("%-10s %8d %6d %9.2f %9.2f %9.2f %10.1f %8.1f" % (
+            route, s["requests"], s["errors"], s["p50_ms"], s["p95_ms"], s["p99_ms"],
+            s["throughput"], s["round_trips"]))
+
+
+# Function: Compare
+# Inputs: summary, baseline summary, allowed slowdown as a fraction,
+# milliseconds of p95 change always allowed
+# Output: list of regression messages, empty if none
+def compare(summary, baseline, tolerance, slack=1.0):
+    problems = []
+    for route, s in summary.items():
+        old = baseline.get(route)
+        if old is None:
+            continue
+        if s["p95_ms"] > old["p95_ms"] * (1 + tolerance) + slack:
+            problems.append("%s p95 %.2fms was %.2fms" % (route, s["p95_ms"], old["p95_ms"]))
+        if s["round_trips"] > old["round_trips"] + 0.01:
+            problems.append("%s round trips %.1f was %.1f" % (
+                route, s["round_trips"], old["round_trips"]))
+        if s["errors"] > old["errors"]:
+            problems.append("%s errors %d was %d" % (route, s["errors"], old["errors"]))
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Flask routes on a stand-in store")
+    parser.add_argument("--data", default=DATA_DIR)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--rtt", type=float, default=0.5,
+                        help="milliseconds each database round trip waits")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write the results to this json file")
+    parser.add_argument("--compare", help="json results of an earlier run to check against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="p95 slowdown allowed by --compare, as a fraction")
+    parser.add_argument("--slack", type=float, default=1.0,
+                        help="milliseconds of p95 slowdown always allowed by --compare")
+    args = parser.parse_args(argv)
+
+    store = StandInGraph(rtt=args.rtt / 1000.0, seed=args.seed).seed(args.data)
+    install(store)
+    started = time.perf_counter()
+    from social import app, graph, schema, start
+    schema.migrate(graph)
+    start()
+    startup = time.perf_counter() - started
+    app.secret_key = os.urandom(24)
+
+    mix = TrafficMix(store, os.path.join(args.data, "ratings.csv"), seed=args.seed)
+    print("app started in %.1fs on the stand-in store" % startup)
+    trips = trace(app, store, mix)
+    results, wall = run(app, mix.plan(args.requests), args.threads)
+    summary = summarise(results, wall, trips)
+    report(summary)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"meta": {"requests": args.requests, "threads": args.threads,
+                                "rtt_ms": args.rtt, "seed": args.seed,
+                                "startup_s": startup, "time": int(time.time())},
+                       "routes": summary}, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            problems = compare(summary, json.load(f)["routes"], args.tolerance, args.slack)
+        for problem in problems:
+            print("REGRESSION", problem)
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
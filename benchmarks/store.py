@@ -0,0 +1,724 @@
+# Import libraries
+import csv
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime
+
+# Stand-in graph store for benchmarks.
+# Holds the Data/ exports in plain dicts and answers the app's Cypher by
+# recognising each statement from fragments of its text, so the real
+# routes can run with no Neo4j. It is not a Cypher engine: a statement it
+# doesn't recognise raises, so a new query shows up as a benchmark failure
+# rather than a silently empty page. Every statement, commit, merge and
+# matcher lookup counts as one round trip and can sleep `rtt` seconds to
+# stand in for the network.
+#
+# It also takes the loader's statements, so pipeline.loader can be run and
+# tested against it.
+#
+# Posts come from reviews.csv when it exists, otherwise one post per post id
+# in tags.csv with the author's rating of the film and a timestamp in the
+# last 30 days. Movie properties come from movieinfo.csv when it exists.
+
+
+# Function: Read CSV
+# Inputs: csv path
+# Output: list of row dicts, empty if the file doesnt exist
+def read_csv(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+# Function: To Int
+# Inputs: csv value
+# Output: int or None, accepts "4", "4.0" and blanks
+def to_int(value):
+    if value is None or value == "":
+        return None
+    return int(float(value))
+
+
+# Function: Squash
+# Inputs: query text
+# Output: the text with runs of whitespace turned into single spaces
+def squash(query):
+    return " ".join(query.split())
+
+
+class Cursor:
+    # Function: Constructor Function
+    # Inputs: Self, list of row dicts
+    # Output: None
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    # Function: Data
+    # Inputs: Self
+    # Output: list of row dicts, as py2neo's Cursor.data()
+    def data(self):
+        return [dict(row) for row in self.rows]
+
+    # Function: Evaluate
+    # Inputs: Self
+    # Output: first value of the first row, None if there are no rows
+    def evaluate(self):
+        for row in self.rows:
+            for value in row.values():
+                return value
+        return None
+
+
+class Transaction:
+    # Function: Constructor Function
+    # Inputs: Self, StandInGraph
+    # Output: None
+    # Process: statements are applied as they run, rollback can't undo them
+    def __init__(self, graph):
+        self.graph = graph
+
+    def run(self, query, parameters=None, **params):
+        return self.graph.run(query, parameters, **params)
+
+    def commit(self):
+        self.graph.round_trip()
+
+    def rollback(self):
+        self.graph.round_trip()
+
+
+class Match:
+    # Function: Constructor Function
+    # Inputs: Self, StandInGraph, label, property filters
+    # Output: None
+    def __init__(self, graph, label, props):
+        self.graph = graph
+        self.label = label
+        self.props = props
+
+    # Function: First
+    # Inputs: Self
+    # Output: py2neo Node for the first match, None if there isnt one
+    def first(self):
+        from py2neo import Node
+        self.graph.round_trip()
+        found = self.graph.find_node(self.label, self.props)
+        return Node(self.label, **found) if found is not None else None
+
+
+class StandInMatcher:
+    # Function: Constructor Function
+    # Inputs: Self, StandInGraph
+    # Output: None
+    # Process: stands in for py2neo's NodeMatcher
+    def __init__(self, graph):
+        self.graph = graph
+
+    def match(self, label, **props):
+        return Match(self.graph, label, props)
+
+
+class StandInGraph:
+    # Function: Constructor Function
+    # Inputs: Self, seconds each round trip sleeps, random seed for the
+    # seeded posts
+    # Output: None
+    # Process: an empty store, fill it with seed
+    def __init__(self, rtt=0.0, seed=1):
+        self.rtt = rtt
+        self.random_seed = seed
+        self.lock = threading.RLock()
+        self.round_trips = 0
+        self.users = {}
+        self.user_names = {}
+        self.movies = {}
+        self.genres = {}
+        self.movie_genres = {}
+        self.keywords = {}
+        self.rated = {}
+        # userid -> movies they rated, in rating order
+        self.user_rated = {}
+        self.similar = {}
+        self.posts = {}
+        self.likes = {}
+        self.sequences = {}
+        self.migrations = {}
+        # posts the loader wrote whose user or movie wasnt there
+        self.loose_posts = {}
+        self.handlers = [
+            (("CREATE CONSTRAINT",), self._nothing),
+            (("CREATE INDEX",), self._nothing),
+            (("DROP ",), self._nothing),
+            (("CALL db.constraints()",), self._nothing),
+            (("CALL db.indexes()",), self._nothing),
+            (("MATCH (m:Migration)",), self._migrations),
+            (("MERGE (m:Migration",), self._record_migration),
+            (("MERGE (s:Sequence",), self._ensure_sequence),
+            (("SET s.next = s.next +",), self._reserve_ids),
+            (("MATCH (s:Sequence", "MAX(n.userid)"), self._fast_forward),
+            (("SUM(toInteger(post.rating)) as score",), self._top_rated),
+            (("COLLECT(fan.username) as likes",), self._recent_posts),
+            (("toInteger(post.timestamp) > {since}",), self._reviews_since),
+            (("like.timestamp > {since}",), self._likes_since),
+            (("genre.name as genre",), self._movie_genre_names),
+            (("toFloat(r.rating) as rating",), self._ratings),
+            (("RETURN count(n)",), self._count),
+            (("WHERE m.movieID IN {movie_ids}", "m.overview as text"), self._search_films),
+            (("RETURN m.movieID as movieID, m.title as title, m.year as year",),
+             self._search_movies),
+            (("RETURN u.username as username, u.userid as userid",), self._search_users),
+            (("COLLECT(DISTINCT t.name) as tags",), self._user_tags),
+            (("COLLECT(DISTINCT m.movieID) as movies",), self._user_movies),
+            (("MATCH (m:Movie) RETURN m.movieID as movieID, m.title as title, m.poster",),
+             self._export_movies),
+            (("MATCH (g:Genre) RETURN g.genreId",), self._export_genres),
+            (("MATCH (u:User) RETURN u.userid as userid",), self._export_users),
+            (("RETURN u.userid as userid, m.movieID as movieID, r.rating as rating",),
+             self._ratings),
+            (("m2.movieID as simID",), self._export_similar),
+            (("t.name as tag",), self._export_keywords),
+            (("HAS_GENRE", "g.genreId as genreId"), self._export_has_genre),
+            (("LIMIT {posts}",), self._movie_detail),
+            (("UNWIND {posts} AS row",), self._write_posts),
+            (("RETURN user.userid as userid",), self._user_id),
+            (("RETURN user.password",), self._password),
+            (("ON CREATE SET u.userid",), self._register),
+            (("SET user.password = {new}",), self._rehash),
+            (("post.postid < {postid}",), self._feed_page),
+            (("MERGE (user)-[like:LIKES]->(post)",), self._like),
+            (("like IS NOT NULL AS liked",), self._liked),
+            (("DELETE like",), self._unlike),
+            (("post.like_count IS NULL",), self._nothing),
+            (("post.timestamp > {timestamp}",), self._recommend_recent),
+            (("MAX(post.timestamp) AS latest",), self._browse_films),
+            (("WHERE mo.movieID IN {movie_ids}",), self._film_cards),
+            # pipeline.loader stages and pipeline.similarity.write_graph
+            (("MERGE (u:User {userid: row.userid})",), self._load_users),
+            (("MERGE (m:Movie {movieID: row.movieID})",), self._load_movies),
+            (("MERGE (g:Genre {genreId: row.genreId})",), self._load_genres),
+            (("MERGE (m)-[:HAS_GENRE]->(g)",), self._load_has_genre),
+            (("MERGE (p:Post {postid: row.postid})",), self._load_posts),
+            (("MERGE (t)-[:TAGGED]->(p)",), self._load_tags),
+            (("MERGE (t)-[:KEYWORD]->(m)",), self._load_keywords),
+            (("MERGE (u)-[r:RATED]->(m)",), self._load_ratings),
+            (("MERGE (m)-[s:SIMILAR]->(mo)",), self._load_similar),
+            (("UNWIND {ids} AS id", "DELETE s"), self._delete_similar),
+        ]
+
+    # Function: Round Trip
+    # Inputs: Self
+    # Output: None
+    # Process: counts one trip to the database and waits out its latency
+    def round_trip(self):
+        with self.lock:
+            self.round_trips += 1
+        if self.rtt:
+            time.sleep(self.rtt)
+
+    # Function: Run
+    # Inputs: Self, Cypher, parameters as a dict and/or keywords
+    # Output: Cursor of row dicts
+    def run(self, query, parameters=None, **params):
+        params = dict(parameters or {}, **params)
+        self.round_trip()
+        text = squash(query)
+        for fragments, handler in self.handlers:
+            if all(f in text for f in fragments):
+                with self.lock:
+                    return Cursor(handler(text, params))
+        raise KeyError("stand-in store doesn't know this query: %s" % text)
+
+    # Function: Evaluate
+    # Inputs: Self, Cypher, parameters
+    # Output: first value of the first row
+    def evaluate(self, query, parameters=None, **params):
+        return self.run(query, parameters, **params).evaluate()
+
+    # Function: Begin
+    # Inputs: Self
+    # Output: Transaction
+    def begin(self):
+        return Transaction(self)
+
+    # Function: Merge
+    # Inputs: Self, py2neo Relationship, only LIKES is supported
+    # Output: None
+    def merge(self, rel):
+        self.round_trip()
+        with self.lock:
+            postid = rel.end_node["postid"]
+            likes = self.likes.setdefault(postid, {})
+            likes.setdefault(rel.start_node["username"], rel["timestamp"])
+
+    # Function: Find Node
+    # Inputs: Self, label, property filters
+    # Output: dict of the node's properties, None if there isnt one
+    def find_node(self, label, props):
+        with self.lock:
+            if label == "User":
+                user = self.users.get(props.get("username"))
+                return dict(user) if user else None
+            if label == "Post":
+                post = self.posts.get(props.get("postid"))
+                return dict(post["post"]) if post else None
+            if label == "Movie":
+                movie = self.movies.get(props.get("movieID"))
+                return dict(movie) if movie else None
+        return None
+
+    # Function: Seed
+    # Inputs: Self, data folder
+    # Output: Self
+    # Process: loads the csv exports the loader would put in Neo4j
+    def seed(self, data_dir):
+        def path(name):
+            return os.path.join(data_dir, name)
+        for r in read_csv(path("users.csv")):
+            self._add_user(to_int(r["userID"]), r["username"], r["password"])
+        for r in read_csv(path("genresinfo.csv")):
+            self.genres[to_int(r["GenreId"])] = r["Name"]
+        movie_ids = set()
+        for r in read_csv(path("ratings.csv")):
+            user, movie = to_int(r["userId"]), to_int(r["movieId"])
+            self._rate(user, movie, float(r["rating"]))
+            movie_ids.add(movie)
+        for r in read_csv(path("genres.csv")):
+            movie = to_int(r["movieId"])
+            self.movie_genres.setdefault(movie, []).append(to_int(r["code"]))
+            movie_ids.add(movie)
+        for r in read_csv(path("movie_keys.csv")):
+            movie = to_int(r["movieId"])
+            self.keywords.setdefault(movie, []).append(r["keywords"])
+            movie_ids.add(movie)
+        for r in read_csv(path("movie_sim.csv")):
+            movie, other = to_int(r["MovieId"]), to_int(r["SimMovieId"])
+            self.similar.setdefault(movie, []).append((other, float(r.get("Score") or 0)))
+            movie_ids.update((movie, other))
+        for films in self.similar.values():
+            films.sort(key=lambda f: -f[1])
+        info = {to_int(r["movieId"]): r for r in read_csv(path("movieinfo.csv"))}
+        for movie in movie_ids | set(info):
+            r = info.get(movie, {})
+            self.movies[movie] = {
+                "movieID": movie, "title": r.get("title") or "Movie %d" % movie,
+                "poster": r.get("poster") or "", "year": r.get("year"),
+                "overview": r.get("overview") or "", "ytlink": r.get("ytlink") or "",
+                "featcrew": r.get("featcrew") or "-", "budget": r.get("budget"),
+                "revenue": r.get("revenue"), "runtime": r.get("runtime"),
+                "lang": r.get("lang"), "avgrating": r.get("rating")}
+        self._seed_posts(path("reviews.csv"), path("tags.csv"))
+        return self
+
+    # Function: Seed Posts
+    # Inputs: Self, reviews csv path, tags csv path
+    # Output: None
+    def _seed_posts(self, reviews_path, tags_path):
+        by_id = {u["userid"]: u["username"] for u in self.users.values()}
+        tags = {}
+        owners = {}
+        for r in read_csv(tags_path):
+            if r.get("id"):
+                tags.setdefault(r["id"], []).append(r["tag"])
+                owners[r["id"]] = (to_int(r["userId"]), to_int(r["movieId"]))
+        reviews = read_csv(reviews_path)
+        if not reviews:
+            rng = random.Random(self.random_seed)
+            now = int(time.time())
+            for postid, (user, movie) in sorted(owners.items()):
+                timestamp = now - rng.randint(0, 30 * 86400)
+                reviews.append({"id": postid, "userId": user, "movieId": movie,
+                                "title": "Review", "text": "",
+                                "rating": self.rated.get((user, movie), 3),
+                                "timestamp": timestamp})
+        for r in reviews:
+            user, movie = to_int(r["userId"]), to_int(r["movieId"])
+            if user not in by_id or movie not in self.movies:
+                continue
+            timestamp = to_int(r["timestamp"])
+            self.posts[r["id"]] = {
+                "username": by_id[user], "tags": sorted(set(tags.get(r["id"], []))),
+                "post": {"postid": r["id"], "title": r["title"], "rating": to_int(r["rating"]),
+                         "text": r["text"], "movid": movie, "timestamp": timestamp,
+                         "date": datetime.fromtimestamp(timestamp).strftime("%F")}}
+
+    # Function: Add User
+    # Inputs: Self, userid, username, password hash
+    # Output: None
+    def _add_user(self, userid, username, password):
+        self.users[username] = {"userid": userid, "username": username, "password": password}
+        self.user_names[userid] = username
+
+    # Function: Rate
+    # Inputs: Self, userid, movie id, rating
+    # Output: None
+    def _rate(self, user, movie, rating):
+        if (user, movie) not in self.rated:
+            self.user_rated.setdefault(user, []).append(movie)
+        self.rated[(user, movie)] = rating
+
+    # Function: Card
+    # Inputs: Self, movie id
+    # Output: {title, movieID, poster}
+    def _card(self, movie):
+        film = self.movies[movie]
+        return {"title": film["title"], "movieID": movie, "poster": film["poster"]}
+
+    # Function: Post Row
+    # Inputs: Self, post record
+    # Output: row as the app's post queries return it
+    def _post_row(self, post):
+        return {"username": post["username"], "post": dict(post["post"]),
+                "tags": list(post["tags"]),
+                "movTitle": self.movies[post["post"]["movid"]]["title"]}
+
+    # Function: Latest Posts
+    # Inputs: Self, optional filter on the post record
+    # Output: list of post records, newest first
+    def _latest(self, keep=None):
+        posts = [p for p in self.posts.values() if keep is None or keep(p)]
+        posts.sort(key=lambda p: -p["post"]["timestamp"])
+        return posts
+
+    # The handlers: each takes the squashed query and its parameters and
+    # returns a list of row dicts, called with the store locked
+
+    def _nothing(self, text, params):
+        return []
+
+    def _migrations(self, text, params):
+        return [{"version": v} for v in sorted(self.migrations)]
+
+    def _record_migration(self, text, params):
+        self.migrations.setdefault(params["version"], params["name"])
+        return []
+
+    def _ensure_sequence(self, text, params):
+        start = max([u["userid"] for u in self.users.values()] or [0]) + 1
+        self.sequences[params["name"]] = max(self.sequences.get(params["name"], 0), start)
+        return []
+
+    def _fast_forward(self, text, params):
+        if "User" in self.sequences:
+            self._ensure_sequence(text, {"name": "User"})
+        return []
+
+    def _reserve_ids(self, text, params):
+        first = self.sequences[params["name"]]
+        self.sequences[params["name"]] = first + params["size"]
+        return [{"first": first}]
+
+    def _top_rated(self, text, params):
+        scores = {}
+        for post in self.posts.values():
+            movie = post["post"]["movid"]
+            scores[movie] = scores.get(movie, 0) + (post["post"]["rating"] or 0)
+        return [dict(self._card(m), score=s) for m, s in scores.items()]
+
+    def _recent_posts(self, text, params):
+        return [dict(self._post_row(p), likes=list(self.likes.get(p["post"]["postid"], {})))
+                for p in self._latest()[:params["n"]]]
+
+    def _reviews_since(self, text, params):
+        return [{"movieID": p["post"]["movid"], "timestamp": p["post"]["timestamp"],
+                 "rating": p["post"]["rating"]}
+                for p in self.posts.values() if p["post"]["timestamp"] > params["since"]]
+
+    def _likes_since(self, text, params):
+        return [{"movieID": self.posts[postid]["post"]["movid"], "timestamp": ts}
+                for postid, fans in self.likes.items() for ts in fans.values()
+                if ts > params["since"]]
+
+    def _movie_genre_names(self, text, params):
+        return [{"movieID": m, "genre": self.genres[g]}
+                for m, genres in self.movie_genres.items() for g in genres if g in self.genres]
+
+    def _ratings(self, text, params):
+        return [{"userid": u, "movieID": m, "rating": r} for (u, m), r in self.rated.items()]
+
+    def _count(self, text, params):
+        label = re.search(r"MATCH \(n:(\w+)\)", text).group(1)
+        ids = ([u["userid"] for u in self.users.values()] if label == "User"
+               else list(self.movies))
+        return [{"count": len(ids), "top": max(ids) if ids else None, "total": sum(ids)}]
+
+    def _search_films(self, text, params):
+        return [{"title": self.movies[m]["title"], "year": self.movies[m]["year"],
+                 "text": self.movies[m]["overview"], "movieID": m}
+                for m in params["movie_ids"] if m in self.movies]
+
+    def _search_movies(self, text, params):
+        return [{"movieID": m, "title": f["title"], "year": f["year"]}
+                for m, f in self.movies.items()]
+
+    def _search_users(self, text, params):
+        return [{"username": u["username"], "userid": u["userid"]} for u in self.users.values()]
+
+    def _user_tags(self, text, params):
+        tags = {}
+        for post in self.posts.values():
+            tags.setdefault(post["username"], set()).update(post["tags"])
+        return [{"username": u, "tags": sorted(t)} for u, t in tags.items() if t]
+
+    def _user_movies(self, text, params):
+        movies = {}
+        for (user, movie) in self.rated:
+            if user in self.user_names:
+                movies.setdefault(self.user_names[user], []).append(movie)
+        return [{"username": u, "movies": m} for u, m in movies.items()]
+
+    def _export_movies(self, text, params):
+        return [dict(f) for f in self.movies.values()]
+
+    def _export_genres(self, text, params):
+        return [{"genreId": g, "name": n} for g, n in self.genres.items()]
+
+    def _export_users(self, text, params):
+        return [{"userid": u["userid"]} for u in self.users.values()]
+
+    def _export_similar(self, text, params):
+        return [{"movieID": m, "simID": o, "score": s}
+                for m, films in self.similar.items() for o, s in films]
+
+    def _export_keywords(self, text, params):
+        return [{"movieID": m, "tag": t} for m, tags in self.keywords.items() for t in tags]
+
+    def _export_has_genre(self, text, params):
+        return [{"movieID": m, "genreId": g} for m, genres in self.movie_genres.items()
+                for g in genres]
+
+    def _movie_detail(self, text, params):
+        movie = params["mov_id"]
+        if movie not in self.movies:
+            return []
+        posts = self._latest(lambda p: p["post"]["movid"] == movie)[:params["posts"]]
+        return [{"movie": dict(self.movies[movie]),
+                 "genres": [self.genres[g] for g in self.movie_genres.get(movie, [])
+                            if g in self.genres],
+                 "keywords": list(self.keywords.get(movie, [])),
+                 "similar": [self._card(m) for m, _ in self.similar.get(movie, [])[:10]],
+                 "posts": [{"username": p["username"], "post": dict(p["post"]),
+                            "tags": list(p["tags"])} for p in posts]}]
+
+    def _write_posts(self, text, params):
+        rows = []
+        for row in params["posts"]:
+            user = self.users.get(row["username"])
+            if user is None or row["movid"] not in self.movies:
+                continue
+            previous = self.rated.get((user["userid"], row["movid"]))
+            self.posts[row["postid"]] = {
+                "username": row["username"], "tags": list(row["tags"]),
+                "post": {k: row[k] for k in ("postid", "title", "rating", "text", "movid",
+                                             "timestamp", "date")}}
+            self._rate(user["userid"], row["movid"], float(row["rating"]))
+            film = self.movies[row["movid"]]
+            rows.append({"postid": row["postid"], "userid": user["userid"],
+                         "movTitle": film["title"], "poster": film["poster"],
+                         "previous": previous})
+        return rows
+
+    def _user_id(self, text, params):
+        user = self.users.get(params["username"])
+        return [{"userid": user["userid"]}] if user else []
+
+    def _password(self, text, params):
+        user = self.users.get(params["username"])
+        return [{"password": user["password"]}] if user else []
+
+    def _register(self, text, params):
+        if params["username"] in self.users:
+            return [{"created": self.users[params["username"]]["userid"] == params["userid"]}]
+        self._add_user(params["userid"], params["username"], params["password"])
+        return [{"created": True}]
+
+    def _rehash(self, text, params):
+        user = self.users.get(params["username"])
+        if user and user["password"] == params["old"]:
+            user["password"] = params["new"]
+        return []
+
+    def _feed_page(self, text, params):
+        if "{username: {key}}" in text:
+            keep = lambda p: p["username"] == params["key"]
+        elif "{movieID: {key}}" in text:
+            keep = lambda p: p["post"]["movid"] == params["key"]
+        else:
+            keep = None
+        after = (params["timestamp"], params["postid"])
+        posts = [p for p in self._latest(keep)
+                 if (p["post"]["timestamp"], p["post"]["postid"]) < after]
+        if keep is None:
+            # posts without their author or film are still Post nodes
+            posts += [{"post": p} for p in self.loose_posts.values()
+                      if (p.get("timestamp") or 0, p["postid"]) < after]
+        posts.sort(key=lambda p: (p["post"].get("timestamp") or 0, p["post"]["postid"]),
+                   reverse=True)
+        return [dict(self._post_row(p), likes=len(self.likes.get(p["post"]["postid"], {})),
+                     complete=True) if "username" in p else
+                {"username": None, "post": dict(p["post"]), "tags": [], "movTitle": None,
+                 "likes": 0, "complete": False}
+                for p in posts[:params["n"]]]
+
+    def _like(self, text, params):
+        rows = []
+        for row in params["likes"]:
+            post = self.posts.get(row["postid"])
+            if row["username"] not in self.users or post is None:
+                continue
+            fans = self.likes.setdefault(row["postid"], {})
+            created = row["username"] not in fans
+            fans.setdefault(row["username"], row["timestamp"])
+            rows.append({"username": row["username"], "postid": row["postid"],
+                         "movid": post["post"]["movid"], "created": created,
+                         "likes": len(fans)})
+        return rows
+
+    def _liked(self, text, params):
+        return [{"postid": p, "liked": params["username"] in self.likes.get(p, {})}
+                for p in params["postids"] if p in self.posts]
+
+    def _unlike(self, text, params):
+        rows = []
+        for row in params["unlikes"]:
+            fans = self.likes.get(row["postid"], {})
+            if fans.pop(row["username"], None) is not None:
+                rows.append({"username": row["username"], "postid": row["postid"],
+                             "movid": self.posts[row["postid"]]["post"]["movid"],
+                             "likes": len(fans)})
+        return rows
+
+    def _recommend_recent(self, text, params):
+        user = params["user_id"]
+        username = self.user_names.get(user)
+        reviewed = {p["post"]["movid"] for p in self.posts.values()
+                    if p["username"] == username and p["post"]["timestamp"] > params["timestamp"]}
+        if not reviewed:
+            return []
+        films = []
+        for movie in self.user_rated.get(user, []):
+            for other, _ in self.similar.get(movie, []):
+                if other not in reviewed:
+                    films.append(self._card(other))
+                    if len(films) == 10:
+                        return films
+        return films
+
+    def _browse_films(self, text, params):
+        counts, sums, latest = {}, {}, {}
+        for (_, movie), rating in self.rated.items():
+            counts[movie] = counts.get(movie, 0) + 1
+            sums[movie] = sums.get(movie, 0.0) + rating
+        for p in self.posts.values():
+            movie = p["post"]["movid"]
+            latest[movie] = max(latest.get(movie, 0), p["post"]["timestamp"])
+        rows = []
+        for movie, film in self.movies.items():
+            average = film.get("avgrating")
+            if movie in counts:
+                average = sums[movie] / counts[movie]
+            rows.append({"movieID": movie, "year": film.get("year"),
+                         "avgrating": float(average) if average not in (None, "") else None,
+                         "reviews": counts.get(movie, 0), "latest": latest.get(movie)})
+        return rows
+
+    def _load_users(self, text, params):
+        for row in params["rows"]:
+            old = self.user_names.get(row["userid"])
+            if old is not None and old != row["username"]:
+                del self.users[old]
+            self._add_user(row["userid"], row["username"], row["password"])
+        return []
+
+    def _load_movies(self, text, params):
+        for row in params["rows"]:
+            film = self.movies.setdefault(row["movieID"], {
+                "movieID": row["movieID"], "title": "Movie %d" % row["movieID"], "poster": ""})
+            film.update(row["props"])
+        return []
+
+    def _load_genres(self, text, params):
+        for row in params["rows"]:
+            self.genres[row["genreId"]] = row["name"]
+        return []
+
+    def _load_has_genre(self, text, params):
+        for row in params["rows"]:
+            if row["movieId"] in self.movies and row["code"] in self.genres:
+                genres = self.movie_genres.setdefault(row["movieId"], [])
+                if row["code"] not in genres:
+                    genres.append(row["code"])
+        return []
+
+    def _load_posts(self, text, params):
+        for row in params["rows"]:
+            username = self.user_names.get(row["userId"])
+            post = dict(self.posts.get(row["postid"], {}).get("post") or
+                        self.loose_posts.get(row["postid"], {}), postid=row["postid"])
+            post.setdefault("like_count", 0)
+            post.update(row["props"])
+            if username is None or row["movieId"] not in self.movies:
+                self.loose_posts[row["postid"]] = post
+                continue
+            self.loose_posts.pop(row["postid"], None)
+            tags = self.posts.get(row["postid"], {}).get("tags", [])
+            self.posts[row["postid"]] = {"username": username, "tags": tags, "post": post}
+        return []
+
+    def _load_tags(self, text, params):
+        for row in params["rows"]:
+            post = self.posts.get(row["postid"])
+            if post is not None and row["tag"] not in post["tags"]:
+                post["tags"] = sorted(post["tags"] + [row["tag"]])
+        return []
+
+    def _load_keywords(self, text, params):
+        for row in params["rows"]:
+            if row["movieId"] in self.movies:
+                keywords = self.keywords.setdefault(row["movieId"], [])
+                if row["keyword"] not in keywords:
+                    keywords.append(row["keyword"])
+        return []
+
+    def _load_ratings(self, text, params):
+        for row in params["rows"]:
+            if row["userId"] in self.user_names and row["movieId"] in self.movies:
+                self._rate(row["userId"], row["movieId"], row["rating"])
+        return []
+
+    def _load_similar(self, text, params):
+        for row in params["rows"]:
+            movie, other = row["movieId"], row["simMovieId"]
+            if movie in self.movies and other in self.movies:
+                films = [f for f in self.similar.get(movie, []) if f[0] != other]
+                films.append((other, row["score"] or 0.0))
+                films.sort(key=lambda f: -f[1])
+                self.similar[movie] = films
+        return []
+
+    def _delete_similar(self, text, params):
+        for movie in params["ids"]:
+            self.similar.pop(movie, None)
+        return []
+
+    def _film_cards(self, text, params):
+        return [self._card(m) for m in params["movie_ids"] if m in self.movies]
+
+
+# Function: Install
+# Inputs: StandInGraph
+# Output: None
+# Process: the app builds its graph and matcher on import, so this has to
+# run before social is first imported. Also keeps the run self contained
+def install(store):
+    import py2neo
+    py2neo.Graph = lambda *a, **k: store
+    py2neo.NodeMatcher = StandInMatcher
+    os.environ["RECFLIX_SEARCH_SNAPSHOT"] = ""
+    os.environ["RECFLIX_AUTH_WORKERS"] = "0"
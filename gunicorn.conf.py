@@ -0,0 +1,20 @@
+import os
+
+# Gunicorn settings for the web process: gunicorn -c gunicorn.conf.py wsgi:app
+bind = "0.0.0.0:%s" % os.environ.get("PORT", "5000")
+# a worker process per core, each serving requests on a few threads
+workers = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+# the app sizes its per worker pools (password hashing) by this
+os.environ["WEB_CONCURRENCY"] = str(workers)
+threads = int(os.environ.get("RECFLIX_WEB_THREADS", 4))
+# load the app in the master before forking so the workers share its models
+preload_app = True
+
+
+# Function: Post Fork
+# Inputs: gunicorn arbiter, worker
+# Output: None
+# Process: runs in each worker before it starts its threads
+def post_fork(server, worker):
+    from social import forked
+    forked()
@@ -0,0 +1,7 @@
+# Offline data jobs that build and load the files in Data/.
+# Kept outside the social package so running them doesn't start the web app.
+import os
+
+# root of the repository and the folder holding the csv exports
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.environ.get("RECFLIX_DATA_DIR", os.path.join(BASE_DIR, "Data"))
@@ -0,0 +1,511 @@
+# Import libraries
+import argparse
+import hashlib
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from . import BASE_DIR, DATA_DIR
+
+# ETL pipeline building the csv exports in Data/ from a MovieLens dump.
+# Replaces the Data Processing notebooks (Reviews Cleaning, User_Movie_Rating,
+# Tags Cleaning, TdB Scraper's clean up, Genre Cleaning and Movie_Keywords).
+#  - each stage reads its inputs and writes a Parquet file to the work folder,
+#    which later stages read, plus the csv the loader consumes
+#  - transforms are whole column pandas/NumPy operations, no per row loops
+#  - the ratings and tags files are streamed in chunks so memory stays flat
+#    for the larger MovieLens dumps (ml-25m)
+#  - the sha256 of every input and output is kept in a manifest, a stage
+#    whose inputs, settings and outputs are unchanged is skipped
+#  - review ids are derived from (userId, movieId), so rebuilding gives the
+#    same ids and tags find their review without a join
+# users.csv (generated usernames and passwords) still comes from its notebook.
+#
+# Usage: python -m pipeline.etl [--source "Data Processing/ml-latest-small"]
+#        [--tmdb Data/tmdb.jsonl] [--stage movies] [--force]
+
+SOURCE_DIR = os.path.join(BASE_DIR, "Data Processing", "ml-latest-small")
+WORK_DIR = os.path.join(DATA_DIR, "parquet")
+# written by pipeline.tmdb
+TMDB_PATH = os.path.join(DATA_DIR, "tmdb.jsonl")
+
+# bump when a stage's output changes for the same inputs
+VERSION = 1
+
+# columns of movieinfo.csv in the order the notebooks wrote them
+MOVIE_COLUMNS = ["movieId", "title", "genres", "overview", "ytlink", "poster", "featcrew",
+                 "budget", "revenue", "runtime", "lang", "keywords", "year", "rating"]
+
+# columns of the TdB Scraper's pipe separated output
+TMDB_COLUMNS = ["movieId", "overview", "ytlink", "poster", "featcrew", "budget", "revenue",
+                "runtime", "lang", "keywords"]
+
+HEX = np.array(list("0123456789abcdef"))
+
+
+# Stage: named build step, its input and output paths are templates filled
+# from the run's folders ({source}, {work}, {out}, {tmdb}). Inputs marked
+# optional may be missing, the rest must exist for the stage to run.
+class Stage:
+    def __init__(self, name, inputs, outputs, build, optional=()):
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.build = build
+        self.optional = optional
+
+    # Function: Paths
+    # Inputs: Self, dict of templates, dict of folders
+    # Output: dict of name -> path, None where the folder isnt set
+    def paths(self, templates, folders):
+        paths = {}
+        for name, template in templates.items():
+            try:
+                paths[name] = template.format(**folders)
+            except KeyError:
+                paths[name] = None
+        return paths
+
+
+# Function: File Hash
+# Inputs: path
+# Output: hex sha256 of the file's contents, None if it doesnt exist
+# Process: reads a megabyte at a time
+def file_hash(path):
+    if not path or not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Manifest: the hashes each stage last ran with, saved as json after every
+# stage
+class Manifest:
+    def __init__(self, path):
+        self.path = path
+        self.stages = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.stages = json.load(f)
+
+    # Function: Fresh
+    # Inputs: Self, stage name, record of the run about to happen
+    # Output: True if the last run had the same inputs and settings and its
+    # outputs are still as it left them
+    def fresh(self, name, record, outputs):
+        last = self.stages.get(name)
+        if not last or {k: last.get(k) for k in record} != record:
+            return False
+        return all(file_hash(path) == last["outputs"].get(key) for key, path in outputs.items())
+
+    def save(self, name, record):
+        self.stages[name] = record
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.stages, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+# Function: Temp Path
+# Inputs: path about to be written
+# Output: path beside it to write to first, so a failed stage never leaves
+# a half written output behind
+def temp_path(path):
+    return path + ".part"
+
+
+# Function: Mix
+# Inputs: uint64 array, seed
+# Output: uint64 array of well mixed bits (splitmix64 finaliser)
+def mix(x, seed):
+    with np.errstate(over="ignore"):
+        z = x + np.uint64(seed) * np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+# Function: Review Keys
+# Inputs: arrays of user ids and movie ids
+# Output: uint64 array packing each (user, movie) pair
+def review_keys(users, movies):
+    return (np.asarray(users).astype(np.uint64) << np.uint64(32)) | \
+        np.asarray(movies).astype(np.uint64)
+
+
+# Function: Review IDs
+# Inputs: arrays of user ids and movie ids
+# Output: array of uuid strings, the same pair always gets the same id
+# Process: 128 hashed bits per pair with the uuid version (8, custom) and
+# variant bits set, turned into hex digits with array lookups
+def review_ids(users, movies):
+    keys = review_keys(users, movies)
+    high = (mix(keys, 1) & np.uint64(0xFFFFFFFFFFFF0FFF)) | np.uint64(0x8000)
+    low = (mix(keys, 2) & np.uint64(0x3FFFFFFFFFFFFFFF)) | np.uint64(0x8000000000000000)
+    octets = np.stack([high, low], axis=1).astype(">u8").view(np.uint8).reshape(-1, 16)
+    digits = HEX[np.stack([octets >> 4, octets & 15], axis=2).reshape(-1, 32)]
+    digits = np.insert(digits, [8, 12, 16, 20], "-", axis=1)
+    return np.ascontiguousarray(digits).view("<U36").ravel()
+
+
+# Function: Read Chunks
+# Inputs: csv path, rows per chunk, column dtypes
+# Output: generator of DataFrames
+def read_chunks(path, chunk_size, dtype):
+    return pd.read_csv(path, usecols=list(dtype), dtype=dtype, chunksize=chunk_size)
+
+
+# ChunkWriter: appends DataFrames to a Parquet file and a csv, one row group
+# and one csv block per chunk, then moves both into place on close
+class ChunkWriter:
+    def __init__(self, parquet, csv=None, csv_columns=None):
+        self.parquet = parquet
+        self.csv = csv
+        self.csv_columns = csv_columns
+        self.writer = None
+        self.schema = None
+        self.rows = 0
+        if csv:
+            open(temp_path(csv), "w").close()
+
+    def write(self, frame):
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if self.writer is None:
+            self.schema = table.schema
+            self.writer = pq.ParquetWriter(temp_path(self.parquet), self.schema)
+        self.writer.write_table(table.cast(self.schema))
+        if self.csv:
+            frame.to_csv(temp_path(self.csv), mode="a", index=False, header=self.rows == 0,
+                         columns=self.csv_columns)
+        self.rows += len(frame)
+
+    def close(self, empty):
+        if self.writer is None:
+            self.write(empty)
+        self.writer.close()
+        os.replace(temp_path(self.parquet), self.parquet)
+        if self.csv:
+            os.replace(temp_path(self.csv), self.csv)
+        return self.rows
+
+
+# Function: Write Frame
+# Inputs: DataFrame, parquet path, csv path, csv columns
+# Output: rows written
+def write_frame(frame, parquet, csv=None, csv_columns=None):
+    writer = ChunkWriter(parquet, csv, csv_columns)
+    writer.write(frame)
+    return writer.close(frame)
+
+
+# Function: Reviews Stage
+# Inputs: input paths, output paths, rows per chunk
+# Output: rows written
+# Process: every MovieLens rating becomes a review post with a stable id
+# and its date (UTC) taken from the timestamp
+def build_reviews(inputs, outputs, chunk_size):
+    dtype = {"userId": np.int32, "movieId": np.int32, "rating": np.float32,
+             "timestamp": np.int64}
+    columns = ["id", "title", "rating", "text", "movieId", "timestamp", "date", "userId"]
+    writer = ChunkWriter(outputs["parquet"], outputs["csv"], columns)
+    for chunk in read_chunks(inputs["ratings"], chunk_size, dtype):
+        timestamps = chunk["timestamp"].values
+        writer.write(pd.DataFrame({
+            "id": review_ids(chunk["userId"].values, chunk["movieId"].values),
+            "title": "N/A",
+            "rating": chunk["rating"].values,
+            "text": "Blank",
+            "movieId": chunk["movieId"].values,
+            "timestamp": timestamps,
+            "date": timestamps.astype("datetime64[s]").astype("datetime64[D]").astype(str),
+            "userId": chunk["userId"].values,
+        }, columns=columns))
+    return writer.close(pd.DataFrame({c: [] for c in columns}))
+
+
+# Function: Ratings Stage
+# Inputs: input paths, output paths, rows per chunk
+# Output: rows written
+# Process: the rating, user and film of every review, a row group at a time
+def build_ratings(inputs, outputs, chunk_size):
+    columns = ["rating", "userId", "movieId"]
+    reviews = pq.ParquetFile(inputs["reviews"])
+    writer = ChunkWriter(outputs["parquet"], outputs["csv"], columns)
+    for group in range(reviews.num_row_groups):
+        writer.write(reviews.read_row_group(group, columns=columns).to_pandas())
+    return writer.close(pd.DataFrame({c: [] for c in columns}))
+
+
+# Function: Tags Stage
+# Inputs: input paths, output paths, rows per chunk
+# Output: rows written
+# Process: keeps tags on films the user reviewed, tagged with that review's
+# id. The review keys are checked a row group at a time so the whole ratings
+# file is never in memory
+def build_tags(inputs, outputs, chunk_size):
+    columns = ["userId", "movieId", "tag", "id"]
+    tags = pd.concat(list(read_chunks(inputs["tags"], chunk_size,
+                                      {"userId": np.int32, "movieId": np.int32, "tag": object})),
+                     ignore_index=True)
+    tags = tags[tags["tag"].notna()]
+    keys = review_keys(tags["userId"].values, tags["movieId"].values)
+    reviewed = np.zeros(len(tags), dtype=bool)
+    reviews = pq.ParquetFile(inputs["reviews"])
+    for group in range(reviews.num_row_groups):
+        rows = reviews.read_row_group(group, columns=["userId", "movieId"]).to_pandas()
+        reviewed |= np.isin(keys, review_keys(rows["userId"].values, rows["movieId"].values))
+    tags = tags[reviewed]
+    tags = tags.assign(tag=tags["tag"].astype(str).str.strip(),
+                       id=review_ids(tags["userId"].values, tags["movieId"].values))
+    tags = tags[tags["tag"] != ""][columns]
+    return write_frame(tags, outputs["parquet"], outputs["csv"], columns)
+
+
+# Function: Read TMDb
+# Inputs: path of pipeline.tmdb's json lines or the TdB Scraper's pipe
+# separated output
+# Output: DataFrame of TMDB_COLUMNS, keywords as lists and featcrew as the
+# dict repr the movie pages parse
+def read_tmdb(path):
+    if path.endswith(".jsonl"):
+        return read_tmdb_json(path)
+    tmdb = pd.read_csv(path, sep="|", header=None, names=TMDB_COLUMNS, usecols=range(10),
+                       dtype=str, quoting=3)
+    tmdb["movieId"] = pd.to_numeric(tmdb["movieId"], errors="coerce")
+    tmdb = tmdb.dropna(subset=["movieId"]).drop_duplicates("movieId", keep="last")
+    tmdb["movieId"] = tmdb["movieId"].astype(np.int64)
+    tmdb = tmdb.reset_index(drop=True)
+    # keywords and crew were written as python list reprs, pull out the
+    # quoted strings instead of eval'ing them
+    quoted = r"""(['"])(.*?)\1"""
+    words = tmdb["keywords"].fillna("").str.extractall(quoted)[1].str.strip()
+    words = words[words != ""]
+    tmdb["keywords"] = words.groupby(level=0).agg(list).reindex(tmdb.index)
+    tmdb["keywords"] = [k if isinstance(k, list) else [] for k in tmdb["keywords"]]
+    pairs = tmdb["featcrew"].fillna("").str.extractall(
+        r"""\[\s*(['"])(.*?)\1\s*,\s*(['"])(.*?)\3\s*\]""")
+    name, role = (pairs[i].str.replace("'", "\\'", regex=False) for i in (1, 3))
+    crew = "'" + name + "': '" + role + "'"
+    crew = "{" + crew.groupby(level=0).agg(", ".join) + "}"
+    tmdb["featcrew"] = crew.reindex(tmdb.index).fillna("")
+    # pages missing a fact shift the rest up: a runtime ("1h 21m") found as
+    # the budget, or a language found as the runtime
+    budget, runtime, lang = (tmdb[c].fillna("") for c in ("budget", "runtime", "lang"))
+    shifted = budget.str.contains("h", regex=False)
+    tmdb["lang"] = lang.where(~shifted, runtime)
+    tmdb["runtime"] = runtime.where(~shifted, budget)
+    tmdb["budget"] = budget.where(~shifted, "-")
+    no_runtime = ~tmdb["runtime"].str.contains("h", regex=False)
+    tmdb["lang"] = tmdb["lang"].where(~no_runtime, tmdb["runtime"])
+    tmdb["runtime"] = tmdb["runtime"].where(~no_runtime, "")
+    return tmdb
+
+
+# Function: Read TMDb Json
+# Inputs: path of pipeline.tmdb's json lines
+# Output: DataFrame of TMDB_COLUMNS like read_tmdb
+# Process: the fetcher reads facts by label so nothing needs shifting, films
+# it couldn't find are left out
+def read_tmdb_json(path):
+    tmdb = pd.read_json(path, lines=True, dtype=False)
+    if tmdb.empty:
+        return pd.DataFrame(columns=TMDB_COLUMNS)
+    tmdb = tmdb[tmdb["status"] == 200].drop_duplicates("movieId", keep="last")
+    tmdb["featcrew"] = [repr(dict(crew)) if crew else "" for crew in tmdb["featcrew"]]
+    tmdb["keywords"] = [list(k) if isinstance(k, list) else [] for k in tmdb["keywords"]]
+    tmdb = tmdb.replace("", np.nan)
+    tmdb["movieId"] = tmdb["movieId"].astype(np.int64)
+    return tmdb[TMDB_COLUMNS].reset_index(drop=True)
+
+
+# Function: Mean Ratings
+# Inputs: reviews parquet path
+# Output: Series of mean rating by movie id
+# Process: sums and counts per film with bincount, a row group at a time
+def mean_ratings(path):
+    reviews = pq.ParquetFile(path)
+    sums, counts = np.zeros(0), np.zeros(0)
+    for group in range(reviews.num_row_groups):
+        rows = reviews.read_row_group(group, columns=["movieId", "rating"]).to_pandas()
+        movies = rows["movieId"].values.astype(np.int64)
+        if not len(movies):
+            continue
+        size = max(len(sums), int(movies.max()) + 1)
+        sums = np.bincount(movies, rows["rating"].values.astype(np.float64),
+                           minlength=size) + np.pad(sums, (0, size - len(sums)))
+        counts = np.bincount(movies, minlength=size) + np.pad(counts, (0, size - len(counts)))
+    rated = np.flatnonzero(counts)
+    return pd.Series(sums[rated] / counts[rated], index=rated)
+
+
+# Function: Movies Stage
+# Inputs: input paths, output paths, rows per chunk
+# Output: rows written
+# Process: MovieLens titles and genres joined with the scraped TMDb data
+# and each film's mean rating. The Parquet file keeps genres and keywords
+# as lists, movieinfo.csv has them as list reprs like the notebooks wrote
+def build_movies(inputs, outputs, chunk_size):
+    movies = pd.read_csv(inputs["movies"], dtype={"movieId": np.int64, "title": str,
+                                                   "genres": str})
+    parts = movies["title"].str.extract(r"^(.*?)\s*\((\d{4})\)\s*$")
+    movies["title"] = parts[0].fillna(movies["title"].str.strip())
+    movies["year"] = parts[1].fillna("-")
+    movies["genres"] = [[g.strip("()") for g in s.split("|") if g]
+                        for s in movies["genres"].fillna("")]
+    if inputs.get("tmdb") and os.path.exists(inputs["tmdb"]):
+        movies = movies.merge(read_tmdb(inputs["tmdb"]), on="movieId", how="left")
+    else:
+        for column in TMDB_COLUMNS[1:]:
+            movies[column] = np.nan
+    movies["keywords"] = [k if isinstance(k, list) else [] for k in movies["keywords"]]
+    movies["rating"] = movies["movieId"].map(mean_ratings(inputs["reviews"]))
+    text = [c for c in MOVIE_COLUMNS if c not in ("movieId", "genres", "keywords", "rating")]
+    movies[text] = movies[text].fillna("-").astype(str).replace(r"[\n;]", "", regex=True)
+    movies = movies[MOVIE_COLUMNS]
+    frame = movies.copy()
+    frame["genres"] = [repr(g) for g in movies["genres"]]
+    frame["keywords"] = ["[" + ", ".join(k) + "]" if k else "-" for k in movies["keywords"]]
+    write_frame(movies, outputs["parquet"])
+    tmp = temp_path(outputs["csv"])
+    frame.to_csv(tmp, index=False)
+    os.replace(tmp, outputs["csv"])
+    return len(movies)
+
+
+# Function: Genres Stage
+# Inputs: input paths, output paths, rows per chunk
+# Output: rows written
+# Process: one row per (film, genre). Codes already in genresinfo.csv are
+# kept so a rebuild doesn't renumber the Genre nodes, new genres are
+# numbered after them in order of first appearance
+def build_genres(inputs, outputs, chunk_size):
+    movies = pd.read_parquet(inputs["movies"], columns=["movieId", "genres"])
+    pairs = movies.explode("genres").dropna(subset=["genres"])
+    pairs = pairs[pairs["genres"].astype(str) != ""]
+    codes = {}
+    if os.path.exists(outputs["info"]):
+        info = pd.read_csv(outputs["info"])
+        codes = dict(zip(info["Name"].astype(str), info["GenreId"].astype(int)))
+    for name in pd.unique(pairs["genres"].astype(str)):
+        if name not in codes:
+            codes[name] = max(codes.values(), default=0) + 1
+    genres = pd.DataFrame({"movieId": pairs["movieId"].values,
+                           "code": pairs["genres"].astype(str).map(codes).values})
+    info = pd.DataFrame({"GenreId": list(codes.values()), "Name": list(codes.keys())})
+    info = info.sort_values("GenreId")
+    tmp = temp_path(outputs["info"])
+    info.to_csv(tmp, index=False)
+    os.replace(tmp, outputs["info"])
+    return write_frame(genres, outputs["parquet"], outputs["csv"])
+
+
+# Function: Keywords Stage
+# Inputs: input paths, output paths, rows per chunk
+# Output: rows written
+# Process: one row per (film, keyword), trimmed, blanks and placeholders
+# dropped
+def build_keywords(inputs, outputs, chunk_size):
+    movies = pd.read_parquet(inputs["movies"], columns=["movieId", "keywords"])
+    pairs = movies.explode("keywords").dropna(subset=["keywords"])
+    words = pairs["keywords"].astype(str).str.strip()
+    keep = (words != "") & (words != "-") & ~words.str.contains('"', regex=False)
+    keys = pd.DataFrame({"movieId": pairs["movieId"].values[keep.values],
+                         "keywords": words.values[keep.values]})
+    return write_frame(keys, outputs["parquet"], outputs["csv"])
+
+
+# stages in the order they run, later stages read earlier stages' Parquet
+STAGES = [
+    Stage("reviews", {"ratings": "{source}/ratings.csv"},
+          {"parquet": "{work}/reviews.parquet", "csv": "{out}/reviews.csv"}, build_reviews),
+    Stage("ratings", {"reviews": "{work}/reviews.parquet"},
+          {"parquet": "{work}/ratings.parquet", "csv": "{out}/ratings.csv"}, build_ratings),
+    Stage("tags", {"tags": "{source}/tags.csv", "reviews": "{work}/reviews.parquet"},
+          {"parquet": "{work}/tags.parquet", "csv": "{out}/tags.csv"}, build_tags),
+    Stage("movies", {"movies": "{source}/movies.csv", "tmdb": "{tmdb}",
+                     "reviews": "{work}/reviews.parquet"},
+          {"parquet": "{work}/movies.parquet", "csv": "{out}/movieinfo.csv"}, build_movies,
+          optional=("tmdb",)),
+    Stage("genres", {"movies": "{work}/movies.parquet"},
+          {"parquet": "{work}/genres.parquet", "csv": "{out}/genres.csv",
+           "info": "{out}/genresinfo.csv"}, build_genres),
+    Stage("keywords", {"movies": "{work}/movies.parquet"},
+          {"parquet": "{work}/keywords.parquet", "csv": "{out}/movie_keys.csv"},
+          build_keywords),
+]
+
+
+# Function: Run
+# Inputs: MovieLens folder, TMDb scrape path or None, output folder, work
+# folder, stage names to run (None for all), rows per chunk, True to rerun
+# fresh stages, log function
+# Output: dict of stage name -> (rows written, seconds), None for skipped
+# Process: each stage is skipped if its manifest entry is still fresh or a
+# required input is missing
+def run(source=SOURCE_DIR, tmdb=None, out=DATA_DIR, work=WORK_DIR, stages=None,
+        chunk_size=1000000, force=False, log=print):
+    os.makedirs(work, exist_ok=True)
+    os.makedirs(out, exist_ok=True)
+    folders = {"source": source, "work": work, "out": out}
+    if tmdb:
+        folders["tmdb"] = tmdb
+    manifest = Manifest(os.path.join(work, "manifest.json"))
+    report = {}
+    for stage in STAGES:
+        if stages is not None and stage.name not in stages:
+            continue
+        inputs = stage.paths(stage.inputs, folders)
+        outputs = stage.paths(stage.outputs, folders)
+        missing = [k for k, path in inputs.items()
+                   if k not in stage.optional and not (path and os.path.exists(path))]
+        if missing:
+            log("%-10s skipped, %s not found" % (stage.name, inputs[missing[0]]))
+            report[stage.name] = None
+            continue
+        record = {"version": VERSION, "chunk_size": chunk_size,
+                  "inputs": {k: file_hash(path) for k, path in inputs.items()}}
+        if not force and manifest.fresh(stage.name, record, outputs):
+            log("%-10s unchanged" % stage.name)
+            report[stage.name] = None
+            continue
+        started = time.time()
+        rows = stage.build(inputs, outputs, chunk_size)
+        seconds = time.time() - started
+        record["outputs"] = {k: file_hash(path) for k, path in outputs.items()}
+        manifest.save(stage.name, record)
+        log("%-10s %8d rows in %6.1fs  %8.0f rows/s"
+            % (stage.name, rows, seconds, rows / seconds if seconds else 0))
+        report[stage.name] = (rows, seconds)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the csv exports from a MovieLens dump")
+    parser.add_argument("--source", default=SOURCE_DIR,
+                        help="MovieLens folder with movies.csv, ratings.csv and tags.csv")
+    parser.add_argument("--tmdb", default=TMDB_PATH,
+                        help="TMDb data from pipeline.tmdb, or the old scraper's pipe "
+                             "separated file")
+    parser.add_argument("--out", default=DATA_DIR, help="folder the csv files are written to")
+    parser.add_argument("--work", default=WORK_DIR, help="folder for the Parquet files")
+    parser.add_argument("--stage", action="append", choices=[s.name for s in STAGES],
+                        help="only run this stage, can be repeated")
+    parser.add_argument("--chunk-size", type=int, default=1000000,
+                        help="csv rows processed at a time")
+    parser.add_argument("--force", action="store_true", help="rerun stages even if unchanged")
+    args = parser.parse_args(argv)
+
+    started = time.time()
+    run(args.source, args.tmdb, args.out, args.work, stages=args.stage,
+        chunk_size=args.chunk_size, force=args.force)
+    print("finished in %.1fs" % (time.time() - started))
+
+
+if __name__ == "__main__":
+    main()
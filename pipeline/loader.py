@@ -0,0 +1,316 @@
+# Import libraries
+import argparse
+import csv
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from . import DATA_DIR
+
+# Bulk loader for the csv exports in Data/.
+# Replaces pasting the LOAD CSV statements from Neo4j_Load_Commands.txt.
+#  - each csv is streamed in chunks and sent as one parameterised UNWIND
+#    statement per chunk, each in its own explicit transaction
+#  - node stages with no dependencies on each other run in parallel
+#  - every statement MERGEs on an indexed key, so replaying a chunk is safe,
+#    and progress is checkpointed after each commit so a failed load resumes.
+#    A stage only resumes while its csv is unchanged, and the checkpoint is
+#    removed once the load finishes, so the next load starts from the top
+#  - rows per second are reported for each stage
+# The graph only needs run(query), evaluate(query) and begin() ->
+# tx.run/commit/rollback, so any stand-in store with that interface can be
+# passed to load().
+# Constraints and indexes come from the app's migrations (social/schema.py),
+# applied before the first stage so every MERGE key is indexed.
+#
+# Usage: python -m pipeline.loader [--data Data] [--stage ratings] [--restart]
+
+
+# Function: To Int
+# Inputs: csv value
+# Output: int or None
+# Process: accepts "4", "4.0" and blanks
+def to_int(value):
+    if value is None or value == "":
+        return None
+    return int(float(value))
+
+
+# Function: To Float
+# Inputs: csv value
+# Output: float or None
+def to_float(value):
+    if value is None or value == "":
+        return None
+    return float(value)
+
+
+# Stage: one csv file and the UNWIND statement that loads a chunk of it.
+# row turns a csv row into the parameter map, returning None skips the row.
+class Stage:
+    def __init__(self, name, filename, query, row):
+        self.name = name
+        self.filename = filename
+        self.query = query
+        self.row = row
+
+
+# moves the app's user id sequence (social/ids.py, created by the
+# migrations) past the loaded ids so signups after a load don't reuse them
+SEQUENCE = """
+    MATCH (s:Sequence {name: "User"})
+    OPTIONAL MATCH (n:User)
+    WITH s, COALESCE(MAX(n.userid), 0) + 1 AS start
+    SET s.next = CASE WHEN start > s.next THEN start ELSE s.next END
+    """
+
+USERS = Stage("users", "users.csv", """
+    UNWIND {rows} AS row
+    MERGE (u:User {userid: row.userid})
+    SET u.username = row.username, u.password = row.password
+    """, lambda r: {"userid": to_int(r["userID"]), "username": r["username"],
+                    "password": r["password"]})
+
+MOVIES = Stage("movies", "movieinfo.csv", """
+    UNWIND {rows} AS row
+    MERGE (m:Movie {movieID: row.movieID})
+    SET m += row.props
+    """, lambda r: {"movieID": to_int(r["movieId"]), "props": {
+        "title": r.get("title"), "overview": r.get("overview"),
+        "ytlink": r.get("ytlink"), "poster": r.get("poster"),
+        "featcrew": r.get("featcrew"), "budget": r.get("budget"),
+        "revenue": r.get("revenue"), "runtime": r.get("runtime"),
+        "lang": r.get("lang"), "year": r.get("year"),
+        "avgrating": to_float(r.get("rating"))}})
+
+GENRES = Stage("genres", "genresinfo.csv", """
+    UNWIND {rows} AS row
+    MERGE (g:Genre {genreId: row.genreId})
+    SET g.name = row.name
+    """, lambda r: {"genreId": to_int(r["GenreId"]), "name": r["Name"]})
+
+HAS_GENRE = Stage("has_genre", "genres.csv", """
+    UNWIND {rows} AS row
+    MATCH (m:Movie {movieID: row.movieId})
+    MATCH (g:Genre {genreId: row.code})
+    MERGE (m)-[:HAS_GENRE]->(g)
+    """, lambda r: {"movieId": to_int(r["movieId"]), "code": to_int(r["code"])})
+
+POSTS = Stage("posts", "reviews.csv", """
+    UNWIND {rows} AS row
+    MERGE (p:Post {postid: row.postid})
+    ON CREATE SET p.like_count = 0
+    SET p += row.props
+    WITH p, row
+    MATCH (m:Movie {movieID: row.movieId})
+    MATCH (u:User {userid: row.userId})
+    MERGE (u)-[:PUBLISHED]->(p)
+    MERGE (p)-[:REVIEWED]->(m)
+    """, lambda r: {"postid": r["id"], "movieId": to_int(r["movieId"]),
+                    "userId": to_int(r["userId"]), "props": {
+                        "title": r["title"], "rating": to_int(r["rating"]),
+                        "text": r["text"], "movid": to_int(r["movieId"]),
+                        "timestamp": to_int(r["timestamp"]), "date": r["date"]}})
+
+TAGS = Stage("tags", "tags.csv", """
+    UNWIND {rows} AS row
+    MATCH (p:Post {postid: row.postid})
+    MERGE (t:Tag {name: row.tag})
+    MERGE (t)-[:TAGGED]->(p)
+    """, lambda r: {"postid": r["id"], "tag": r["tag"]} if r.get("id") else None)
+
+KEYWORDS = Stage("keywords", "movie_keys.csv", """
+    UNWIND {rows} AS row
+    MATCH (m:Movie {movieID: row.movieId})
+    MERGE (t:Tag {name: row.keyword})
+    MERGE (t)-[:KEYWORD]->(m)
+    """, lambda r: {"movieId": to_int(r["movieId"]), "keyword": r["keywords"]})
+
+RATINGS = Stage("ratings", "ratings.csv", """
+    UNWIND {rows} AS row
+    MATCH (u:User {userid: row.userId})
+    MATCH (m:Movie {movieID: row.movieId})
+    MERGE (u)-[r:RATED]->(m)
+    SET r.rating = row.rating
+    """, lambda r: {"userId": to_int(r["userId"]), "movieId": to_int(r["movieId"]),
+                    "rating": to_float(r["rating"])})
+
+SIMILAR = Stage("similar", "movie_sim.csv", """
+    UNWIND {rows} AS row
+    MATCH (m:Movie {movieID: row.movieId})
+    MATCH (mo:Movie {movieID: row.simMovieId})
+    MERGE (m)-[s:SIMILAR]->(mo)
+    SET s.score = row.score
+    """, lambda r: {"movieId": to_int(r["MovieId"]), "simMovieId": to_int(r["SimMovieId"]),
+                    "score": to_float(r.get("Score"))})
+
+# groups run in order because later ones match on nodes from earlier ones.
+# Node stages only touch their own label so run in parallel, relationship
+# stages lock the nodes at both ends so stay serial to avoid deadlocks
+GROUPS = [
+    (True, [USERS, MOVIES, GENRES]),
+    (False, [HAS_GENRE, KEYWORDS, RATINGS, SIMILAR, POSTS]),
+    (False, [TAGS]),
+]
+
+
+# Function: Fingerprint
+# Inputs: file path
+# Output: [size, modified time in ns], changes whenever the file is rewritten
+def fingerprint(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+# Checkpoint: rows committed so far for each stage and the fingerprint of
+# the csv they were counted in, saved as json after every commit so an
+# interrupted load can skip what is already in the graph
+class Checkpoint:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.done = json.load(f)
+
+    # Function: Get
+    # Inputs: Self, stage name, fingerprint of its csv
+    # Output: rows already committed, 0 if the csv has changed since
+    def get(self, stage, file):
+        entry = self.done.get(stage)
+        if not isinstance(entry, dict) or entry.get("file") != file:
+            return 0
+        return entry["rows"]
+
+    def set(self, stage, file, rows):
+        with self.lock:
+            self.done[stage] = {"rows": rows, "file": file}
+            if not self.path:
+                return
+            # write then rename so a crash never leaves half a file
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.done, f)
+            os.replace(tmp, self.path)
+
+    # Function: Clear
+    # Inputs: Self
+    # Output: None
+    # Process: called once a load has finished
+    def clear(self):
+        with self.lock:
+            self.done = {}
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+
+# Function: Chunks
+# Inputs: csv path, rows per chunk, rows to skip
+# Output: generator of lists of csv rows
+# Process: streams the file so memory stays flat whatever its size
+def chunks(path, size, skip=0):
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        for _ in itertools.islice(reader, skip):
+            pass
+        while True:
+            chunk = list(itertools.islice(reader, size))
+            if not chunk:
+                return
+            yield chunk
+
+
+# Function: Run Stage
+# Inputs: graph, stage, data folder, checkpoint, rows per batch, log function
+# Output: (rows loaded, seconds taken)
+# Process: sends each chunk as one UNWIND in an explicit transaction,
+# rolling back and re-raising on error so the checkpoint stays accurate
+def run_stage(graph, stage, data_dir, checkpoint, batch_size, log=print):
+    path = os.path.join(data_dir, stage.filename)
+    if not os.path.exists(path):
+        log("%-10s skipped, %s not found" % (stage.name, stage.filename))
+        return 0, 0.0
+    file = fingerprint(path)
+    done = checkpoint.get(stage.name, file)
+    if done:
+        log("%-10s resuming after %d rows" % (stage.name, done))
+    started = time.time()
+    loaded = 0
+    for chunk in chunks(path, batch_size, skip=done):
+        rows = [r for r in map(stage.row, chunk) if r is not None]
+        tx = graph.begin()
+        try:
+            tx.run(stage.query, rows=rows)
+            tx.commit()
+        except Exception:
+            tx.rollback()
+            raise
+        done += len(chunk)
+        loaded += len(chunk)
+        checkpoint.set(stage.name, file, done)
+    seconds = time.time() - started
+    log("%-10s %8d rows in %6.1fs  %8.0f rows/s"
+        % (stage.name, loaded, seconds, loaded / seconds if seconds else 0))
+    return loaded, seconds
+
+
+# Function: Load
+# Inputs: graph, data folder, stage names to run (None for all),
+# checkpoint path, rows per batch, worker threads, log function
+# Output: dict of stage name -> (rows loaded, seconds)
+# Process: applies the pending migrations then runs each group of stages, the stages
+# within a group in parallel, then fast forwards the user id sequence and
+# clears the checkpoint
+def load(graph, data_dir=DATA_DIR, stages=None, checkpoint=None,
+         batch_size=5000, workers=3, log=print):
+    from social import schema
+    schema.migrate(graph)
+    progress = Checkpoint(checkpoint)
+    report = {}
+    for parallel, group in GROUPS:
+        todo = [s for s in group if stages is None or s.name in stages]
+        if not todo:
+            continue
+        if not parallel or len(todo) == 1 or workers == 1:
+            for stage in todo:
+                report[stage.name] = run_stage(graph, stage, data_dir, progress, batch_size, log)
+            continue
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {s.name: pool.submit(run_stage, graph, s, data_dir, progress, batch_size, log)
+                       for s in todo}
+            for name, future in futures.items():
+                report[name] = future.result()
+    if "users" in report:
+        graph.run(SEQUENCE)
+    progress.clear()
+    return report
+
+
+def main(argv=None):
+    names = [s.name for _, group in GROUPS for s in group]
+    parser = argparse.ArgumentParser(description="Load the csv exports into Neo4j")
+    parser.add_argument("--data", default=DATA_DIR, help="folder holding the csv files")
+    parser.add_argument("--stage", action="append", choices=names,
+                        help="only run this stage, can be repeated")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--checkpoint", default=os.path.join(DATA_DIR, ".load_checkpoint.json"))
+    parser.add_argument("--restart", action="store_true", help="ignore and clear the checkpoint")
+    parser.add_argument("--uri", default=None, help="Neo4j uri, defaults to py2neo's")
+    args = parser.parse_args(argv)
+
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    from py2neo import Graph
+    graph = Graph(args.uri) if args.uri else Graph()
+    started = time.time()
+    load(graph, args.data, stages=args.stage, checkpoint=args.checkpoint,
+         batch_size=args.batch_size, workers=args.workers)
+    print("finished in %.1fs" % (time.time() - started))
+
+
+if __name__ == "__main__":
+    main()
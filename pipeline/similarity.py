@@ -0,0 +1,215 @@
+# Import libraries
+import argparse
+import csv
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+import numpy as np
+from scipy import sparse
+from . import DATA_DIR
+
+# Batch movie similarity builder.
+# Replaces the per movie get_similar_films loop in Movie_Similarity.ipynb.
+# Keywords and genres become binary TF-IDF matrices (one row per movie),
+# rows are L2 normalised so a sparse product gives cosine similarity, and the
+# product is computed a block of movies at a time across a process pool.
+# As in the old Cypher query a neighbour must share at least one keyword and
+# one genre; pairs are scored by keyword cosine plus weighted genre cosine.
+#
+# Usage: python -m pipeline.similarity [--k 10] [--write-graph]
+
+# matrices and settings score_block reads, set in each worker process by
+# the pool's initializer, or in this process when scoring without a pool
+_shared = {}
+
+
+# Function: Share
+# Inputs: dict of the matrices and settings score_block reads
+# Output: None
+def share(values):
+    _shared.clear()
+    _shared.update(values)
+
+
+# Function: Read Pairs
+# Inputs: csv path, movie id column, value column
+# Output: list of (movie id, cleaned value) pairs
+# Process: streams the csv, strips and lower cases the value
+def read_pairs(path, id_col, value_col):
+    pairs = []
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            value = str(row[value_col]).strip().lower()
+            if not value or value == "-":
+                continue
+            pairs.append((int(float(row[id_col])), value))
+    return pairs
+
+
+# Function: TF-IDF Matrix
+# Inputs: (movie id, term) pairs, movie index
+# Output: L2 normalised sparse csr matrix, movies x terms
+# Process: binary term frequency weighted by smoothed idf
+def tfidf_matrix(pairs, movie_index):
+    terms = {}
+    rows, cols = [], []
+    for movie, term in set(pairs):
+        rows.append(movie_index[movie])
+        cols.append(terms.setdefault(term, len(terms)))
+    data = np.ones(len(rows), dtype=np.float32)
+    matrix = sparse.csr_matrix((data, (rows, cols)),
+                               shape=(len(movie_index), len(terms)))
+    # idf: rarer keywords say more about a film than common ones
+    df = np.bincount(cols, minlength=len(terms))
+    idf = np.log((1.0 + len(movie_index)) / (1.0 + df)) + 1.0
+    matrix = matrix @ sparse.diags(idf.astype(np.float32))
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.csr_matrix(sparse.diags(1.0 / norms) @ matrix, dtype=np.float32)
+
+
+# Function: Score Block
+# Inputs: (start, stop) row range
+# Output: (row indexes, neighbour indexes, scores) for the block
+# Process: cosine of the block against every movie for keywords and genres,
+# keeps pairs sharing both, drops self matches and takes the top k per row
+def score_block(bounds):
+    start, stop = bounds
+    keys, genres = _shared["keys"], _shared["genres"]
+    k, genre_weight = _shared["k"], _shared["genre_weight"]
+    key_sim = (keys[start:stop] @ _shared["keys_t"]).toarray()
+    genre_sim = (genres[start:stop] @ _shared["genres_t"]).toarray()
+    scores = np.where((key_sim > 0) & (genre_sim > 0),
+                      key_sim + genre_weight * genre_sim, 0).astype(np.float32)
+    scores[np.arange(stop - start), np.arange(start, stop)] = 0
+    n = min(k, scores.shape[1])
+    top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    rows = np.repeat(np.arange(start, stop), n)
+    keep = top_scores.ravel() > 0
+    return rows[keep], top.ravel()[keep], top_scores.ravel()[keep]
+
+
+# Function: Build
+# Inputs: keywords csv, genres csv, neighbours per movie, genre weight,
+# rows per block, number of worker processes
+# Output: (every movie id scored, list of (movie id, similar movie id,
+# score), best first per movie)
+# Process: builds both matrices and scores them block by block in parallel.
+# The matrices are handed to the workers through the pool's initializer so
+# it works whether they are forked or spawned
+def build(keys_path, genres_path, k=10, genre_weight=0.5, block=512, processes=None):
+    key_pairs = read_pairs(keys_path, "movieId", "keywords")
+    genre_pairs = read_pairs(genres_path, "movieId", "code")
+    movies = sorted({m for m, _ in key_pairs} | {m for m, _ in genre_pairs})
+    movie_index = {m: i for i, m in enumerate(movies)}
+    keys = tfidf_matrix(key_pairs, movie_index)
+    genres = tfidf_matrix(genre_pairs, movie_index)
+    shared = dict(keys=keys, keys_t=keys.T.tocsc(), genres=genres,
+                  genres_t=genres.T.tocsc(), k=k, genre_weight=genre_weight)
+    bounds = [(s, min(s + block, len(movies))) for s in range(0, len(movies), block)]
+    processes = processes or os.cpu_count() or 1
+    if processes > 1:
+        with multiprocessing.Pool(processes, initializer=share, initargs=(shared,)) as pool:
+            blocks = pool.map(score_block, bounds)
+    else:
+        share(shared)
+        blocks = [score_block(b) for b in bounds]
+        _shared.clear()
+    result = []
+    for rows, cols, scores in blocks:
+        for r, c, s in zip(rows, cols, scores):
+            result.append((movies[r], movies[c], round(float(s), 6)))
+    return movies, result
+
+
+# Function: Write CSV
+# Inputs: similarity rows, output path
+# Output: None
+# Process: writes MovieId,SimMovieId,Score in the format the loader reads
+def write_csv(rows, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["MovieId", "SimMovieId", "Score"])
+        writer.writerows(rows)
+
+
+# Function: Write Graph
+# Inputs: similarity rows, py2neo graph, every movie id scored, rows (and
+# movies) per transaction
+# Output: None
+# Process: replaces each scored movie's SIMILAR edges with its new ones,
+# none for a movie left without neighbours, sending parameterised UNWIND
+# batches in explicit transactions. Batches hold whole movies, so a movie's
+# edges are deleted and written in the same transaction and a later batch
+# never deletes them again
+def write_graph(rows, graph, movies=(), batch=5000):
+    delete = """
+    UNWIND {ids} AS id
+    MATCH (m:Movie {movieID: id})-[s:SIMILAR]->()
+    DELETE s
+    """
+    create = """
+    UNWIND {rows} AS row
+    MATCH (m:Movie {movieID: row.movieId})
+    MATCH (mo:Movie {movieID: row.simMovieId})
+    MERGE (m)-[s:SIMILAR]->(mo)
+    SET s.score = row.score
+    """
+    by_movie = OrderedDict((m, []) for m in movies)
+    for m, sim, score in rows:
+        by_movie.setdefault(m, []).append({"movieId": m, "simMovieId": sim, "score": score})
+
+    # rolls back and re-raises on error like the loader's stages
+    def send(ids, chunk):
+        tx = graph.begin()
+        try:
+            tx.run(delete, ids=ids)
+            tx.run(create, rows=chunk)
+            tx.commit()
+        except Exception:
+            tx.rollback()
+            raise
+
+    ids, chunk = [], []
+    for movie, neighbours in by_movie.items():
+        ids.append(movie)
+        chunk.extend(neighbours)
+        if len(chunk) >= batch or len(ids) >= batch:
+            send(ids, chunk)
+            ids, chunk = [], []
+    if ids:
+        send(ids, chunk)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build scored SIMILAR neighbours for every movie")
+    parser.add_argument("--keys", default=os.path.join(DATA_DIR, "movie_keys.csv"))
+    parser.add_argument("--genres", default=os.path.join(DATA_DIR, "genres.csv"))
+    parser.add_argument("--out", default=os.path.join(DATA_DIR, "movie_sim.csv"))
+    parser.add_argument("--k", type=int, default=10, help="neighbours per movie")
+    parser.add_argument("--genre-weight", type=float, default=0.5)
+    parser.add_argument("--block", type=int, default=512, help="movies scored per block")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--write-graph", action="store_true",
+                        help="also write the SIMILAR edges to Neo4j")
+    args = parser.parse_args(argv)
+
+    started = time.time()
+    movies, rows = build(args.keys, args.genres, k=args.k, genre_weight=args.genre_weight,
+                 block=args.block, processes=args.processes)
+    write_csv(rows, args.out)
+    print("wrote %d neighbours to %s in %.1fs" % (len(rows), args.out, time.time() - started))
+    if args.write_graph:
+        from py2neo import Graph
+        started = time.time()
+        write_graph(rows, Graph(), movies)
+        print("wrote SIMILAR edges in %.1fs" % (time.time() - started))
+
+
+if __name__ == "__main__":
+    main()
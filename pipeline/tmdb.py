@@ -0,0 +1,412 @@
+# Import libraries
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote_plus, urlsplit
+import aiohttp
+from bs4 import BeautifulSoup
+from . import BASE_DIR, DATA_DIR
+
+# TMDb metadata fetcher.
+# Replaces the request loop in TdB Scraper.ipynb, which fetched every film's
+# page one at a time with no retries, cache or resume.
+#  - pages are fetched by a pool of asyncio workers over one aiohttp session,
+#    so connections are kept alive and reused
+#  - each host has its own concurrency limit and request rate
+#  - responses are kept in an on disk cache: bodies are stored under their
+#    sha256 so identical pages are stored once, and an index per url holds
+#    the validators. Entries younger than max age are used as they are,
+#    older ones are revalidated with If-None-Match/If-Modified-Since and a
+#    304 reuses the stored body
+#  - 429s, 5xx and connection errors are retried with backoff, honouring
+#    Retry-After
+#  - html is parsed in a process pool so parsing doesn't hold up the fetches
+#  - each film is appended to a json lines file as soon as it is done, which
+#    is also the checkpoint: a rerun skips films already in it. Only films
+#    TMDb answered with their page (200) or as gone (404) are done, any
+#    other answer fails the film so the next run fetches it again
+# Films without a trailer can have one looked up on YouTube's search page.
+# The base urls are options so a run can point at a local stub server.
+#
+# Usage: python -m pipeline.tmdb [--links links.csv] [--out Data/tmdb.jsonl]
+#        [--youtube] [--restart]
+
+LINKS_CSV = os.path.join(BASE_DIR, "Data Processing", "ml-latest-small", "links.csv")
+OUT_PATH = os.path.join(DATA_DIR, "tmdb.jsonl")
+CACHE_DIR = os.path.join(DATA_DIR, ".http_cache")
+TMDB_URL = "https://www.themoviedb.org"
+YOUTUBE_URL = "https://www.youtube.com"
+
+# statuses worth another try
+RETRY = {429, 500, 502, 503, 504}
+
+WATCH = re.compile(r"/watch\?v=([\w-]{11})")
+
+
+# Function: Parse Movie
+# Inputs: html of a TMDb film page
+# Output: dict of the film's overview, trailer, poster, score, crew, facts
+# and keywords
+# Process: runs in the process pool. Facts are read by their labels rather
+# than position, so a page missing one doesn't shift the rest
+def parse_movie(html):
+    soup = BeautifulSoup(html, "html.parser")
+    overview = soup.find("div", class_="overview")
+    trailer = soup.find("a", class_="play_trailer")
+    poster = soup.find("a", class_="progressive")
+    score = soup.find("div", class_="user_score_chart")
+    crew = []
+    for li in soup.find_all("li", class_="profile"):
+        parts = [p.get_text(" ", strip=True) for p in li.find_all("p")]
+        if len(parts) >= 2:
+            crew.append([parts[0], parts[1]])
+    facts = {}
+    for p in soup.select(".facts p"):
+        label = p.find("strong")
+        if label is not None:
+            name = label.get_text(" ", strip=True).lower()
+            label.extract()
+            facts[name] = p.get_text(" ", strip=True)
+    keywords = [a.get_text(" ", strip=True) for a in soup.select(".keywords li")]
+    return {
+        "overview": " ".join(overview.get_text(" ").split()) if overview else "",
+        "ytlink": ("https://www.youtube.com/watch?v=" + trailer["data-id"]
+                   if trailer is not None and trailer.get("data-id") else ""),
+        "poster": poster.get("href", "") if poster is not None else "",
+        "score": score.get("data-percent", "") if score is not None else "",
+        "featcrew": crew,
+        "budget": facts.get("budget", ""),
+        "revenue": facts.get("revenue", ""),
+        "runtime": facts.get("runtime", ""),
+        "lang": facts.get("original language", ""),
+        "keywords": [k for k in keywords if k],
+    }
+
+
+# Function: Parse Trailer Search
+# Inputs: html of a YouTube search results page
+# Output: watch url of the first result, "" if there isnt one
+def parse_trailer_search(html):
+    match = WATCH.search(html)
+    return "https://www.youtube.com/watch?v=" + match.group(1) if match else ""
+
+
+# HostLimit: at most concurrency requests in flight to a host, started no
+# faster than rate per second
+class HostLimit:
+    def __init__(self, concurrency, rate):
+        self.slots = asyncio.Semaphore(concurrency)
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next = 0.0
+        self.lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        await self.slots.acquire()
+        async with self.lock:
+            now = asyncio.get_running_loop().time()
+            wait = self.next - now
+            self.next = max(now, self.next) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def __aexit__(self, *exc):
+        self.slots.release()
+
+
+# HttpCache: bodies in objects/<sha256>, one index file per url with its
+# status, validators, body hash and when it was fetched
+class HttpCache:
+    def __init__(self, path, max_age=86400):
+        self.path = path
+        self.max_age = max_age
+        os.makedirs(os.path.join(path, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(path, "index"), exist_ok=True)
+
+    def _index_path(self, url):
+        return os.path.join(self.path, "index", hashlib.sha256(url.encode("utf-8")).hexdigest())
+
+    def _object_path(self, digest):
+        return os.path.join(self.path, "objects", digest[:2], digest)
+
+    # Function: Lookup
+    # Inputs: Self, url
+    # Output: (entry dict or None, True if it is fresh enough to use as is)
+    def lookup(self, url):
+        try:
+            with open(self._index_path(url)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None, False
+        if not os.path.exists(self._object_path(entry["body"])):
+            return None, False
+        return entry, time.time() - entry["fetched"] < self.max_age
+
+    # Function: Body
+    # Inputs: Self, entry from lookup
+    # Output: the stored body as text
+    def body(self, entry):
+        with open(self._object_path(entry["body"]), "rb") as f:
+            return f.read().decode("utf-8", "replace")
+
+    # Function: Store
+    # Inputs: Self, url, status, response headers, body bytes
+    # Output: the new entry
+    # Process: the body is written under its hash unless already there, then
+    # the index is replaced so a crash never leaves an entry without a body
+    def store(self, url, status, headers, body):
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_atomic(path, body)
+        entry = {"url": url, "status": status, "body": digest, "fetched": time.time(),
+                 "etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified")}
+        write_atomic(self._index_path(url), json.dumps(entry).encode("utf-8"))
+        return entry
+
+    # Function: Touch
+    # Inputs: Self, url, entry
+    # Output: the entry, marked as fetched now after a 304
+    def touch(self, url, entry):
+        entry = dict(entry, fetched=time.time())
+        write_atomic(self._index_path(url), json.dumps(entry).encode("utf-8"))
+        return entry
+
+
+# Function: Write Atomic
+# Inputs: path, bytes
+# Output: None
+def write_atomic(path, data):
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+# Function: Retry After
+# Inputs: Retry-After header value, default seconds
+# Output: seconds to wait
+def retry_after(value, default):
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class Fetcher:
+    # Function: Constructor Function
+    # Inputs: Self, aiohttp session, HttpCache, requests in flight per host,
+    # requests per second per host, tries per url
+    # Output: None
+    def __init__(self, session, cache, concurrency=8, rate=10.0, tries=4):
+        self.session = session
+        self.cache = cache
+        self.concurrency = concurrency
+        self.rate = rate
+        self.tries = tries
+        self.hosts = {}
+        self.stats = {"requests": 0, "cached": 0, "revalidated": 0, "retries": 0}
+
+    def _limit(self, url):
+        host = urlsplit(url).netloc
+        if host not in self.hosts:
+            self.hosts[host] = HostLimit(self.concurrency, self.rate)
+        return self.hosts[host]
+
+    # Function: Get
+    # Inputs: Self, url
+    # Output: (status, body text), status being 200 or 404
+    # Process: served from the cache while fresh, otherwise fetched with the
+    # cached validators. Raises for any other status, straight away unless
+    # it is worth retrying, and after tries attempts if it is
+    async def get(self, url):
+        entry, fresh = self.cache.lookup(url)
+        if fresh:
+            self.stats["cached"] += 1
+            return entry["status"], self.cache.body(entry)
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        delay = 1.0
+        for attempt in range(self.tries):
+            wait = delay
+            try:
+                async with self._limit(url):
+                    self.stats["requests"] += 1
+                    async with self.session.get(url, headers=headers) as response:
+                        if response.status == 304 and entry is not None:
+                            self.stats["revalidated"] += 1
+                            entry = self.cache.touch(url, entry)
+                            return entry["status"], self.cache.body(entry)
+                        if response.status == 200 or response.status == 404:
+                            body = await response.read()
+                            self.cache.store(url, response.status, response.headers, body)
+                            return response.status, body.decode("utf-8", "replace")
+                        if response.status not in RETRY:
+                            # includes a 304 for a page no longer in the cache
+                            raise IOError("%s answered HTTP %d" % (url, response.status))
+                        wait = retry_after(response.headers.get("Retry-After"), delay)
+                        error = "HTTP %d" % response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = "%s: %s" % (type(e).__name__, e)
+            if attempt + 1 < self.tries:
+                self.stats["retries"] += 1
+                await asyncio.sleep(wait)
+                delay *= 2
+        raise IOError("%s failed after %d tries (%s)" % (url, self.tries, error))
+
+
+# Function: Read Links
+# Inputs: MovieLens links.csv path
+# Output: list of (movieId, tmdbId), films without a TMDb id left out
+def read_links(path):
+    links = []
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            if row.get("tmdbId"):
+                links.append((int(row["movieId"]), int(float(row["tmdbId"]))))
+    return links
+
+
+# Function: Read Done
+# Inputs: output path
+# Output: set of movie ids already written with a 200 or 404
+# Process: a line cut short by a crash is ignored, that film is fetched
+# again, as are films older runs wrote with any other status
+def read_done(path):
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("status") in (200, 404) and "movieId" in record:
+                done.add(record["movieId"])
+    return done
+
+
+# Function: Fetch Movie
+# Inputs: Fetcher, process pool, movie id, TMDb id, TMDb base url, YouTube
+# base url or None to not search for missing trailers
+# Output: dict for the film's output line
+# Process: raises IOError if a page couldnt be fetched, the film isnt written
+async def fetch_movie(fetcher, pool, movie_id, tmdb_id, tmdb_url, youtube_url):
+    loop = asyncio.get_running_loop()
+    status, html = await fetcher.get("%s/movie/%d" % (tmdb_url, tmdb_id))
+    record = {"movieId": movie_id, "tmdbId": tmdb_id, "status": status}
+    if status != 200:
+        return record
+    record.update(await loop.run_in_executor(pool, parse_movie, html))
+    if not record["ytlink"] and youtube_url:
+        title = BeautifulSoup(html, "html.parser").title
+        query = quote_plus("%s trailer" % (title.get_text(strip=True) if title else tmdb_id))
+        status, html = await fetcher.get("%s/results?search_query=%s" % (youtube_url, query))
+        if status == 200:
+            record["ytlink"] = await loop.run_in_executor(pool, parse_trailer_search, html)
+    return record
+
+
+# Function: Fetch All
+# Inputs: list of (movieId, tmdbId), output path, cache folder, base urls,
+# worker tasks, per host concurrency and rate, cache max age, parser
+# processes, log function
+# Output: dict of counts
+# Process: workers take films off a queue and append each finished film to
+# the output. Films that fail, after retries or on a status other than 200
+# or 404, are logged and left for the next run
+async def fetch_all(links, out, cache_dir=CACHE_DIR, tmdb_url=TMDB_URL, youtube_url=None,
+                    workers=16, concurrency=8, rate=10.0, max_age=86400, processes=None,
+                    log=print):
+    done = read_done(out)
+    queue = asyncio.Queue()
+    for link in links:
+        if link[0] not in done:
+            queue.put_nowait(link)
+    total = queue.qsize()
+    log("%d films to fetch, %d already done" % (total, len(links) - total))
+    counts = {"written": 0, "failed": 0}
+    started = time.time()
+    cache = HttpCache(cache_dir, max_age)
+    connector = aiohttp.TCPConnector(limit=workers, limit_per_host=concurrency)
+    timeout = aiohttp.ClientTimeout(total=60)
+    with ProcessPoolExecutor(max_workers=processes) as pool, open(out, "a") as f:
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            fetcher = Fetcher(session, cache, concurrency=concurrency, rate=rate)
+
+            async def worker():
+                while True:
+                    try:
+                        movie_id, tmdb_id = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    try:
+                        record = await fetch_movie(fetcher, pool, movie_id, tmdb_id,
+                                                   tmdb_url, youtube_url)
+                    except IOError as e:
+                        counts["failed"] += 1
+                        log("movie %d: %s" % (movie_id, e))
+                        continue
+                    f.write(json.dumps(record) + "\n")
+                    f.flush()
+                    counts["written"] += 1
+                    if counts["written"] % 500 == 0:
+                        log("%d/%d films, %.1f/s" % (counts["written"], total,
+                                                     counts["written"] / (time.time() - started)))
+
+            await asyncio.gather(*[worker() for _ in range(workers)])
+            counts.update(fetcher.stats)
+    log("%(written)d written, %(failed)d failed, %(requests)d requests, %(cached)d from "
+        "cache, %(revalidated)d revalidated, %(retries)d retries" % counts)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch TMDb metadata for the MovieLens films")
+    parser.add_argument("--links", default=LINKS_CSV, help="MovieLens links.csv")
+    parser.add_argument("--out", default=OUT_PATH, help="json lines file the films go in")
+    parser.add_argument("--cache", default=CACHE_DIR, help="http cache folder")
+    parser.add_argument("--tmdb-url", default=TMDB_URL)
+    parser.add_argument("--youtube", action="store_true",
+                        help="search YouTube for films without a trailer")
+    parser.add_argument("--youtube-url", default=YOUTUBE_URL)
+    parser.add_argument("--workers", type=int, default=16, help="films fetched at once")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight per host")
+    parser.add_argument("--rate", type=float, default=10.0, help="requests per second per host")
+    parser.add_argument("--max-age", type=float, default=86400,
+                        help="seconds a cached page is used without revalidating")
+    parser.add_argument("--processes", type=int, default=None, help="html parser processes")
+    parser.add_argument("--restart", action="store_true", help="clear the output and start over")
+    args = parser.parse_args(argv)
+
+    if args.restart and os.path.exists(args.out):
+        os.remove(args.out)
+    started = time.time()
+    asyncio.run(fetch_all(
+        read_links(args.links), args.out, args.cache, args.tmdb_url.rstrip("/"),
+        args.youtube_url.rstrip("/") if args.youtube else None, workers=args.workers,
+        concurrency=args.concurrency, rate=args.rate, max_age=args.max_age,
+        processes=args.processes))
+    print("finished in %.1fs" % (time.time() - started))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
-from social import app
+from social import app, graph, schema, start
 import os
 
 app.secret_key = os.urandom(24)
 
-app.run(debug=True)
\ No newline at end of file
+# Development server, see wsgi.py for serving in production
+schema.migrate(graph)
+start()
+app.run(debug=True)
@@ -1,11 +1,117 @@
-#TODO: COMMENT
+# Import libraries
+import logging
+import time
 from .views import app
-from .models import graph
+from .models import graph, auth_pool, leaderboards, browse_index, movie_index, user_index, similar_users, snapshot, metrics_registry, user_ids
+from . import config, recommender, schema, search
+
+# The Flask app and its startup.
+# Importing the package builds the app and its models but opens nothing:
+# the graph connects on first use in each process. Before serving, load()
+# fills the read models the routes serve from memory (the recommender, the
+# graph snapshot with movie data and similarity lists, the browse index, the
+# leaderboards, the search indexes and the similar users index), and checks
+# the graph's schema is up to date, it is migrated with python -m social.migrate.
+# It also moves the user id sequence past users the loader added since.
+#
+# A single process calls start(). A prefork server (wsgi.py) calls load()
+# in the master so the workers share the models, then forked() in each
+# worker. Each step of load() is timed and logged, shown on /metrics and
+# checked against the startup budget.
+#
+# Every worker then keeps its own copy of the models, and a post, like or
+# signup only updates the copies in the worker that took it. The others are
+# eventually consistent:
+#  - movie pages are refetched after MOVIE_CACHE_TTL seconds
+#  - the leaderboards and trending are rebuilt after LEADERBOARD_TTL
+#  - the browse index is rebuilt after BROWSE_TTL
+#  - the recommender, the snapshot (similar films and its recommendations),
+#    the search indexes and similar users only catch up on the next start
+# Feeds, profiles and logins read the graph so are always current, like
+# counts once the taking worker's buffer flushes.
+
+log = logging.getLogger(__name__)
+
 app.static_folder = 'static'
-#Uniqueness Contraints
-graph.run("CREATE CONSTRAINT ON (n:User) ASSERT n.username IS UNIQUE")
-graph.run("CREATE CONSTRAINT ON (m:Movie) ASSERT m.movieID IS UNIQUE")
-graph.run("CREATE CONSTRAINT ON (g:Genre) ASSERT g.genreID IS UNIQUE")
-graph.run("CREATE CONSTRAINT ON (p:Post) ASSERT p.postid IS UNIQUE")
-graph.run("CREATE CONSTRAINT ON (t:Tag) ASSERT t.name IS UNIQUE")
-graph.run("CREATE INDEX ON :Post(date)")
+
+
+# Function: Timed
+# Inputs: dict of step -> seconds, step name, function, arguments
+# Output: the function's result
+def timed(timings, step, func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    timings[step] = time.perf_counter() - started
+    metrics_registry.startup[step] = timings[step]
+    return result
+
+
+# Function: Load
+# Inputs: None
+# Output: dict of startup step -> seconds it took
+# Process: reads everything served from memory, from the graph or the csv
+# exports as configured
+def load():
+    timings = {}
+    waiting = timed(timings, "schema", schema.pending, graph)
+    if waiting:
+        log.warning("graph has %d pending migrations (%s), run python -m social.migrate",
+                    len(waiting), ", ".join(name for _, name, _ in waiting))
+
+    # Move the user id sequence past any users bulk loaded since it was set up
+    timed(timings, "sequences", user_ids.ensure)
+
+    # Train the recommender so recommendations are served from memory
+    if config.RECOMMENDER_SOURCE == "csv":
+        timed(timings, "recommender", recommender.engine.fit_csv, config.RATINGS_CSV)
+    else:
+        timed(timings, "recommender", recommender.engine.fit_graph, graph)
+
+    # Load the read snapshot of movies, genres, keywords and ratings
+    if config.SNAPSHOT_SOURCE == "csv":
+        timed(timings, "snapshot", snapshot.from_csv, config.DATA_DIR)
+    else:
+        timed(timings, "snapshot", snapshot.from_graph, graph)
+    snapshot.log_memory()
+
+    # Build the browse index of films by genre, decade and rating
+    if config.SNAPSHOT_SOURCE == "csv":
+        timed(timings, "browse", browse_index.from_csv, config.DATA_DIR)
+    else:
+        timed(timings, "browse", browse_index.from_graph, graph)
+
+    # Load the index page leaderboards
+    timed(timings, "leaderboards", leaderboards.rebuild)
+
+    # Load the search indexes, from the snapshot if it's up to date
+    timed(timings, "search", search.load_indexes, graph, movie_index, user_index,
+          config.SEARCH_SNAPSHOT or None)
+
+    # Build the similar users index from everyone's tags and ratings
+    timed(timings, "similar_users", similar_users.build_graph, graph)
+
+    total = sum(timings.values())
+    log.info("loaded in %.2fs: %s", total,
+             ", ".join("%s %.2fs" % step for step in timings.items()))
+    if config.STARTUP_BUDGET and total > config.STARTUP_BUDGET:
+        log.warning("startup took %.2fs, over its %.0fs budget", total, config.STARTUP_BUDGET)
+    return timings
+
+
+# Function: Forked
+# Inputs: None
+# Output: None
+# Process: per worker startup under a prefork server, before the worker
+# starts any threads
+def forked():
+    auth_pool.start()
+
+
+# Function: Start
+# Inputs: None
+# Output: dict of startup step -> seconds it took
+# Process: single process startup, the password hashing workers fork
+# before any other threads start
+def start():
+    auth_pool.start()
+    return load()
@@ -0,0 +1,162 @@
+# Import libraries
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
+from passlib.hash import bcrypt
+
+# Password hashing off the request thread.
+# bcrypt at cost 12 keeps a core busy for a few hundred milliseconds, so
+# hashes and checks run in a small process pool instead of the Flask
+# thread. At most `depth` calls may be queued or running; past that callers
+# wait up to `wait` seconds for a slot and then get AuthBusy, so a burst of
+# logins is turned away instead of starving every other route. When a
+# password checks out against a hash made at a different cost it is
+# rehashed at the configured cost in the same call.
+#
+# The pool is forked on start(), call it before other threads are running.
+# With 0 workers everything runs inline in the calling thread.
+
+
+# raised when the hashing queue is full
+class AuthBusy(Exception):
+    pass
+
+
+# Function: Hash Password
+# Inputs: password, bcrypt cost
+# Output: bcrypt hash
+def hash_password(password, rounds):
+    return bcrypt.using(rounds=rounds).hash(password)
+
+
+# Function: Check Password
+# Inputs: password, stored hash, bcrypt cost
+# Output: (True or False, new hash if the stored one needs updating)
+def check_password(password, hashed, rounds):
+    handler = bcrypt.using(rounds=rounds)
+    if not handler.verify(password, hashed):
+        return False, None
+    if handler.needs_update(hashed):
+        return True, handler.hash(password)
+    return True, None
+
+
+# Function: Ready
+# Inputs: None
+# Output: True, used to fork the workers up front
+def ready():
+    return True
+
+
+class AuthPool:
+    # Function: Constructor Function
+    # Inputs: Self, worker processes (0 runs inline), bcrypt cost, most
+    # calls queued or running, seconds to wait for a free slot
+    # Output: None
+    def __init__(self, workers=2, rounds=12, depth=32, wait=1.0):
+        self.workers = workers
+        self.rounds = rounds
+        self.wait = wait
+        self.slots = threading.BoundedSemaphore(depth)
+        self.executor = None
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+
+    # Function: Start
+    # Inputs: Self
+    # Output: None
+    # Process: forks the worker processes. A forked child cant use its
+    # parent's workers, so it forks its own
+    def start(self):
+        with self.lock:
+            if self.workers and (self.executor is None or self.pid != os.getpid()):
+                self.pid = os.getpid()
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+                for future in [self.executor.submit(ready) for _ in range(self.workers)]:
+                    future.result()
+
+    # Function: Submit
+    # Inputs: Self, function, arguments
+    # Output: Future with the function's result
+    # Process: takes a queue slot, or raises AuthBusy if none frees up in
+    # time, and gives it back when the call finishes
+    def _submit(self, func, *args):
+        if not self.slots.acquire(timeout=self.wait):
+            raise AuthBusy()
+        try:
+            if not self.workers:
+                future = Future()
+                future.set_result(func(*args))
+            else:
+                if self.executor is None or self.pid != os.getpid():
+                    self.start()
+                future = self.executor.submit(func, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda f: self.slots.release())
+        return future
+
+    # Function: Hash
+    # Inputs: Self, password
+    # Output: bcrypt hash at the configured cost
+    def hash(self, password):
+        return self._submit(hash_password, password, self.rounds).result()
+
+    # Function: Check
+    # Inputs: Self, password, stored hash
+    # Output: (True or False, new hash or None)
+    def check(self, password, hashed):
+        return self._submit(check_password, password, hashed, self.rounds).result()
+
+
+class RateLimiter:
+    # Function: Constructor Function
+    # Inputs: Self, attempts allowed per key, window in seconds
+    # Output: None
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.lock = threading.Lock()
+        self.attempts = {}
+        self.last_sweep = time.monotonic()
+
+    # Function: Hit
+    # Inputs: Self, key (a username or an ip)
+    # Output: True if the attempt is allowed, False if over the limit
+    # Process: keeps the times of recent attempts per key, refused attempts
+    # aren't counted so a blocked key frees up once the window passes
+    def hit(self, key):
+        now = time.monotonic()
+        with self.lock:
+            self._sweep(now)
+            times = self.attempts.setdefault(key, deque())
+            while times and times[0] <= now - self.window:
+                times.popleft()
+            if len(times) >= self.limit:
+                return False
+            times.append(now)
+            return True
+
+    # Function: Reset
+    # Inputs: Self, key
+    # Output: None
+    # Process: forgets a key's attempts, after a successful login
+    def reset(self, key):
+        with self.lock:
+            self.attempts.pop(key, None)
+
+    # Function: Sweep
+    # Inputs: Self, current time
+    # Output: None
+    # Process: once per window drops keys with no recent attempts so the
+    # map doesn't grow with every ip seen, caller holds the lock
+    def _sweep(self, now):
+        if now - self.last_sweep < self.window:
+            return
+        self.last_sweep = now
+        cutoff = now - self.window
+        for key in [k for k, times in self.attempts.items() if not times or times[-1] <= cutoff]:
+            del self.attempts[key]
@@ -0,0 +1,362 @@
+# Import libraries
+import base64
+import binascii
+import logging
+import os
+import threading
+import time
+import numpy as np
+from .snapshot import EXPORT_QUERIES, read_csv, to_int
+
+# Faceted browse index over genre, decade and average rating.
+# Films get dense ids. For each genre, each decade and "all" films the
+# index keeps posting lists of film ids sorted best first by every sort
+# ("rating": average rating, "reviews": number of ratings, "recent": latest
+# review), alongside the negated sort keys so a position is found by binary
+# search, plus a bitset of the facet's films (one bit per film). A browse
+# walks the shortest posting list of the facets asked for in the requested
+# order and drops films missing from the other facets' bitsets or under the
+# minimum rating, a chunk at a time, until the page is full. Results come
+# out already sorted, so a page costs about its own length whatever the
+# facets.
+#
+# Pages use a keyset cursor, the sort key and id of the last film sent, so
+# pages don't shift as ratings move films around. A new rating updates the
+# film's numbers straight away (replacing the user's earlier rating of the
+# film, as the RATED edge does) and moves it in its posting lists before the
+# next browse. Other processes' ratings are picked up by rebuilding from the
+# graph on a background thread once the index is older than ttl seconds (0
+# turns that off), browsing the current index until it is swapped in.
+
+log = logging.getLogger(__name__)
+
+# per film numbers, the average is the mean of its RATED edges as rated()
+# keeps it, films nobody has rated fall back to the loaded average
+FILMS_QUERY = """
+MATCH (m:Movie)
+OPTIONAL MATCH (m)<-[r:RATED]-()
+WITH m, COUNT(r) AS reviews, AVG(toFloat(r.rating)) AS mean
+OPTIONAL MATCH (m)<-[:REVIEWED]-(post:Post)
+RETURN m.movieID AS movieID, m.year AS year, COALESCE(mean, m.avgrating) AS avgrating,
+reviews, MAX(post.timestamp) AS latest
+"""
+
+SORTS = ("rating", "reviews", "recent")
+
+# films tested per step while filling a page
+CHUNK = 256
+
+
+# Function: Decade
+# Inputs: year as stored, int, float or text
+# Output: first year of its decade, None if there is no year
+def decade(year):
+    try:
+        year = to_int(year)
+    except ValueError:
+        return None
+    return None if year is None else year // 10 * 10
+
+
+# Function: Encode Cursor
+# Inputs: sort key and movie id of the last film on a page
+# Output: opaque url safe cursor string
+def encode_cursor(key, movie_id):
+    raw = ("%r:%d" % (float(key), movie_id)).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+# Function: Decode Cursor
+# Inputs: cursor string
+# Output: (sort key, movie id)
+# Process: raises ValueError if the cursor wasnt made by encode_cursor
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        key, movie_id = raw.rsplit(":", 1)
+        return float(key), int(movie_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("invalid browse cursor")
+
+
+class Posting:
+    __slots__ = ("ids", "keys")
+
+    # Function: Constructor Function
+    # Inputs: Self, film ids, their negated sort keys, both sorted by
+    # (key, id)
+    # Output: None
+    def __init__(self, ids, keys):
+        self.ids = ids
+        self.keys = keys
+
+    # Function: Locate
+    # Inputs: Self, negated sort key, film id, "left" for the position of
+    # the film or "right" for the one after it
+    # Output: position in the list
+    def locate(self, key, film, side="left"):
+        lo = np.searchsorted(self.keys, key, "left")
+        hi = np.searchsorted(self.keys, key, "right")
+        return int(lo + np.searchsorted(self.ids[lo:hi], film, side))
+
+
+class BrowseIndex:
+    # Function: Constructor Function
+    # Inputs: Self, seconds before a rebuild from the graph (0 for never)
+    # Output: None
+    # Process: empty until built
+    def __init__(self, ttl=0):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.rebuilding = threading.Lock()
+        self.graph = None
+        self.built = 0
+        self.movie_ids = np.zeros(0, dtype=np.int64)
+        self.movies = {}
+        self.genres = {}
+        self.genre_names = {}
+        self.film_facets = []
+        self.postings = {}
+        self.bits = {}
+        self.dirty = set()
+
+    # Function: Build
+    # Inputs: Self, list of (movieID, year, avgrating, reviews, latest)
+    # tuples, dict of genreId -> name, (movieID, genreId) tuples
+    # Output: Self
+    # Process: numbers the films, groups them by facet and sorts each
+    # facet's films by every sort
+    def build(self, films, genres, has_genre):
+        films = sorted((f for f in films if f[0] is not None), key=lambda f: f[0])
+        movie_ids = np.array([f[0] for f in films], dtype=np.int64)
+        movies = {int(m): i for i, m in enumerate(movie_ids)}
+        numbers = {
+            "rating": np.array([np.nan if f[2] is None else float(f[2]) for f in films]),
+            "reviews": np.array([f[3] or 0 for f in films], dtype=np.float64),
+            "recent": np.array([f[4] or 0 for f in films], dtype=np.float64),
+        }
+        film_facets = [[("all", None)] for _ in films]
+        for i, f in enumerate(films):
+            if decade(f[1]) is not None:
+                film_facets[i].append(("decade", decade(f[1])))
+        for movie, genre in has_genre:
+            if movie in movies and genre in genres:
+                film_facets[movies[movie]].append(("genre", genre))
+        members = {}
+        for i, facets in enumerate(film_facets):
+            for facet in facets:
+                members.setdefault(facet, []).append(i)
+        keys = {sort: self._keys(values) for sort, values in numbers.items()}
+        postings, bits = {}, {}
+        for facet, ids in members.items():
+            ids = np.array(ids, dtype=np.int32)
+            postings[facet] = {}
+            for sort in SORTS:
+                order = ids[np.lexsort((ids, keys[sort][ids]))]
+                postings[facet][sort] = Posting(order, keys[sort][order])
+            mask = np.zeros(len(films), dtype=bool)
+            mask[ids] = True
+            bits[facet] = np.packbits(mask)
+        with self.lock:
+            self.movie_ids, self.movies = movie_ids, movies
+            self.numbers, self.keys = numbers, keys
+            self.genres = {name.lower(): g for g, name in genres.items() if name}
+            self.genre_names = dict(genres)
+            self.film_facets = film_facets
+            self.postings, self.bits = postings, bits
+            self.dirty = set()
+        self.built = time.time()
+        return self
+
+    # Function: Keys
+    # Inputs: array of sort values
+    # Output: negated values so ascending order is best first, films
+    # without a value last
+    @staticmethod
+    def _keys(values):
+        keys = -values
+        keys[np.isnan(keys)] = np.inf
+        return keys
+
+    # Function: From Graph
+    # Inputs: Self, graph
+    # Output: Self
+    # Process: three queries, and the index remembers the graph to rebuild
+    # from when it gets old
+    def from_graph(self, graph):
+        self.graph = graph
+        films = [(r["movieID"], r["year"], r["avgrating"], r["reviews"], r["latest"])
+                 for r in graph.run(FILMS_QUERY)]
+        genres = {r["genreId"]: r["name"] for r in graph.run(EXPORT_QUERIES["genres"])}
+        has_genre = [(r["movieID"], r["genreId"]) for r in graph.run(EXPORT_QUERIES["has_genre"])]
+        return self.build(films, genres, has_genre)
+
+    # Function: From CSV
+    # Inputs: Self, data folder
+    # Output: Self
+    # Process: counts and averages from ratings.csv, years (and averages of
+    # films nobody rated) from movieinfo.csv and the latest review from
+    # reviews.csv
+    def from_csv(self, data_dir):
+        path = lambda name: os.path.join(data_dir, name)
+        counts, sums, latest = {}, {}, {}
+        for r in read_csv(path("ratings.csv")):
+            movie = to_int(r["movieId"])
+            counts[movie] = counts.get(movie, 0) + 1
+            sums[movie] = sums.get(movie, 0.0) + float(r["rating"])
+        for r in read_csv(path("reviews.csv")):
+            movie = to_int(r["movieId"])
+            latest[movie] = max(latest.get(movie, 0), to_int(r["timestamp"]) or 0)
+        info = {to_int(r["movieId"]): r for r in read_csv(path("movieinfo.csv"))}
+        films = []
+        for movie in set(info) | set(counts):
+            r = info.get(movie, {})
+            average = sums[movie] / counts[movie] if movie in counts else (r.get("rating") or None)
+            films.append((movie, r.get("year"), average, counts.get(movie, 0),
+                          latest.get(movie)))
+        genres = {to_int(r["GenreId"]): r["Name"] for r in read_csv(path("genresinfo.csv"))}
+        has_genre = [(to_int(r["movieId"]), to_int(r["code"]))
+                     for r in read_csv(path("genres.csv"))]
+        return self.build(films, genres, has_genre)
+
+    # Function: Check Fresh
+    # Inputs: Self
+    # Output: None
+    # Process: starts a rebuild from the graph on a background thread if
+    # older than the ttl, unless one is running
+    def _check_fresh(self):
+        if self.graph is None or not self.ttl or time.time() - self.built < self.ttl:
+            return
+        if self.rebuilding.acquire(blocking=False):
+            threading.Thread(target=self._rebuild_held, name="browse-rebuild",
+                             daemon=True).start()
+
+    # Function: Rebuild Held
+    # Inputs: Self
+    # Output: None
+    # Process: rebuilds then releases the rebuilding lock taken by
+    # _check_fresh. A failed rebuild is logged and retried after another ttl
+    def _rebuild_held(self):
+        try:
+            self.from_graph(self.graph)
+        except Exception:
+            log.exception("browse index rebuild failed")
+            self.built = time.time()
+        finally:
+            self.rebuilding.release()
+
+    # Function: Rated
+    # Inputs: Self, movie id, rating, timestamp of the review, the user's
+    # rating it replaced (None if it's their first rating of the film)
+    # Output: None
+    # Process: updates the film's numbers now, its posting lists are
+    # re-sorted by the next browse
+    def rated(self, movie_id, rating, timestamp, previous=None):
+        with self.lock:
+            film = self.movies.get(movie_id)
+            if film is None:
+                return
+            numbers = self.numbers
+            count = numbers["reviews"][film]
+            average = numbers["rating"][film]
+            if np.isnan(average):
+                average = 0.0
+            if previous is not None and count:
+                numbers["rating"][film] = average + (float(rating) - float(previous)) / count
+            else:
+                numbers["rating"][film] = (average * count + float(rating)) / (count + 1)
+                numbers["reviews"][film] = count + 1
+            numbers["recent"][film] = max(numbers["recent"][film], timestamp)
+            for sort in SORTS:
+                self.keys[sort][film] = self._keys(numbers[sort][film:film + 1])[0]
+            self.dirty.add(film)
+
+    # Function: Apply
+    # Inputs: Self
+    # Output: None
+    # Process: takes the changed films out of their posting lists and puts
+    # them back at their new places, called with the lock held
+    def _apply(self):
+        if not self.dirty:
+            return
+        changed = np.array(sorted(self.dirty), dtype=np.int32)
+        facets = {}
+        for film in changed.tolist():
+            for facet in self.film_facets[film]:
+                facets.setdefault(facet, []).append(film)
+        for facet, films in facets.items():
+            films = np.array(films, dtype=np.int32)
+            for sort in SORTS:
+                posting = self.postings[facet][sort]
+                keep = ~np.isin(posting.ids, films)
+                ids, keys = posting.ids[keep], posting.keys[keep]
+                new_keys = self.keys[sort][films]
+                order = np.lexsort((films, new_keys))
+                rest = Posting(ids, keys)
+                at = [rest.locate(new_keys[i], films[i]) for i in order.tolist()]
+                self.postings[facet][sort] = Posting(np.insert(ids, at, films[order]),
+                                                     np.insert(keys, at, new_keys[order]))
+        self.dirty = set()
+
+    # Function: Genre List
+    # Inputs: Self
+    # Output: sorted list of the genres that can be browsed
+    def genre_list(self):
+        with self.lock:
+            return sorted(self.genre_names.values())
+
+    # Function: Browse
+    # Inputs: Self, genre names the films must all have, first year of the
+    # decade, lowest average rating, sort, films per page, cursor from the
+    # previous page
+    # Output: (list of (movie id, average rating, reviews) for the page,
+    # cursor for the next page or None if this was the last)
+    # Process: raises KeyError for an unknown genre or sort and ValueError
+    # for a bad cursor
+    def browse(self, genres=(), decade=None, min_rating=None, sort="reviews", n=20,
+               after=None):
+        if sort not in SORTS:
+            raise KeyError(sort)
+        self._check_fresh()
+        with self.lock:
+            self._apply()
+            facets = [("genre", self.genres[name.lower()]) for name in genres]
+            if decade is not None:
+                facets.append(("decade", decade))
+            if not facets:
+                facets.append(("all", None))
+            if any(f not in self.postings for f in facets):
+                return [], None
+            facets.sort(key=lambda f: len(self.postings[f][sort].ids))
+            posting = self.postings[facets[0]][sort]
+            filters = [self.bits[f] for f in facets[1:]]
+            average = self.numbers["rating"]
+
+            start, end = 0, len(posting.ids)
+            if after:
+                key, movie_id = decode_cursor(after)
+                film = self.movies.get(movie_id, -1)
+                start = posting.locate(-key, film, "right")
+            if min_rating is not None and sort == "rating":
+                # sorted by rating, so nothing after this can pass
+                end = int(np.searchsorted(posting.keys, -min_rating, "right"))
+
+            hits = []
+            while start < end and len(hits) <= n:
+                chunk = posting.ids[start:min(end, start + CHUNK)]
+                ok = np.ones(len(chunk), dtype=bool)
+                for bits in filters:
+                    ok &= (bits[chunk >> 3] >> (7 - (chunk & 7))) & 1 == 1
+                if min_rating is not None:
+                    ok &= average[chunk] >= min_rating
+                hits.extend((start + np.flatnonzero(ok)).tolist())
+                start += len(chunk)
+            page = hits[:n]
+            films = [(int(self.movie_ids[posting.ids[p]]),
+                      None if np.isnan(average[posting.ids[p]]) else float(average[posting.ids[p]]),
+                      int(self.numbers["reviews"][posting.ids[p]])) for p in page]
+            following = None
+            if len(hits) > n:
+                last = page[-1]
+                following = encode_cursor(-posting.keys[last], self.movie_ids[posting.ids[last]])
+            return films, following
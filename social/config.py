@@ -0,0 +1,144 @@
+# Import libraries
+import os
+
+# Settings shared by the app and the offline jobs.
+# Every value can be overridden with an environment variable of the same name
+# prefixed with RECFLIX_ so deployments don't need to edit code.
+
+# root of the repository and the folder holding the csv exports
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.environ.get("RECFLIX_DATA_DIR", os.path.join(BASE_DIR, "Data"))
+
+# csv exports used by the loaders and offline models
+RATINGS_CSV = os.path.join(DATA_DIR, "ratings.csv")
+
+# Recommender settings
+# method used to factorise the rating matrix, "svd" or "nmf"
+RECOMMENDER_METHOD = os.environ.get("RECFLIX_RECOMMENDER_METHOD", "svd")
+# number of latent factors
+RECOMMENDER_FACTORS = int(os.environ.get("RECFLIX_RECOMMENDER_FACTORS", 50))
+# number of ranked recommendations precomputed for each user
+RECOMMENDER_TOP_N = int(os.environ.get("RECFLIX_RECOMMENDER_TOP_N", 50))
+# where to train from at startup, "graph" (RATED edges) or "csv" (ratings.csv)
+RECOMMENDER_SOURCE = os.environ.get("RECFLIX_RECOMMENDER_SOURCE", "graph")
+
+# Post writer settings
+# most posts grouped into one write transaction
+WRITE_BATCH_SIZE = int(os.environ.get("RECFLIX_WRITE_BATCH_SIZE", 100))
+# seconds the writer waits for more posts before committing a group
+WRITE_MAX_DELAY = float(os.environ.get("RECFLIX_WRITE_MAX_DELAY", 0.005))
+# seconds a request waits for its post to be committed
+POST_TIMEOUT = float(os.environ.get("RECFLIX_POST_TIMEOUT", 10.0))
+
+# Like buffer settings
+# buffered likes that trigger a write without waiting for the interval
+LIKE_BATCH_SIZE = int(os.environ.get("RECFLIX_LIKE_BATCH_SIZE", 500))
+# seconds between writes of buffered likes, the most a crash can lose
+LIKE_FLUSH_INTERVAL = float(os.environ.get("RECFLIX_LIKE_FLUSH_INTERVAL", 1.0))
+# posts whose like counts are kept in memory
+LIKE_HOT_POSTS = int(os.environ.get("RECFLIX_LIKE_HOT_POSTS", 10000))
+
+# Leaderboard settings
+# films shown in the top rated and trending lists
+LEADERBOARD_SIZE = int(os.environ.get("RECFLIX_LEADERBOARD_SIZE", 10))
+# recent posts kept in memory
+LEADERBOARD_RECENT = int(os.environ.get("RECFLIX_LEADERBOARD_RECENT", 50))
+# seconds before the leaderboards are rebuilt from the graph, 0 for never
+LEADERBOARD_TTL = int(os.environ.get("RECFLIX_LEADERBOARD_TTL", 300))
+
+# Trending settings
+# window used for the trending lists, "24h", "7d" or "30d"
+TRENDING_WINDOW = os.environ.get("RECFLIX_TRENDING_WINDOW", "7d")
+# seconds trending scores are cached before new activity is counted
+TRENDING_REFRESH = int(os.environ.get("RECFLIX_TRENDING_REFRESH", 30))
+
+# User ids reserved from the graph sequence per round trip
+USER_ID_BLOCK = int(os.environ.get("RECFLIX_USER_ID_BLOCK", 20))
+
+# Search settings
+# folder the search indexes are snapshotted to and memory mapped from,
+# empty to always build them from the graph
+SEARCH_SNAPSHOT = os.environ.get("RECFLIX_SEARCH_SNAPSHOT", os.path.join(DATA_DIR, "search_index"))
+
+# Movie pages kept in the movie cache
+MOVIE_CACHE_SIZE = int(os.environ.get("RECFLIX_MOVIE_CACHE_SIZE", 2048))
+# seconds a movie page is kept, so reviews written through other workers
+# show up, 0 to keep it until the film gets a review here
+MOVIE_CACHE_TTL = int(os.environ.get("RECFLIX_MOVIE_CACHE_TTL", 30))
+
+# Auth settings
+# bcrypt cost for new hashes, logins rehash passwords stored at another cost
+BCRYPT_ROUNDS = int(os.environ.get("RECFLIX_BCRYPT_ROUNDS", 12))
+# web processes serving the app, gunicorn.conf.py sets WEB_CONCURRENCY to
+# the workers it forks
+WEB_PROCESSES = max(1, int(os.environ.get("WEB_CONCURRENCY", 1)))
+# processes hashing passwords in each web process, 0 to hash in the request
+# thread. Every web process has its own pool, so by default they share half
+# the cores between them, keeping at least one each
+AUTH_WORKERS = int(os.environ.get("RECFLIX_AUTH_WORKERS",
+                                  max(1, (os.cpu_count() or 2) // (2 * WEB_PROCESSES))))
+# most hashes queued or running before logins are turned away
+AUTH_QUEUE = int(os.environ.get("RECFLIX_AUTH_QUEUE", 32))
+# seconds a login waits for a free hashing slot
+AUTH_QUEUE_WAIT = float(os.environ.get("RECFLIX_AUTH_QUEUE_WAIT", 1.0))
+# login attempts allowed per username and per ip in each window
+LOGIN_USER_LIMIT = int(os.environ.get("RECFLIX_LOGIN_USER_LIMIT", 5))
+LOGIN_IP_LIMIT = int(os.environ.get("RECFLIX_LOGIN_IP_LIMIT", 30))
+# seconds in the login attempt window
+LOGIN_WINDOW = int(os.environ.get("RECFLIX_LOGIN_WINDOW", 300))
+# proxies in front of wsgi.py (the platform router), whose X-Forwarded-For
+# gives the client address the per ip limit counts, 0 if clients connect to
+# gunicorn directly
+PROXY_HOPS = int(os.environ.get("RECFLIX_PROXY_HOPS", 1))
+
+# Graph snapshot settings
+# where to build the snapshot from at startup, "graph" or "csv" (Data/)
+SNAPSHOT_SOURCE = os.environ.get("RECFLIX_SNAPSHOT_SOURCE", "graph")
+# new ratings kept in the delta before the rating arrays are rebuilt
+SNAPSHOT_COMPACT_AT = int(os.environ.get("RECFLIX_SNAPSHOT_COMPACT_AT", 1000))
+# seconds before pending ratings are compacted regardless
+SNAPSHOT_COMPACT_EVERY = int(os.environ.get("RECFLIX_SNAPSHOT_COMPACT_EVERY", 600))
+
+# Browse settings
+# films per browse page when the client doesnt ask for a size
+BROWSE_PAGE_SIZE = int(os.environ.get("RECFLIX_BROWSE_PAGE_SIZE", 20))
+# most films a client can ask for in one browse page
+BROWSE_MAX_PAGE = int(os.environ.get("RECFLIX_BROWSE_MAX_PAGE", 100))
+# seconds before the browse index is rebuilt from the graph, 0 for never
+BROWSE_TTL = int(os.environ.get("RECFLIX_BROWSE_TTL", 600))
+
+# Similar users settings
+# MinHash permutations per user signature
+SIMILAR_USERS_PERM = int(os.environ.get("RECFLIX_SIMILAR_USERS_PERM", 64))
+# LSH bands the signature is split into, more bands finds less similar users
+SIMILAR_USERS_BANDS = int(os.environ.get("RECFLIX_SIMILAR_USERS_BANDS", 32))
+
+# Query metrics settings
+# queries taking longer than this many milliseconds go in the slow query log
+SLOW_QUERY_MS = float(os.environ.get("RECFLIX_SLOW_QUERY_MS", 100))
+# share of slow read queries re-run with PROFILE to log their plan
+PROFILE_SAMPLE = float(os.environ.get("RECFLIX_PROFILE_SAMPLE", 0.1))
+# seconds between PROFILE runs of the same query
+PROFILE_INTERVAL = int(os.environ.get("RECFLIX_PROFILE_INTERVAL", 300))
+
+# Feed settings
+# posts per feed page when the client doesnt ask for a size
+FEED_PAGE_SIZE = int(os.environ.get("RECFLIX_FEED_PAGE_SIZE", 20))
+# most posts a client can ask for in one feed page
+FEED_MAX_PAGE = int(os.environ.get("RECFLIX_FEED_MAX_PAGE", 100))
+
+# Serving settings
+# most connections each process keeps open to Neo4j
+GRAPH_MAX_CONNECTIONS = int(os.environ.get("RECFLIX_GRAPH_MAX_CONNECTIONS", 40))
+# seconds startup may take loading the in memory models before it is
+# logged as over budget, 0 for no budget
+STARTUP_BUDGET = float(os.environ.get("RECFLIX_STARTUP_BUDGET", 30))
+# key signing the session cookies, must be set when several processes serve
+# the app, a random one is used per start otherwise
+SECRET_KEY = os.environ.get("RECFLIX_SECRET_KEY")
+
+# Page loading settings
+# threads running page queries, keep at or below the driver's connection pool
+QUERY_WORKERS = int(os.environ.get("RECFLIX_QUERY_WORKERS", 16))
+# seconds a page waits for its queries before rendering without them
+PAGE_TIMEOUT = float(os.environ.get("RECFLIX_PAGE_TIMEOUT", 2.0))
@@ -0,0 +1,46 @@
+# Import libraries
+import os
+import threading
+from py2neo import Graph
+try:
+    from py2neo import Database
+except ImportError:
+    Database = None
+
+# Lazy graph connection.
+# py2neo opens a driver with its own connection pool when a Graph is made,
+# and pooled connections can't cross a fork: parent and child would read
+# each other's replies off the same sockets. LazyGraph makes its Graph on
+# first use, and again in any process forked after that, so importing the
+# app opens nothing, a prefork master can load its caches and then fork, and
+# every worker gets a pool of its own. The child never uses or closes the
+# connections it inherited.
+
+
+class LazyGraph:
+    # Function: Constructor Function
+    # Inputs: Self, settings passed to py2neo's Graph
+    # Output: None
+    def __init__(self, **settings):
+        self._settings = settings
+        self._lock = threading.Lock()
+        self._pid = None
+        self._graph = None
+
+    # Function: Connect
+    # Inputs: Self
+    # Output: this process's py2neo Graph, made on first use
+    # Process: py2neo 4 caches its databases per uri, a forked child drops
+    # the cache so it doesnt get its parent's
+    def connect(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    if self._pid is not None and Database is not None:
+                        Database.forget_all()
+                    self._graph = Graph(**self._settings)
+                    self._pid = os.getpid()
+        return self._graph
+
+    def __getattr__(self, attr):
+        return getattr(self.connect(), attr)
@@ -0,0 +1,129 @@
+# Import libraries
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from . import config
+
+# Concurrent page loading.
+# A page declares the data it needs as a dict of name -> Query. load_page
+# starts every query at once on a shared, bounded thread pool (sized to the
+# driver's connection pool) and collects the results, so a page takes as
+# long as its slowest query rather than the sum of them. A query that fails
+# or isn't back before the page's deadline is replaced by its default and
+# the page renders without it.
+# A query given up on keeps its thread until the graph answers, so queries
+# are only submitted when a thread is free for them, waiting for one until
+# the page's deadline. When the graph is slow pages fall back to defaults at
+# their deadline instead of queueing work that runs long after it.
+
+log = logging.getLogger(__name__)
+
+# (pid, pool, semaphore of its free threads) of the shared pool, made on
+# first use in each process as a forked child cant use its parent's threads
+_executor = (None, None, None)
+_executor_lock = threading.Lock()
+
+
+class Query:
+    # Function: Constructor Function
+    # Inputs: Self, function to call, names of the page params passed to it
+    # in order, value used if it fails or times out, seconds it may take
+    # (defaults to the page's), inline to run it in the request thread
+    # for queries served from memory
+    # Output: None
+    def __init__(self, func, *params, default=None, timeout=None, inline=False):
+        self.func = func
+        self.params = params
+        self.default = default
+        self.timeout = timeout
+        self.inline = inline
+
+    # Function: Call
+    # Inputs: Self, dict of page params
+    # Output: the function's result, with cursors read into lists so the
+    # query finishes in the worker rather than in the template
+    def __call__(self, params):
+        result = self.func(*[params[name] for name in self.params])
+        if hasattr(result, "data"):
+            result = result.data()
+        return result
+
+
+# Function: Executor
+# Inputs: None
+# Output: (this process's page query pool, semaphore of its free threads)
+def executor():
+    global _executor
+    pid, pool, free = _executor
+    if pid != os.getpid():
+        with _executor_lock:
+            pid, pool, free = _executor
+            if pid != os.getpid():
+                pool = ThreadPoolExecutor(max_workers=config.QUERY_WORKERS)
+                free = threading.BoundedSemaphore(config.QUERY_WORKERS)
+                _executor = (os.getpid(), pool, free)
+    return pool, free
+
+
+# Function: Run Held
+# Inputs: semaphore of free threads, context to run in, Query, page params
+# Output: the query's result
+# Process: frees the thread's slot once the query is done, whether or not
+# the page still waits for it
+def run_held(free, context, query, params):
+    try:
+        return context.run(query, params)
+    finally:
+        free.release()
+
+
+# Function: Load Page
+# Inputs: dict of name -> Query, seconds the page may take, page params
+# Output: (dict of name -> result, list of names that fell back to default)
+# Process: submits every query once a thread is free for it, then waits
+# for each until the deadline
+def load_page(queries, timeout=None, **params):
+    timeout = config.PAGE_TIMEOUT if timeout is None else timeout
+    started = time.monotonic()
+    pool, free = executor()
+    futures, results, missing = {}, {}, []
+    for name, q in queries.items():
+        if q.inline:
+            continue
+        limit = q.timeout if q.timeout is not None else timeout
+        if not free.acquire(timeout=max(0.0, started + limit - time.monotonic())):
+            log.warning("page query %s skipped, all %d query threads busy for %.2fs",
+                        name, config.QUERY_WORKERS, limit)
+            results[name] = q.default
+            missing.append(name)
+            continue
+        # workers run in a copy of the request's context so their queries
+        # are counted against it
+        futures[name] = pool.submit(run_held, free, contextvars.copy_context(), q, params)
+    for name, q in queries.items():
+        if q.inline:
+            try:
+                results[name] = q(params)
+            except Exception:
+                log.exception("page query %s failed", name)
+                results[name] = q.default
+                missing.append(name)
+    for name, future in futures.items():
+        q = queries[name]
+        limit = q.timeout if q.timeout is not None else timeout
+        remaining = max(0.0, started + limit - time.monotonic())
+        try:
+            results[name] = future.result(timeout=remaining)
+        except TimeoutError:
+            future.cancel()
+            log.warning("page query %s took longer than %.2fs", name, limit)
+            results[name] = q.default
+            missing.append(name)
+        except Exception:
+            log.exception("page query %s failed", name)
+            results[name] = q.default
+            missing.append(name)
+    return results, missing
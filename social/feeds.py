@@ -0,0 +1,101 @@
+# Import libraries
+import base64
+import binascii
+
+# Paged post feeds.
+# Feeds are newest first, ordered on (timestamp, postid) so posts from the
+# same second still have a fixed order, and paged with a keyset cursor: the
+# (timestamp, postid) of the last post sent. The next page is the posts
+# strictly before it, so a page costs the same however deep it is and posts
+# added meanwhile don't shift it. The timestamp range lets the Post(timestamp)
+# index drive the global feed; user and movie feeds start from their node.
+# Tags and like counts for the whole page come back in the same query, the
+# counts from the like_count kept on each post by social/likes.py.
+#
+# A post missing its author or film (the loader merges posts before their
+# relationships) is skipped, but it still counts towards the page: the
+# query reads one post more than the page and the cursor comes from the
+# posts read, so a short page never ends the feed early.
+
+# the scopes a feed can be read for, and how they find their posts
+SCOPES = {
+    "all": "MATCH (post:Post)",
+    "user": "MATCH (:User {username: {key}})-[:PUBLISHED]->(post:Post)",
+    "movie": "MATCH (:Movie {movieID: {key}})<-[:REVIEWED]-(post:Post)",
+}
+
+PAGE_QUERY = """
+%s
+WHERE post.timestamp <= {timestamp}
+AND (post.timestamp < {timestamp} OR post.postid < {postid})
+WITH post
+ORDER BY post.timestamp DESC, post.postid DESC
+LIMIT {n}
+OPTIONAL MATCH (user:User)-[:PUBLISHED]->(post)
+OPTIONAL MATCH (post)-[:REVIEWED]->(movie:Movie)
+OPTIONAL MATCH (post)<-[:TAGGED]-(tag:Tag)
+WITH user, post, movie, COLLECT(tag.name) AS tags
+RETURN user.username AS username, post, tags, movie.title AS movTitle,
+COALESCE(post.like_count, 0) AS likes, user IS NOT NULL AND movie IS NOT NULL AS complete
+ORDER BY post.timestamp DESC, post.postid DESC
+"""
+
+# later than any post, used for the first page
+NEWEST = 2 ** 62
+
+
+# Function: Encode Cursor
+# Inputs: timestamp, postid of the last post on a page
+# Output: opaque url safe cursor string
+def encode_cursor(timestamp, postid):
+    raw = ("%d:%s" % (timestamp, postid)).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+# Function: Decode Cursor
+# Inputs: cursor string, None or empty for the first page
+# Output: (timestamp, postid)
+# Process: raises ValueError if the cursor wasnt made by encode_cursor
+def decode_cursor(cursor):
+    if not cursor:
+        return NEWEST, ""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        timestamp, postid = raw.split(":", 1)
+        return int(timestamp), postid
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("invalid feed cursor")
+
+
+# Function: Page
+# Inputs: graph, scope ("all", "user" or "movie"), username or movie id for
+# the scope, posts per page, cursor from the previous page
+# Output: (list of post rows newest first, cursor for the next page or None
+# if this was the last)
+# Process: up to n posts, fewer if some are missing their author or film
+def page(graph, scope, key=None, n=20, after=None):
+    timestamp, postid = decode_cursor(after)
+    rows = graph.run(PAGE_QUERY % SCOPES[scope], key=key, timestamp=timestamp,
+                     postid=postid, n=n + 1).data()
+    following = None
+    if len(rows) > n:
+        rows = rows[:n]
+        last = rows[-1]["post"]
+        following = encode_cursor(last["timestamp"], last["postid"])
+    kept = []
+    for row in rows:
+        if row.pop("complete"):
+            row["post"] = dict(row["post"])
+            kept.append(row)
+    return kept, following
+
+
+# Function: Row JSON
+# Inputs: post row from page
+# Output: flat dict of the post for the json feeds
+def row_json(row):
+    post = dict(row["post"])
+    post.pop("like_count", None)
+    post.update(username=row["username"], tags=row["tags"], movTitle=row["movTitle"],
+                likes=row["likes"])
+    return post
@@ -0,0 +1,73 @@
+# Import libraries
+import os
+import threading
+
+# Sequential id allocation backed by the graph.
+# Each sequence is a (:Sequence {name}) node holding the next free id.
+# A process reserves a block of ids with one atomic increment and hands them
+# out locally, so signups don't take a lock in the database and concurrent
+# signups (in any process) can never get the same id. Ids from a block that
+# is never used up are skipped, leaving gaps.
+
+# creates the sequence starting after the highest id in use, or moves an
+# existing one forward if data was loaded with higher ids since
+ENSURE_QUERY = """
+OPTIONAL MATCH (n:User)
+WITH COALESCE(MAX(n.userid), 0) + 1 AS start
+MERGE (s:Sequence {name: {name}})
+ON CREATE SET s.next = start
+ON MATCH SET s.next = CASE WHEN start > s.next THEN start ELSE s.next END
+"""
+
+# takes the node's write lock before reading next so two transactions
+# can't read the same value
+RESERVE_QUERY = """
+MATCH (s:Sequence {name: {name}})
+SET s._lock = true
+WITH s
+SET s.next = s.next + {size}
+REMOVE s._lock
+RETURN s.next - {size} AS first
+"""
+
+
+class IdAllocator:
+    # Function: Constructor Function
+    # Inputs: Self, graph, sequence name, ids reserved per round trip
+    # Output: None
+    def __init__(self, graph, name="User", block_size=20):
+        self.graph = graph
+        self.name = name
+        self.block_size = block_size
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.current = 0
+        self.end = 0
+
+    # Function: Ensure
+    # Inputs: Self
+    # Output: None
+    # Process: creates or fast forwards the sequence node, run by the
+    # migration, at every start and after the loader adds users
+    def ensure(self):
+        self.graph.run(ENSURE_QUERY, name=self.name)
+
+    # Function: Next Id
+    # Inputs: Self
+    # Output: an unused integer id
+    # Process: hands out the next id of the reserved block, reserving a new
+    # block when it runs out. A forked child drops its parent's block so the
+    # two processes never hand out the same ids
+    def next_id(self):
+        with self.lock:
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.current = self.end = 0
+            if self.current >= self.end:
+                first = self.graph.evaluate(RESERVE_QUERY, name=self.name, size=self.block_size)
+                if first is None:
+                    raise LookupError("sequence %s has not been set up" % self.name)
+                self.current = first
+                self.end = first + self.block_size
+            self.current += 1
+            return self.current - 1
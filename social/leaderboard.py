@@ -0,0 +1,204 @@
+# Import libraries
+import heapq
+import logging
+import threading
+import time
+from collections import deque
+
+# In memory leaderboards for the index page.
+# Holds the top rated films and a ring buffer of the most recent posts, and
+# feeds the trending engine, so rendering "/" doesn't touch the graph. They
+# are rebuilt from the graph at startup and then kept up to date by
+# post_added/post_liked.
+# Other worker processes write posts this process never sees, so the
+# leaderboards are also rebuilt once they are older than ttl seconds
+# (0 turns that off) or after invalidate() is called. That rebuild runs on
+# a background thread, requests keep reading the current lists until it
+# swaps the new ones in.
+
+log = logging.getLogger(__name__)
+
+# total rating per film
+TOP_QUERY = """
+MATCH (post:Post)-[:REVIEWED]->(movie:Movie)
+RETURN movie.movieID as movieID, movie.title as title, movie.poster as poster,
+SUM(toInteger(post.rating)) as score
+"""
+
+# latest posts with their author, tags, film and who liked them
+RECENT_QUERY = """
+MATCH (user:User)-[:PUBLISHED]->(post:Post)-[:REVIEWED]->(movie:Movie)
+WITH user, post, movie
+ORDER BY post.timestamp DESC LIMIT {n}
+OPTIONAL MATCH (post)<-[:TAGGED]-(tag:Tag)
+WITH user, post, movie, COLLECT(tag.name) as tags
+OPTIONAL MATCH (post)<-[:LIKES]-(fan:User)
+RETURN user.username as username, post, tags, movie.title as movTitle,
+COLLECT(fan.username) as likes
+ORDER BY post.timestamp DESC
+"""
+
+
+class Leaderboards:
+    # Function: Constructor Function
+    # Inputs: Self, graph, TrendingEngine, trending window, films per list,
+    # posts kept in the ring buffer, seconds before a rebuild (0 for never)
+    # Output: None
+    # Process: empty until rebuild is called
+    def __init__(self, graph, trends, window="7d", size=10, recent=50, ttl=0):
+        self.graph = graph
+        self.trends = trends
+        self.window = window
+        self.size = size
+        self.recent = recent
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.rebuilding = threading.Lock()
+        self.built = 0
+        self.scores = {}
+        self.films = {}
+        self.top = []
+        self.top_dirty = False
+        self.posts = deque(maxlen=recent)
+
+    # Function: Rebuild
+    # Inputs: Self
+    # Output: None
+    # Process: reloads the lists and the trending counters from the graph
+    def rebuild(self):
+        scores, films = {}, {}
+        for row in self.graph.run(TOP_QUERY):
+            scores[row["movieID"]] = row["score"] or 0
+            films[row["movieID"]] = {"title": row["title"], "movieID": row["movieID"],
+                                     "poster": row["poster"]}
+        posts = deque(maxlen=self.recent)
+        for row in reversed(self.graph.run(RECENT_QUERY, n=self.recent).data()):
+            posts.appendleft({"username": row["username"], "post": dict(row["post"]),
+                              "tags": row["tags"], "movTitle": row["movTitle"],
+                              "likes": set(row["likes"])})
+        with self.lock:
+            self.scores, self.films = scores, films
+            self.posts = posts
+            self.top_dirty = True
+        self.trends.rebuild(self.graph)
+        self.built = time.time()
+
+    # Function: Invalidate
+    # Inputs: Self
+    # Output: None
+    # Process: forces a rebuild on the next read
+    def invalidate(self):
+        self.built = 0
+
+    # Function: Check Fresh
+    # Inputs: Self
+    # Output: None
+    # Process: starts a rebuild on a background thread if older than the
+    # ttl, unless one is running. Lists that were never built are built in
+    # the calling thread, there is nothing to serve meanwhile
+    def _check_fresh(self):
+        if self.built and (not self.ttl or time.time() - self.built < self.ttl):
+            return
+        if self.rebuilding.acquire(blocking=False):
+            if not self.films:
+                self._rebuild_held()
+            else:
+                threading.Thread(target=self._rebuild_held, name="leaderboards-rebuild",
+                                 daemon=True).start()
+
+    # Function: Rebuild Held
+    # Inputs: Self
+    # Output: None
+    # Process: rebuilds then releases the rebuilding lock taken by
+    # _check_fresh. A failed rebuild is logged and retried after another ttl
+    def _rebuild_held(self):
+        try:
+            self.rebuild()
+        except Exception:
+            log.exception("leaderboard rebuild failed")
+            self.built = time.time()
+        finally:
+            self.rebuilding.release()
+
+    # Function: Top Rated
+    # Inputs: Self, number of films
+    # Output: list of {"title", "movieID", "poster"} best first
+    # Process: the sorted top list is only recomputed after a score change
+    # that could have moved it
+    def top_rated(self, n=10):
+        self._check_fresh()
+        with self.lock:
+            if self.top_dirty:
+                best = heapq.nlargest(self.size, self.scores.items(), key=lambda x: x[1])
+                self.top = [self.films[movid] for movid, _ in best]
+                self.top_dirty = False
+            return self.top[:n]
+
+    # Function: Trending
+    # Inputs: Self, number of films, window (defaults to the board's),
+    # optional genre name
+    # Output: list of films, most trending first
+    def trending(self, n=10, window=None, genre=None):
+        self._check_fresh()
+        ids = self.trends.top(n, window or self.window, genre)
+        with self.lock:
+            return [self.films[movid] for movid in ids if movid in self.films]
+
+    # Function: Recent Posts
+    # Inputs: Self, number of posts
+    # Output: list of post rows, newest first
+    def recent_posts(self, n=5):
+        self._check_fresh()
+        with self.lock:
+            return list(self.posts)[:n]
+
+    # Function: Post Added
+    # Inputs: Self, post dict from make_post, row returned by the writer
+    # Output: None
+    # Process: adds the rating to the film's score, records the review for
+    # trending and pushes the post onto the ring buffer
+    def post_added(self, post, row):
+        movid = post["movid"]
+        with self.lock:
+            if movid not in self.films:
+                self.films[movid] = {"title": row["movTitle"], "movieID": movid,
+                                     "poster": row["poster"]}
+            score = self.scores.get(movid, 0) + post["rating"]
+            self.scores[movid] = score
+            # the top list can only change if this film is in it or beats its last entry
+            if (len(self.top) < self.size or score >= self.scores.get(self.top[-1]["movieID"], 0)
+                    or any(f["movieID"] == movid for f in self.top)):
+                self.top_dirty = True
+            fields = ("postid", "title", "rating", "text", "movid", "timestamp", "date")
+            self.posts.appendleft({"username": post["username"],
+                                   "post": {k: post[k] for k in fields},
+                                   "tags": post["tags"], "movTitle": row["movTitle"],
+                                   "likes": set()})
+        self.trends.review(movid, post["rating"], post["timestamp"])
+
+    # Function: Post Liked
+    # Inputs: Self, post id, username of the user who liked it, movie id
+    # of the post
+    # Output: None
+    # Process: records the like for trending and adds the user to the
+    # post's likes if it's in the ring buffer
+    def post_liked(self, postid, username, movid):
+        self.trends.like(movid)
+        with self.lock:
+            for row in self.posts:
+                if row["post"]["postid"] == postid:
+                    row["likes"].add(username)
+                    break
+
+    # Function: Post Unliked
+    # Inputs: Self, post id, username of the user who unliked it, movie id
+    # of the post
+    # Output: None
+    # Process: removes the user from the post's likes if it's in the ring
+    # buffer, trending keeps the like as past activity
+    def post_unliked(self, postid, username, movid):
+        with self.lock:
+            for row in self.posts:
+                if row["post"]["postid"] == postid:
+                    row["likes"].discard(username)
+                    break
@@ -0,0 +1,300 @@
+# Import libraries
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+# Like write path.
+# Likes and unlikes are acknowledged as soon as they are buffered and
+# written behind: a flusher thread commits everything buffered every
+# interval seconds, or as soon as batch_size pairs are waiting, as one
+# transaction of two UNWIND statements. A (user, post) pair is buffered once,
+# its latest action wins, so a user clicking like repeatedly costs nothing
+# and a like undone before the flush never reaches the graph.
+# Each post keeps a denormalised like_count, changed by the same statement
+# that creates or deletes the LIKES edge so the two can't drift, and feeds
+# read the count instead of counting edges.
+# The counts of recently seen posts are held in a bounded map, so pages show
+# buffered likes straight away: the committed count plus what is buffered.
+# Whether a user likes a post is remembered for recently written pairs; a
+# pair that isnt (any pair after a restart) is looked up in the graph
+# first, so liking a post already liked changes nothing.
+#
+# Durability: a like is acknowledged before it is committed. Anything still
+# buffered when the process dies (at most interval seconds of likes, or
+# batch_size pairs) is lost; a clean exit flushes the buffer first. A
+# committed batch is all or nothing; if it fails the pairs are retried one
+# by one and a pair that still fails is logged and dropped.
+
+LIKE_QUERY = """
+UNWIND {likes} AS row
+MATCH (user:User {username: row.username})
+MATCH (post:Post {postid: row.postid})
+MERGE (user)-[like:LIKES]->(post)
+ON CREATE SET like.timestamp = row.timestamp, like._new = true,
+              post.like_count = COALESCE(post.like_count, 0) + 1
+WITH row, post, like, like._new IS NOT NULL AS created
+REMOVE like._new
+RETURN row.username AS username, post.postid AS postid, post.movid AS movid,
+       created, post.like_count AS likes
+"""
+
+LIKED_QUERY = """
+UNWIND {postids} AS postid
+MATCH (post:Post {postid: postid})
+OPTIONAL MATCH (:User {username: {username}})-[like:LIKES]->(post)
+RETURN postid, like IS NOT NULL AS liked
+"""
+
+UNLIKE_QUERY = """
+UNWIND {unlikes} AS row
+MATCH (:User {username: row.username})-[like:LIKES]->(post:Post {postid: row.postid})
+DELETE like
+SET post.like_count = CASE WHEN post.like_count > 0 THEN post.like_count - 1 ELSE 0 END
+RETURN row.username AS username, post.postid AS postid, post.movid AS movid,
+       post.like_count AS likes
+"""
+
+# gives posts written before like_count existed their count, a batch at a time
+BACKFILL_QUERY = """
+MATCH (post:Post) WHERE post.like_count IS NULL
+WITH post LIMIT {n}
+SET post.like_count = SIZE((post)<-[:LIKES]-())
+RETURN count(post) AS done
+"""
+
+log = logging.getLogger(__name__)
+
+
+# Function: Remember
+# Inputs: OrderedDict, key, value, most entries kept
+# Output: None
+# Process: least recently set entries are dropped first
+def remember(entries, key, value, size):
+    entries[key] = value
+    entries.move_to_end(key)
+    while len(entries) > size:
+        entries.popitem(last=False)
+
+
+class LikeBuffer:
+    # Function: Constructor Function
+    # Inputs: Self, graph, pairs that trigger a flush, seconds between
+    # flushes, posts whose counts are kept in memory
+    # Output: None
+    # Process: the flusher thread is started on first use
+    def __init__(self, graph, batch_size=500, interval=1.0, hot=10000):
+        self.graph = graph
+        self.batch_size = batch_size
+        self.interval = interval
+        self.hot = hot
+        self.lock = threading.Lock()
+        self.flushing = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.pid = os.getpid()
+        # (username, postid) -> (liked, timestamp, change to the post's count)
+        self.pending = {}
+        # postid -> committed like count, and the buffered change to it
+        self.counts = OrderedDict()
+        self.delta = Counter()
+        # (username, postid) -> liked, for pairs recently written
+        self.known = OrderedDict()
+        # called with (postid, username, movid) once a like or unlike commits
+        self.on_like = None
+        self.on_unlike = None
+        atexit.register(self.flush)
+
+    # Function: Set
+    # Inputs: Self, username, list of post ids, True to like or False to unlike
+    # Output: list of the post ids that changed
+    # Process: buffers each pair unless it is already in that state,
+    # looking up the pairs whose state isnt in memory first
+    def set(self, username, postids, liked):
+        now = int(time.time())
+        with self.lock:
+            unknown = [p for p in postids
+                       if (username, p) not in self.pending and (username, p) not in self.known]
+        if unknown:
+            self._look_up(username, unknown)
+        changed = []
+        with self.lock:
+            for postid in postids:
+                key = (username, postid)
+                entry = self.pending.get(key)
+                current = entry[0] if entry else self.known.get(key)
+                if current == liked:
+                    continue
+                step = 1 if liked else -1
+                self.pending[key] = (liked, now, (entry[2] if entry else 0) + step)
+                self.delta[postid] += step
+                changed.append(postid)
+            waiting = len(self.pending)
+        if changed:
+            self._start()
+            if waiting >= self.batch_size:
+                self.wake.set()
+        return changed
+
+    # Function: Look Up
+    # Inputs: Self, username, list of post ids
+    # Output: None
+    # Process: remembers whether the user likes each post, unless a write
+    # for the pair has been remembered since. If the graph cant be reached
+    # the pairs are taken as not liked
+    def _look_up(self, username, postids):
+        try:
+            rows = self.graph.run(LIKED_QUERY, username=username, postids=postids).data()
+        except Exception:
+            log.exception("couldn't look up %s's likes", username)
+            return
+        with self.lock:
+            for row in rows:
+                key = (username, row["postid"])
+                if key not in self.known:
+                    remember(self.known, key, row["liked"], self.hot)
+
+    # Function: Like
+    # Inputs: Self, username, list of post ids
+    # Output: list of the post ids newly liked
+    def like(self, username, postids):
+        return self.set(username, postids, True)
+
+    # Function: Unlike
+    # Inputs: Self, username, list of post ids
+    # Output: list of the post ids newly unliked
+    def unlike(self, username, postids):
+        return self.set(username, postids, False)
+
+    # Function: Count
+    # Inputs: Self, post id, committed count to use if the post isnt in memory
+    # Output: the post's like count including buffered likes, None if it
+    # isnt known
+    def count(self, postid, default=None):
+        with self.lock:
+            committed = self.counts.get(postid, default)
+            if committed is None:
+                return None
+            return max(0, committed + self.delta.get(postid, 0))
+
+    # Function: Seen
+    # Inputs: Self, list of post rows with a "likes" count read from the graph
+    # Output: the rows, their counts including buffered likes
+    # Process: the graph's counts are remembered as the committed ones
+    def seen(self, rows):
+        with self.lock:
+            for row in rows:
+                postid = row["post"]["postid"]
+                remember(self.counts, postid, row["likes"], self.hot)
+                row["likes"] = max(0, row["likes"] + self.delta.get(postid, 0))
+        return rows
+
+    # Function: Start
+    # Inputs: Self
+    # Output: None
+    # Process: a forked child starts its own flusher, its parent's thread
+    # doesnt exist in it
+    def _start(self):
+        if self.thread is None or self.pid != os.getpid():
+            with self.lock:
+                if self.thread is None or self.pid != os.getpid():
+                    self.pid = os.getpid()
+                    self.thread = threading.Thread(target=self._run, name="like-writer", daemon=True)
+                    self.thread.start()
+
+    # Function: Run
+    # Inputs: Self
+    # Output: None
+    # Process: flusher loop, wakes every interval or when the buffer is full
+    def _run(self):
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                log.exception("like flush failed")
+
+    # Function: Flush
+    # Inputs: Self
+    # Output: number of pairs written
+    # Process: takes the whole buffer and commits it, the buffered changes
+    # stay in the counts until the graph's counts replace them
+    def flush(self):
+        with self.flushing:
+            with self.lock:
+                group, self.pending = self.pending, {}
+            if not group:
+                return 0
+            self._write_group(list(group.items()))
+            return len(group)
+
+    # Function: Write Group
+    # Inputs: Self, list of ((username, postid), (liked, timestamp, change))
+    # Output: None
+    # Process: one transaction for the group. If it fails each pair is
+    # retried on its own so one bad pair can't lose its neighbours
+    def _write_group(self, group):
+        try:
+            liked, unliked = self.write(group)
+        except Exception:
+            if len(group) > 1:
+                for item in group:
+                    self._write_group([item])
+                return
+            log.exception("dropped %s of post %s", "like" if group[0][1][0] else "unlike",
+                          group[0][0][1])
+            liked, unliked = [], []
+        self._committed(group, liked, unliked)
+
+    # Function: Write
+    # Inputs: Self, list of ((username, postid), (liked, timestamp, change))
+    # Output: (rows of likes written, rows of unlikes written)
+    def write(self, group):
+        likes = [{"username": u, "postid": p, "timestamp": ts}
+                 for (u, p), (liked, ts, _) in group if liked]
+        unlikes = [{"username": u, "postid": p} for (u, p), (liked, _, _) in group if not liked]
+        tx = self.graph.begin()
+        try:
+            liked = tx.run(LIKE_QUERY, likes=likes).data() if likes else []
+            unliked = tx.run(UNLIKE_QUERY, unlikes=unlikes).data() if unlikes else []
+            tx.commit()
+        except Exception:
+            tx.rollback()
+            raise
+        return liked, unliked
+
+    # Function: Committed
+    # Inputs: Self, group written, rows of likes and unlikes written
+    # Output: None
+    # Process: swaps the group's buffered changes for the graph's counts and
+    # tells the listeners which likes really changed
+    def _committed(self, group, liked, unliked):
+        with self.lock:
+            for (username, postid), (state, _, change) in group:
+                self.delta[postid] -= change
+                if not self.delta[postid]:
+                    del self.delta[postid]
+                remember(self.known, (username, postid), state, self.hot)
+            for row in liked + unliked:
+                remember(self.counts, row["postid"], row["likes"] or 0, self.hot)
+        for row in liked:
+            if row["created"] and self.on_like:
+                self.on_like(row["postid"], row["username"], row["movid"])
+        for row in unliked:
+            if self.on_unlike:
+                self.on_unlike(row["postid"], row["username"], row["movid"])
+
+
+# Function: Backfill
+# Inputs: graph, posts per batch
+# Output: number of posts given a like_count
+def backfill(graph, n=10000):
+    total = 0
+    while True:
+        done = graph.evaluate(BACKFILL_QUERY, n=n)
+        total += done or 0
+        if not done:
+            return total
@@ -0,0 +1,398 @@
+# Import libraries
+import bisect
+import contextvars
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Query instrumentation.
+# InstrumentedGraph wraps the py2neo graph and times every statement it
+# runs (run, evaluate, merge, create and transactions, which also covers
+# NodeMatcher lookups). A query is named after the function that issued it,
+# found by walking up the stack past this module and py2neo, and labelled
+# with the route of the request it ran for. The request is tracked in a
+# context variable that load_page copies into its worker threads.
+#
+# Per query: a latency histogram, rows read and errors. Per route: request
+# latency and queries per request. Queries slower than the threshold are
+# written to the slow query log as json, and a sample of the read only ones
+# is re-run with PROFILE in the background to log the plan.
+# Registry.render() gives everything in the Prometheus text format.
+# The cost per query is a few dict lookups and a lock, cheap enough to
+# leave on.
+
+log = logging.getLogger(__name__)
+slow_log = logging.getLogger(__name__ + ".slow")
+
+# seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# queries per request
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+
+# modules whose frames are skipped when naming a query
+SKIP_MODULES = ("social.metrics", "py2neo")
+# code that is named after the function it sits in
+ANONYMOUS = ("<lambda>", "<listcomp>", "<dictcomp>", "<setcomp>", "<genexpr>")
+# statements PROFILE would write with
+WRITES = re.compile(r"\b(CREATE|MERGE|SET|DELETE|REMOVE|DETACH)\b", re.IGNORECASE)
+
+# the request being served, None outside requests
+current = contextvars.ContextVar("recflix_request", default=None)
+
+
+# Histogram: cumulative counts per upper bound plus sum and count
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    # Function: Observe
+    # Inputs: Self, value
+    # Output: None
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+# RequestTrace: the route being served and the queries it has run so far
+class RequestTrace:
+    __slots__ = ("route", "started", "queries")
+
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        # (name, seconds), appended from any thread
+        self.queries = []
+
+
+# Function: Label
+# Inputs: label value
+# Output: the value escaped for the Prometheus text format
+def label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class Registry:
+    # Function: Constructor Function
+    # Inputs: Self, seconds a query must take to be logged as slow, share of
+    # slow read queries re-run with PROFILE, seconds between profiles of
+    # the same query
+    # Output: None
+    def __init__(self, slow=0.1, profile_sample=0.1, profile_interval=300):
+        self.slow = slow
+        self.profile_sample = profile_sample
+        self.profile_interval = profile_interval
+        self.lock = threading.Lock()
+        self.queries = {}
+        self.rows = {}
+        self.errors = {}
+        self.slow_count = {}
+        self.requests = {}
+        self.request_queries = {}
+        self.profiled = {}
+        self.profiler = None
+        self.profiler_pid = None
+        self.names = {}
+        # startup step -> seconds it took
+        self.startup = {}
+
+    # Function: Query Name
+    # Inputs: Self
+    # Output: "module.function" of the first named caller outside this
+    # module and py2neo, cached per code object
+    def query_name(self):
+        frame = sys._getframe(1)
+        while frame is not None:
+            module = frame.f_globals.get("__name__", "")
+            if not module.startswith(SKIP_MODULES) and frame.f_code.co_name not in ANONYMOUS:
+                code = frame.f_code
+                name = self.names.get(code)
+                if name is None:
+                    name = "%s.%s" % (module.rsplit(".", 1)[-1], code.co_name)
+                    self.names[code] = name
+                return name
+            frame = frame.f_back
+        return "unknown"
+
+    # Function: Record Query
+    # Inputs: Self, query name, seconds taken, True if it raised
+    # Output: route the query was labelled with
+    def record_query(self, name, seconds, error=False):
+        trace = current.get()
+        route = trace.route if trace is not None else "-"
+        if trace is not None:
+            trace.queries.append((name, seconds))
+        key = (name, route)
+        with self.lock:
+            hist = self.queries.get(key)
+            if hist is None:
+                hist = self.queries[key] = Histogram(LATENCY_BUCKETS)
+            hist.observe(seconds)
+            if error:
+                self.errors[key] = self.errors.get(key, 0) + 1
+        return route
+
+    # Function: Add Rows
+    # Inputs: Self, query name, route, rows read
+    # Output: None
+    def add_rows(self, name, route, rows):
+        key = (name, route)
+        with self.lock:
+            self.rows[key] = self.rows.get(key, 0) + rows
+
+    # Function: Slow Query
+    # Inputs: Self, graph to profile on, query name, route, Cypher,
+    # parameters, seconds taken
+    # Output: None
+    # Process: logs the query as a json line and maybe profiles it
+    def slow_query(self, graph, name, route, query, params, seconds):
+        with self.lock:
+            self.slow_count[name] = self.slow_count.get(name, 0) + 1
+        slow_log.warning(json.dumps({
+            "event": "slow_query", "query": name, "route": route,
+            "ms": round(seconds * 1000, 2), "params": sorted(params),
+            "cypher": " ".join(query.split())[:500]}))
+        if WRITES.search(query) or random.random() >= self.profile_sample:
+            return
+        now = time.monotonic()
+        with self.lock:
+            if now - self.profiled.get(name, -self.profile_interval) < self.profile_interval:
+                return
+            self.profiled[name] = now
+            # a forked child cant use its parent's thread
+            if self.profiler is None or self.profiler_pid != os.getpid():
+                self.profiler = ThreadPoolExecutor(max_workers=1)
+                self.profiler_pid = os.getpid()
+        self.profiler.submit(self._profile, graph, name, query, params)
+
+    # Function: Profile
+    # Inputs: Self, graph, query name, Cypher, parameters
+    # Output: None
+    # Process: re-runs the query with PROFILE and logs the plan
+    def _profile(self, graph, name, query, params):
+        try:
+            cursor = graph.run("PROFILE " + query, params)
+            cursor.data()
+            plan = cursor.plan() if hasattr(cursor, "plan") else None
+            slow_log.warning(json.dumps({"event": "profile", "query": name,
+                                         "plan": str(plan)}))
+        except Exception:
+            log.exception("profiling %s failed", name)
+
+    # Function: Record Request
+    # Inputs: Self, RequestTrace
+    # Output: seconds the request took
+    def record_request(self, trace):
+        seconds = time.perf_counter() - trace.started
+        with self.lock:
+            hist = self.requests.get(trace.route)
+            if hist is None:
+                hist = self.requests[trace.route] = Histogram(LATENCY_BUCKETS)
+                self.request_queries[trace.route] = Histogram(COUNT_BUCKETS)
+            hist.observe(seconds)
+            self.request_queries[trace.route].observe(len(trace.queries))
+        return seconds
+
+    # Function: Render
+    # Inputs: Self
+    # Output: every metric in the Prometheus text format
+    def render(self):
+        lines = []
+        with self.lock:
+            self._histograms(lines, "recflix_query_seconds", "Query latency",
+                             {'query="%s",route="%s"' % (label(n), label(r)): h
+                              for (n, r), h in self.queries.items()})
+            self._counters(lines, "recflix_query_rows_total", "Rows read by queries",
+                           {'query="%s",route="%s"' % (label(n), label(r)): v
+                            for (n, r), v in self.rows.items()})
+            self._counters(lines, "recflix_query_errors_total", "Queries that raised",
+                           {'query="%s",route="%s"' % (label(n), label(r)): v
+                            for (n, r), v in self.errors.items()})
+            self._counters(lines, "recflix_slow_queries_total", "Queries over the slow threshold",
+                           {'query="%s"' % label(n): v for n, v in self.slow_count.items()})
+            self._histograms(lines, "recflix_request_seconds", "Request latency",
+                             {'route="%s"' % label(r): h for r, h in self.requests.items()})
+            self._histograms(lines, "recflix_request_queries", "Queries per request",
+                             {'route="%s"' % label(r): h
+                              for r, h in self.request_queries.items()})
+            self._gauges(lines, "recflix_startup_seconds", "Seconds each startup step took",
+                         {'step="%s"' % label(s): v for s, v in self.startup.items()})
+        return "\n".join(lines) + "\n"
+
+    def _counters(self, lines, metric, help_text, values):
+        lines.append("# HELP %s %s" % (metric, help_text))
+        lines.append("# TYPE %s counter" % metric)
+        for labels, value in sorted(values.items()):
+            lines.append("%s{%s} %s" % (metric, labels, value))
+
+    def _gauges(self, lines, metric, help_text, values):
+        lines.append("# HELP %s %s" % (metric, help_text))
+        lines.append("# TYPE %s gauge" % metric)
+        for labels, value in sorted(values.items()):
+            lines.append("%s{%s} %s" % (metric, labels, value))
+
+    def _histograms(self, lines, metric, help_text, hists):
+        lines.append("# HELP %s %s" % (metric, help_text))
+        lines.append("# TYPE %s histogram" % metric)
+        for labels, hist in sorted(hists.items()):
+            total = 0
+            for bound, count in zip(hist.bounds + ("+Inf",), hist.counts):
+                total += count
+                lines.append('%s_bucket{%s,le="%s"} %d' % (metric, labels, bound, total))
+            lines.append("%s_sum{%s} %s" % (metric, labels, hist.sum))
+            lines.append("%s_count{%s} %d" % (metric, labels, hist.count))
+
+
+class CountingCursor:
+    # Function: Constructor Function
+    # Inputs: Self, py2neo cursor, Registry, query name, route
+    # Output: None
+    # Process: passes everything through, counting the rows read
+    def __init__(self, cursor, registry, name, route):
+        self._cursor = cursor
+        self._registry = registry
+        self._name = name
+        self._route = route
+
+    def __iter__(self):
+        rows = 0
+        for record in self._cursor:
+            rows += 1
+            yield record
+        self._registry.add_rows(self._name, self._route, rows)
+
+    def data(self, *args, **kwargs):
+        rows = self._cursor.data(*args, **kwargs)
+        self._registry.add_rows(self._name, self._route, len(rows))
+        return rows
+
+    def evaluate(self, *args, **kwargs):
+        value = self._cursor.evaluate(*args, **kwargs)
+        self._registry.add_rows(self._name, self._route, 0 if value is None else 1)
+        return value
+
+    def __getattr__(self, attr):
+        return getattr(self._cursor, attr)
+
+
+class InstrumentedTransaction:
+    # Function: Constructor Function
+    # Inputs: Self, py2neo transaction, InstrumentedGraph
+    # Output: None
+    def __init__(self, tx, graph):
+        self._tx = tx
+        self._graph = graph
+
+    def run(self, query, parameters=None, **params):
+        return self._graph._timed(self._tx.run, query, parameters, params)
+
+    def commit(self):
+        return self._graph._call(self._tx.commit, "commit")
+
+    def rollback(self):
+        return self._graph._call(self._tx.rollback, "rollback")
+
+    def __getattr__(self, attr):
+        return getattr(self._tx, attr)
+
+
+class InstrumentedGraph:
+    # Function: Constructor Function
+    # Inputs: Self, py2neo graph, Registry
+    # Output: None
+    def __init__(self, graph, registry):
+        self._graph = graph
+        self._registry = registry
+
+    # Function: Timed
+    # Inputs: Self, function running the statement, Cypher, parameter dict,
+    # keyword parameters
+    # Output: CountingCursor over the function's cursor
+    def _timed(self, func, query, parameters, params):
+        registry = self._registry
+        name = registry.query_name()
+        started = time.perf_counter()
+        try:
+            cursor = func(query, parameters, **params)
+        except Exception:
+            registry.record_query(name, time.perf_counter() - started, error=True)
+            raise
+        seconds = time.perf_counter() - started
+        route = registry.record_query(name, seconds)
+        if seconds >= registry.slow:
+            registry.slow_query(self._graph, name, route, query,
+                                dict(parameters or {}, **params), seconds)
+        return CountingCursor(cursor, registry, name, route)
+
+    # Function: Call
+    # Inputs: Self, function, suffix added to the caller's name
+    # Output: the function's result
+    # Process: times a call that isnt a Cypher statement
+    def _call(self, func, suffix, *args):
+        registry = self._registry
+        name = "%s.%s" % (registry.query_name(), suffix)
+        started = time.perf_counter()
+        try:
+            result = func(*args)
+        except Exception:
+            registry.record_query(name, time.perf_counter() - started, error=True)
+            raise
+        registry.record_query(name, time.perf_counter() - started)
+        return result
+
+    def run(self, query, parameters=None, **params):
+        return self._timed(self._graph.run, query, parameters, params)
+
+    def evaluate(self, query, parameters=None, **params):
+        return self.run(query, parameters, **params).evaluate()
+
+    def begin(self, *args, **kwargs):
+        return InstrumentedTransaction(self._graph.begin(*args, **kwargs), self)
+
+    def merge(self, *args, **kwargs):
+        return self._call(lambda: self._graph.merge(*args, **kwargs), "merge")
+
+    def create(self, *args, **kwargs):
+        return self._call(lambda: self._graph.create(*args, **kwargs), "create")
+
+    def __getattr__(self, attr):
+        return getattr(self._graph, attr)
+
+
+# Function: Start Request
+# Inputs: route
+# Output: token for finish_request
+def start_request(route):
+    return current.set(RequestTrace(route))
+
+
+# Function: Finish Request
+# Inputs: Registry, token from start_request, flask response
+# Output: the response with a Server-Timing header
+# Process: records the request and describes its database time, the
+# total and the slowest few queries
+def finish_request(registry, token, response, top=5):
+    trace = current.get()
+    current.reset(token)
+    if trace is None:
+        return response
+    seconds = registry.record_request(trace)
+    queries = list(trace.queries)
+    db = sum(s for _, s in queries)
+    timing = ['db;dur=%.2f;desc="%d queries"' % (db * 1000, len(queries)),
+              "app;dur=%.2f" % (seconds * 1000)]
+    for i, (name, s) in enumerate(sorted(queries, key=lambda q: -q[1])[:top]):
+        timing.append('q%d;dur=%.2f;desc="%s"' % (i + 1, s * 1000, name))
+    response.headers["Server-Timing"] = ", ".join(timing)
+    return response
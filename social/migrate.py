@@ -0,0 +1,32 @@
+# Import libraries
+import argparse
+from . import schema
+from .models import graph
+
+# Applies the graph's pending migrations, see social/schema.py. Run it once
+# per release before starting the web processes, which only check that the
+# graph is up to date.
+#
+# Usage: python -m social.migrate [--status]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply the graph's pending migrations")
+    parser.add_argument("--status", action="store_true",
+                        help="list the pending migrations without applying them")
+    args = parser.parse_args(argv)
+
+    if args.status:
+        waiting = schema.pending(graph)
+        for version, name, _ in waiting:
+            print("pending %d: %s" % (version, name))
+        print("%d of %d migrations pending" % (len(waiting), len(schema.MIGRATIONS)))
+        return
+    done = schema.migrate(graph)
+    for version, name in done:
+        print("applied %d: %s" % (version, name))
+    print("graph is at version %d" % schema.MIGRATIONS[-1][0])
+
+
+if __name__ == "__main__":
+    main()
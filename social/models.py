@@ -1,14 +1,98 @@
 # Import libraries
-from py2neo import Graph, Node, Relationship, NodeMatcher
-from passlib.hash import bcrypt
+from py2neo import NodeMatcher
 from datetime import date, datetime, timedelta
 import time
-import uuid
+from . import config, feeds, recommender
+from .auth import AuthPool, RateLimiter
+from .browse import BrowseIndex
+from .connection import LazyGraph
+from .metrics import InstrumentedGraph, Registry
+from .ids import IdAllocator
+from .leaderboard import Leaderboards
+from .likes import LikeBuffer
+from .moviecache import MovieCache
+from .search import SearchIndex
+from .simusers import SimilarUsers
+from .snapshot import GraphSnapshot
+from .trending import TrendingEngine
+from .writer import make_post, post_writer
 
-# init graph object
-graph = Graph()
+# init query metrics
+metrics_registry = Registry(slow=config.SLOW_QUERY_MS / 1000.0,
+                            profile_sample=config.PROFILE_SAMPLE,
+                            profile_interval=config.PROFILE_INTERVAL)
+# init graph object, connected on first use in each process and every
+# query through it is timed
+graph = InstrumentedGraph(LazyGraph(max_connections=config.GRAPH_MAX_CONNECTIONS),
+                          metrics_registry)
 # init matcher object
 matcher = NodeMatcher(graph)
+# init search indexes over movie titles and usernames
+movie_index = SearchIndex()
+user_index = SearchIndex()
+# init password hashing pool and login attempt limits
+auth_pool = AuthPool(workers=config.AUTH_WORKERS, rounds=config.BCRYPT_ROUNDS,
+                     depth=config.AUTH_QUEUE, wait=config.AUTH_QUEUE_WAIT)
+user_logins = RateLimiter(config.LOGIN_USER_LIMIT, config.LOGIN_WINDOW)
+ip_logins = RateLimiter(config.LOGIN_IP_LIMIT, config.LOGIN_WINDOW)
+# init user id allocator
+user_ids = IdAllocator(graph, "User", block_size=config.USER_ID_BLOCK)
+# init write-behind queue for posts
+post_queue = post_writer(graph)
+# init trending counters and in memory leaderboards for the index page
+trending = TrendingEngine(refresh=config.TRENDING_REFRESH)
+leaderboards = Leaderboards(graph, trending, window=config.TRENDING_WINDOW,
+                            size=config.LEADERBOARD_SIZE, recent=config.LEADERBOARD_RECENT,
+                            ttl=config.LEADERBOARD_TTL)
+# init write-behind buffer for likes, committed likes update the leaderboards
+like_buffer = LikeBuffer(graph, batch_size=config.LIKE_BATCH_SIZE,
+                         interval=config.LIKE_FLUSH_INTERVAL, hot=config.LIKE_HOT_POSTS)
+like_buffer.on_like = leaderboards.post_liked
+like_buffer.on_unlike = leaderboards.post_unliked
+# init in process snapshot of the movie, genre, tag and rating graph
+snapshot = GraphSnapshot(compact_at=config.SNAPSHOT_COMPACT_AT,
+                         compact_every=config.SNAPSHOT_COMPACT_EVERY)
+# init cache of movie page data, served from the snapshot
+movie_cache = MovieCache(graph, snapshot, size=config.MOVIE_CACHE_SIZE,
+                         ttl=config.MOVIE_CACHE_TTL)
+# init faceted browse index of films by genre, decade and rating
+browse_index = BrowseIndex(ttl=config.BROWSE_TTL)
+# init MinHash index of users by the tags they use and films they rate
+similar_users = SimilarUsers(num_perm=config.SIMILAR_USERS_PERM, bands=config.SIMILAR_USERS_BANDS)
+
+
+# Function: Post Written
+# Inputs: post dict from make_post, row returned by the writer
+# Output: None
+# Process: updates the in memory models once a post is committed
+def post_written(post, row):
+    # fold the new rating into the user's recommendations
+    recommender.engine.fold_in(row["userid"], post["movid"], post["rating"])
+    # update the index page leaderboards
+    leaderboards.post_added(post, row)
+    # the film's page now has a new review
+    movie_cache.invalidate(post["movid"])
+    # the rating is a new RATED edge in the snapshot
+    snapshot.add_rating(row["userid"], post["movid"], post["rating"])
+    # the user's tags and rated films feed the similar users index
+    similar_users.add(post["username"], post["tags"], post["movid"])
+    # the rating moves the film in the browse index
+    browse_index.rated(post["movid"], post["rating"], post["timestamp"], row["previous"])
+
+
+# Function: Bulk Add Posts
+# Inputs: list of dicts with username, title, tags, rating, text, movid
+# and optionally timestamp
+# Output: number of posts written
+# Process: import path for batches of reviews, writes them in grouped
+# transactions without going through the queue
+def bulk_add_posts(posts):
+    posts = [make_post(**p) for p in posts]
+    rows = {row["postid"]: row for row in post_queue.write_many(posts)}
+    for post in posts:
+        if post["postid"] in rows:
+            post_written(post, rows[post["postid"]])
+    return len(rows)
 
 
 # user class containing user functions
@@ -44,149 +128,124 @@ class User:
         # return whole user node
         return graph.run(query, username=username).data()
 
+    # Function: Password Hash
+    # Inputs: Self
+    # Output: the user's stored password hash, None if the user doesnt exist
+    # Process: one lookup on the username index returning just the hash,
+    # rather than pulling the whole node
+    def password_hash(self):
+        query = """
+        MATCH (user:User)
+        WHERE user.username = {username}
+        RETURN user.password
+        """
+        return graph.evaluate(query, username=self.username)
+
     # Function: Register User
     # Inputs: Self, Password
     # Output: True or False
-    # Process: finds user, if doesnt exist -finds the last id used and adds 1.
-    # if does exist run bcrypt verify function on stored password
-    # then creates user with userid username and password inputted
-    # which is encrypted by bcrypt
+    # Process: looks up the user, if doesnt exist - takes the next id from the
+    # user id allocator and creates the user with userid, username and
+    # password inputted which is hashed in the auth pool.
+    # The create is a MERGE on username so two signups racing for the
+    # same name can't both succeed
     def register(self, password):
-        # if the user doesnt exist - find on username
-        if not self.find():
-            # search for the highest userId
+        # if the user doesnt exist - checked first so taken names cost no hash
+        if self.password_hash() is None:
+            userId = user_ids.next_id()
             query = """
-            MATCH (u:User) RETURN u.userid
-            ORDER BY u.userid DESC
-            LIMIT 1;
+            MERGE (u:User {username: {username}})
+            ON CREATE SET u.userid = {userid}, u.password = {password}
+            RETURN u.userid = {userid}
             """
-            # store query result in variable
-            lastid = graph.evaluate(query)
-            # add one to the id
-            userId = int(lastid) + 1
-            # create node with relevant properties
-            user = Node("User", userid=userId, username=self.username, password=bcrypt.encrypt(password))
-            graph.create(user)
-            # if user created return true
-            return True
+            # true if this call created the user
+            created = bool(graph.evaluate(query, username=self.username, userid=userId,
+                                          password=auth_pool.hash(password)))
+            if created:
+                # make the new user searchable
+                user_index.add({"username": self.username, "userid": userId}, self.username)
+            return created
         # if user found return false
         return False
 
     # Function: Verify Password
     # Inputs: Self, Password
     # Output: True or False
-    # Process: finds user, if doesnt exist - return false.
-    # if does exist run bcrypt verify function on stored password
-    # and inputted password - returns either true or false
+    # Process: fetches the stored hash, if the user doesnt exist - return false.
+    # if does exist check the inputted password against it in the auth pool.
+    # A hash made at an old bcrypt cost is replaced with one at the
+    # configured cost once the password is known to be right
     def verify_password(self, password):
-        # find  user and store in variable
-        user = self.find()
+        # stored hash, None if the user doesnt exist
+        hashed = self.password_hash()
         # if user doesnt exist
-        if not user:
+        if not hashed:
             # return false
             return False
-        # else, verify password with bcrypt lib which returns true or false
-        return bcrypt.verify(password, user["password"])
+        # else, verify password which returns true or false
+        ok, rehashed = auth_pool.check(password, hashed)
+        if rehashed:
+            query = """
+            MATCH (user:User)
+            WHERE user.username = {username} AND user.password = {old}
+            SET user.password = {new}
+            """
+            graph.run(query, username=self.username, old=hashed, new=rehashed)
+        return ok
 
     # Function: Add Post
     # Inputs: Title, Tags, Rating, Text, MovieID
     # Output: N/A
-    # Process: finds user and adds post node related to user.
-    # Tags are then stripped to list of words and added to
-    # tag node
+    # Process: builds the post with its tags stripped to a list of lower
+    # cased words, then writes the post, its relationships and tags in
+    # one transaction through the write-behind queue. Raises TimeoutError
+    # if it isnt committed within POST_TIMEOUT, it may still be later
     def add_post(self, title, tags, rating, text, movid):
-        # find user and store in variable
-        user = self.find()
-        movid = int(movid)
-        movie = Movie.find_film(movid)
-        # create post node with form inputs
-        post = Node(
-            "Post",
-            postid=str(uuid.uuid4()),
-            title=title,
-            rating=rating,
-            text=text,
-            movid=movid,
-            timestamp=int(datetime.now().strftime("%s")),
-            date=datetime.now().strftime("%F")
-        )
-        # create the "published" relationship between user and post
-        rel = Relationship(user, "PUBLISHED", post)
-        graph.create(rel)
-        # create the "published" relationship between user and post
-        rel = Relationship(post, "REVIEWED", movie)
-        graph.create(rel)
-        # create the "rated" relationship between user and movie
-        rel = Relationship(user, "RATED", movie, rating=rating)
-        graph.create(rel)
-        # store stripped and lower cased tags into list
-        tags = [x.strip() for x in tags.lower().split(",")]
-        # for each distinct tag
-        for name in set(tags):
-            # merge tag, so that only one node represents each unique tag
-            tag = Node('Tag', name=name)
-            graph.merge(tag, 'Tag', 'name')
-            # create relationship between tag and post
-            rel = Relationship(tag, 'TAGGED', post)
-            graph.create(rel)
+        post = make_post(self.username, title, tags, rating, text, movid)
+        # wait until the post is committed
+        row = post_queue.submit(post).result(timeout=config.POST_TIMEOUT)
+        # row is empty if the user or movie doesnt exist
+        if row:
+            post_written(post, row)
 
     # Function: Like Post
     # Inputs: Post_id
-    # Output: None
-    # Process: user who is viewing post is stored in variable,
-    # finds the post using post_id and the matcher object
-    # then creates relationship between the two
+    # Output: True if the user hadnt already liked the post
+    # Process: the like is buffered and written behind with others, the
+    # LIKES edge and the post's like_count change together, see social/likes.py
     def like_post(self, postid):
-        # store user viewing post in variable
-        user = self.find()
-        # finds post using matcher object
-        post = matcher.match("Post", postid=postid).first()
-        # creates relationship between user and post
-        rel = Relationship(user, 'LIKES', post)
-        # merges it so that only one relationship can be created
-        graph.merge(rel)
+        return bool(self.like_posts([postid]))
+
+    # Function: Like Posts
+    # Inputs: Self, list of post ids
+    # Output: list of the post ids the user hadnt already liked
+    def like_posts(self, postids):
+        return like_buffer.like(self.username, postids)
+
+    # Function: Unlike Posts
+    # Inputs: Self, list of post ids
+    # Output: list of the post ids the user had liked
+    def unlike_posts(self, postids):
+        return like_buffer.unlike(self.username, postids)
 
     # Function: Recent post
     # Inputs:Self, number of posts
-    # Output: result of query
-    # Process: runs cypher query to return n recent posts from username
+    # Output: list of post rows
+    # Process: first page of the user's feed, newest first, with each post's
+    # tags and like count
     def recent_posts(self, n):
-        # find posts that user has posted, on the username
-        # returns the whole post, and the tags in a list
-        # ordered by date of post
-        query = """
-        MATCH (user:User)-[:PUBLISHED]->(post:Post)
-        Where user.username = {username}
-        OPTIONAL MATCH (post:Post)<-[:TAGGED]-(tag:Tag)
-        OPTIONAL MATCH (post)-[:REVIEWED]->(movie:Movie)
-        RETURN user.username as username, post, COLLECT(COALESCE(tag.name)) as tags,
-        movie.title as movTitle
-        ORDER BY post.date DESC
-        Limit {n}
-        """
-        # returns the result of the query
-        return graph.run(query, username=self.username, n=n)
+        rows, _ = feed_page("user", self.username, n)
+        return rows
 
     # Function: Get Similar Users
     # Inputs: Self
     # Output: result of query
     # Process: runs cypher query to return n similar using tags
     def get_similar_users(self):
-        # get user's posts with tags, where username is the username of logged in user
-        # and the logged in user isnt the same as the other user
-        # get the other user and the tags which are similar
-        # order by the amount of similar tags and limit to 3
-        # return the user and the tags
-        query = '''
-            MATCH (you:User)-[:PUBLISHED]->(:Post)<-[:TAGGED]-(tag:Tag),
-                  (they:User)-[:PUBLISHED]->(:Post)<-[:TAGGED]-(tag)
-            WHERE you.username = {username} AND you <> they
-            WITH they, COLLECT(DISTINCT tag.name) AS tags
-            ORDER BY SIZE(tags) DESC LIMIT 5
-            RETURN they.username AS similar_user, tags
-            '''
-        # return the result of the query
-        return graph.run(query, username=self.username)
+        # candidates come from the MinHash buckets of the user's tags and
+        # rated films, ranked by shared tags then shared films
+        # return the 5 most similar users and the tags they have in common
+        return similar_users.similar(self.username, 5)
 
 # user class containing user functions
 class Movie:
@@ -197,81 +256,54 @@ class Movie:
     def __init__(self, mov_id):
         self.mov_id = mov_id
 
-    def find_film(mov_id):
-        movie = matcher.match("Movie", movieID=mov_id).first()
-        return movie
-
-    def get_film_data(mov_id):
-        query = """
-        MATCH (m:Movie)-[:KEYWORD]-(t:Tag)
-        WHERE m.movieID = {mov_id}
-        RETURN m.budget as budget, m.featcrew as featcrew, 
-        COLLECT(COALESCE(t.name)) as keywords, m.lang as lang, m.movieID as movieID,
-        m.overview as overview, m.poster as poster, m.revenue as revenue, 
-        m.runtime as runtime, m.title as title, m.year as year, m.ytlink as ytlink
-        """
-        return graph.run(query, mov_id = mov_id).data()
-
-    def get_film_genres(mov_id):
-        query = """
-        MATCH (m:Movie)-[:HAS_GENRE]->(g:Genre)
-        WHERE m.movieID = {mov_id}
-        RETURN COLLECT(COALESCE(g.name)) as genres
-        """
-        return graph.run(query, mov_id = mov_id).data()
-
+    # Function: Get Details
+    # Inputs: movie id
+    # Output: MovieRecord with everything the movie page shows, or None
+    # if the film doesnt exist
+    # Process: served from the movie cache, films without precomputed
+    # similar films get them from the live join once
+    def get_details(mov_id):
+        film = movie_cache.get(mov_id)
+        if film is not None and not film.similar:
+            film.similar = Movie.get_similar_films(mov_id)
+        return film
 
     def movie_recent_posts(n, movid):
-        # find posts that were published with date the same as today,
-        # return post ordered by time
-        query = """
-        MATCH(post:Post)-[:REVIEWED]->(movie:Movie)
-        Where movie.movieID = {movid}
-        OPTIONAL MATCH (post:Post)<-[:TAGGED]-(tag:Tag)
-        OPTIONAL MATCH (user:User)-[:PUBLISHED]->(post:Post)
-        RETURN user.username as username, post, COLLECT(COALESCE(tag.name)) as tags,
-        movie.title as movTitle
-        ORDER BY post.date DESC
-        Limit {n}
-        """
-        return graph.run(query, movid=movid, n=n)
+        # first page of the film's feed, newest first
+        rows, _ = feed_page("movie", movid, n)
+        return rows
 
+    # Function: Rated Films
+    # Inputs: "top" or "trending"
+    # Output: list of 10 films
+    # Process: served from the in memory leaderboards, top is the highest
+    # total rating and trending the most recent activity, decayed over time
     def rated_films(opt):
-        # find posts that were published with date the same as today,
-        # return post ordered by time
         if opt == "top":
-            query = """
-            MATCH (post:Post)-[:REVIEWED]->(movie:Movie)
-            WITH movie, SUM(toInteger(post.rating)) AS a
-            RETURN movie.title as title, movie.movieID as movieID, movie.poster as poster
-            ORDER BY a DESC
-            LIMIT 10
-            """
-            return graph.run(query)
+            return leaderboards.top_rated(10)
         elif opt == "trending":
-            query = """
-            MATCH (post:Post)-[:REVIEWED]->(movie:Movie)
-            WITH movie, post, AVG(toInteger(post.timestamp))/{today} as b, movie.movieID as e
-            ORDER BY b DESC
-            MATCH (post)-[:REVIEWED]->(movie)
-            WHERE movie.movieID = e
-            RETURN distinct movie.title as title,  movie.movieID as movieID, movie.poster as poster
-            LIMIT 10
-            """
-            today = int(datetime.now().strftime("%s"))
-            return graph.run(query, today=today)
+            return leaderboards.trending(10)
+
+    # Function: Trending Films
+    # Inputs: number of films, window ("24h", "7d" or "30d"), optional genre
+    # Output: list of films, most trending first
+    # Process: reads the decayed activity scores from the trending engine
+    def trending_films(n=10, window="7d", genre=None):
+        return leaderboards.trending(n, window, genre)
 
+    # Function: Recommend Films
+    # Inputs: user id
+    # Output: list of films, best first
+    # Process: reads the ranked movie ids precomputed by the matrix
+    # factorisation engine. Users the engine hasnt seen fall back to
+    # walking RATED -> SIMILAR in the snapshot
     def recommend_films(user_id):
-            query = """
-            MATCH (u1:User)-[:RATED]->(m3:Movie)
-            WHERE u1.userid = {user_id}
-            WITH [i in m3.movieID | i] as movies
-            MATCH (u1)-[r:RATED]->(m1:Movie)-[s:SIMILAR]->(mo:Movie)
-            WHERE u1.userid = {user_id} and r.rating > 3 and not mo.movieID in movies
-            RETURN mo.title as title, mo.movieID as movieID, mo.poster as poster
-            LIMIT 10
-            """
-            return graph.run(query, user_id= user_id).data()
+        movie_ids = recommender.engine.recommend(user_id, 10)
+        if movie_ids is None:
+            movie_ids = snapshot.recommend(user_id, 10)
+        if movie_ids is None:
+            return []
+        return film_cards(movie_ids)
 
     def recommend_recent_films(user_id):
         today = date.today()
@@ -291,57 +323,105 @@ class Movie:
         return graph.run(query, user_id= user_id, timestamp=timestamp ).data()
 
 
+    # Function: Get Similar Films
+    # Inputs: movie id
+    # Output: list of up to 10 films
+    # Process: reads the scored SIMILAR neighbours precomputed by
+    # pipeline.similarity from the snapshot, best first. Films without
+    # precomputed neighbours fall back to films sharing a keyword and a
+    # genre, most shared genres then keywords first
     def get_similar_films(mov_id):
-        query = """
-        MATCH (t:Tag)-[:KEYWORD]-(m:Movie)-[:HAS_GENRE]->(g:Genre),
-        (t)-[:KEYWORD]-(m2:Movie)-[:HAS_GENRE]->(g)
-        WHERE m.movieID = {mov_id} AND m <> m2
-        WITH m2, COLLECT(DISTINCT t.name) AS tags, COLLECT(DISTINCT g.name) AS genres
-        order by SIZE(genres) DESC, SIZE(tags) DESC
-        limit 10
-        RETURN distinct m2.title as title, m2.movieID as movieID,m2.poster as poster
-        """
-        return graph.run(query, mov_id= mov_id).data()
+        movie_ids = snapshot.similar_films(mov_id, 10) or snapshot.related_films(mov_id, 10)
+        return film_cards(movie_ids)
 
-# Function: Todays Recent Postss
-# Inputs: number of posts
-# Output: result of query
-# Process: find most n most recent posts
-# return post node as well as tags and username ordered by time
-def todays_recent_posts(n):
-    # find posts that were published with date the same as today,
-    # return post ordered by time
+
+# Function: Film Cards
+# Inputs: list of movie ids
+# Output: list of {title, movieID, poster} in the same order
+# Process: served from the snapshot when it holds the films' properties,
+# otherwise fetched in one query
+def film_cards(movie_ids):
+    if not movie_ids:
+        return []
+    films = snapshot.cards(movie_ids)
+    if films is not None:
+        return films
     query = """
-    MATCH (user:User)-[:PUBLISHED]->(post:Post)<-[:TAGGED]-(tag:Tag)
-    MATCH (post:Post)-[:REVIEWED]->(movie:Movie) 
-    RETURN user.username as username, post, COLLECT(COALESCE(tag.name)) as tags,
-    movie.title as movTitle
-    ORDER BY post.timestamp DESC LIMIT {n}
+    MATCH (mo:Movie)
+    WHERE mo.movieID IN {movie_ids}
+    RETURN mo.title as title, mo.movieID as movieID, mo.poster as poster
     """
-    # store todays date in variable
-    today = datetime.now().strftime("%F")
-    return graph.run(query, n=n)
+    films = {row["movieID"]: row for row in graph.run(query, movie_ids=movie_ids).data()}
+    # keep the given order
+    return [films[i] for i in movie_ids if i in films]
 
-# Function: Todays Recent Posts
+# Function: Todays Recent Postss
 # Inputs: number of posts
 # Output: result of query
 # Process: find most n most recent posts
 # return post node as well as tags and username ordered by time
+def todays_recent_posts(n):
+    # served from the leaderboards' ring buffer when it holds enough posts
+    if n <= config.LEADERBOARD_RECENT:
+        return leaderboards.recent_posts(n)
+    # otherwise the first page of the feed of every post
+    rows, _ = feed_page("all", n=n)
+    return rows
+
+# Function: Feed Page
+# Inputs: scope ("all", "user" or "movie"), username or movie id, posts per
+# page, cursor from the previous page
+# Output: (list of post rows, cursor for the next page or None)
+# Process: the page size is capped so one request cant read the whole feed,
+# like counts include likes still buffered
+def feed_page(scope, key=None, n=config.FEED_PAGE_SIZE, after=None):
+    n = max(1, min(n, config.FEED_MAX_PAGE))
+    rows, following = feeds.page(graph, scope, key, n, after)
+    return like_buffer.seen(rows), following
+
+# Function: Query Search
+# Inputs: "User" or "Movie", search text
+# Output: list of up to 20 matches, best first
+# Process: looks the text up in the in memory search index, movies then
+# get their overview in one query
 def query_search(obj, text):
-    # find posts that were published with date the same as today,
-    # return post ordered by time
     if obj == "User":
-        query = """
-            MATCH(m:User)
-            WHERE LOWER(m.username) CONTAINS {text}
-            RETURN m.username as username, m.userid as userid
-            LIMIT 20
-         """
+        return user_index.search(text, 20)
     elif obj == "Movie":
+        movie_ids = [doc["movieID"] for doc in movie_index.search(text, 20)]
         query = """
             MATCH(m:Movie)
-            WHERE LOWER(m.title) CONTAINS {text}
+            WHERE m.movieID IN {movie_ids}
             RETURN m.title as title, m.year as year, m.overview as text, m.movieID as movieID
-            LIMIT 20
          """
-    return graph.run(query, text=text)
+        films = {row["movieID"]: row for row in graph.run(query, movie_ids=movie_ids).data()}
+        # keep the index's ranking
+        return [films[i] for i in movie_ids if i in films]
+
+
+# Function: Browse Films
+# Inputs: genre names, first year of a decade, lowest average rating,
+# sort ("rating", "reviews" or "recent"), films per page, cursor from the
+# previous page
+# Output: (list of {title, movieID, poster, avgrating, reviews} best first,
+# cursor for the next page or None)
+# Process: pages through the browse index, then fills in the film cards
+def browse_films(genres=(), decade=None, min_rating=None, sort="reviews",
+                 n=config.BROWSE_PAGE_SIZE, after=None):
+    found, following = browse_index.browse(genres, decade, min_rating, sort,
+                                           max(1, min(n, config.BROWSE_MAX_PAGE)), after)
+    cards = {film["movieID"]: film for film in film_cards([m for m, _, _ in found])}
+    films = []
+    for movie_id, average, reviews in found:
+        if movie_id in cards:
+            films.append(dict(cards[movie_id], avgrating=average, reviews=reviews))
+    return films, following
+
+
+# Function: Autocomplete
+# Inputs: "User" or "Movie", search text, number of suggestions
+# Output: list of matches straight from the search index
+def autocomplete(obj, text, n=10):
+    if obj == "User":
+        return user_index.search(text, n)
+    return movie_index.search(text, n)
@@ -0,0 +1,159 @@
+# Import libraries
+import ast
+import threading
+import time
+from collections import OrderedDict
+from . import feeds
+
+# Movie page data.
+# Everything the movie page shows (the film, its genres, keywords, similar
+# films and latest reviews) is kept in a bounded LRU cache of compact
+# MovieRecords. The film, genres, keywords and similar films come from the
+# graph snapshot, so a miss only asks the graph for the latest reviews, the
+# first page of the film's feed. Films the snapshot doesnt hold (added since
+# it was built) are fetched with one projection query instead. featcrew is
+# parsed once when the record is built. A film's record is dropped when it
+# gets a new post, and once it is older than ttl seconds, as posts written
+# through other processes don't drop it here.
+
+DETAIL_QUERY = """
+MATCH (m:Movie)
+WHERE m.movieID = {mov_id}
+OPTIONAL MATCH (m)-[:HAS_GENRE]->(g:Genre)
+WITH m, COLLECT(DISTINCT g.name) AS genres
+OPTIONAL MATCH (m)<-[:KEYWORD]-(t:Tag)
+WITH m, genres, COLLECT(DISTINCT t.name) AS keywords
+OPTIONAL MATCH (m)-[s:SIMILAR]->(m2:Movie)
+WITH m, genres, keywords, s, m2
+ORDER BY s.score DESC
+WITH m, genres, keywords,
+COLLECT(CASE WHEN m2 IS NULL THEN NULL
+        ELSE {title: m2.title, movieID: m2.movieID, poster: m2.poster} END)[..10] AS similar
+OPTIONAL MATCH (post:Post)-[:REVIEWED]->(m)
+WITH m, genres, keywords, similar, post
+ORDER BY post.timestamp DESC
+LIMIT {posts}
+OPTIONAL MATCH (user:User)-[:PUBLISHED]->(post)
+OPTIONAL MATCH (post)<-[:TAGGED]-(tag:Tag)
+WITH m, genres, keywords, similar, post, user, COLLECT(tag.name) AS tags
+ORDER BY post.timestamp DESC
+RETURN m AS movie, genres, keywords, similar,
+COLLECT(CASE WHEN post IS NULL THEN NULL
+        ELSE {username: user.username, post: post, tags: tags} END) AS posts
+"""
+
+
+# Function: Parse Featcrew
+# Inputs: featcrew string as stored by the loader
+# Output: dict of crew member -> role, empty string if there is none
+def parse_featcrew(featcrew):
+    if not featcrew or featcrew == "-":
+        return ""
+    try:
+        crew = ast.literal_eval(featcrew)
+    except (ValueError, SyntaxError):
+        return ""
+    return crew if isinstance(crew, dict) else ""
+
+
+# MovieRecord: everything the movie page renders for one film
+class MovieRecord:
+    __slots__ = ("movieID", "title", "year", "overview", "poster", "lang", "ytlink",
+                 "runtime", "budget", "revenue", "featcrew", "genres", "keywords",
+                 "similar", "posts")
+
+    # Function: From Row
+    # Inputs: row returned by DETAIL_QUERY
+    # Output: MovieRecord
+    @classmethod
+    def from_row(cls, row):
+        title = row["movie"]["title"]
+        posts = [{"username": p["username"], "post": dict(p["post"]),
+                  "tags": p["tags"], "movTitle": title} for p in row["posts"]]
+        return cls.make(row["movie"], row["genres"], row["keywords"], row["similar"], posts)
+
+    # Function: Make
+    # Inputs: dict of the film's properties, genre names, keyword names,
+    # similar film cards, post rows
+    # Output: MovieRecord
+    @classmethod
+    def make(cls, movie, genres, keywords, similar, posts):
+        record = cls()
+        record.movieID = movie["movieID"]
+        record.title = movie["title"]
+        record.year = movie["year"]
+        record.overview = movie["overview"]
+        record.poster = movie["poster"]
+        record.lang = movie["lang"]
+        record.ytlink = (movie["ytlink"] or "").replace("watch?v=", "embed/")
+        record.runtime = movie["runtime"]
+        record.budget = movie["budget"]
+        record.revenue = movie["revenue"]
+        record.featcrew = parse_featcrew(movie["featcrew"])
+        record.genres = ", ".join(genres)
+        record.keywords = ", ".join(keywords)
+        record.similar = similar
+        record.posts = posts
+        return record
+
+
+class MovieCache:
+    # Function: Constructor Function
+    # Inputs: Self, graph, GraphSnapshot, most films kept, recent posts kept
+    # per film, seconds a film is kept (0 for no limit)
+    # Output: None
+    def __init__(self, graph, snapshot, size=2048, posts=5, ttl=0):
+        self.graph = graph
+        self.snapshot = snapshot
+        self.size = size
+        self.posts = posts
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.records = OrderedDict()
+
+    # Function: Get
+    # Inputs: Self, movie id
+    # Output: MovieRecord, or None if the film doesn't exist
+    # Process: serves the cached record while it is fresh, otherwise builds
+    # it from the snapshot and the film's feed, or the projection query, and
+    # caches it, evicting the least recently used film
+    def get(self, mov_id):
+        now = time.time()
+        with self.lock:
+            record, built = self.records.get(mov_id, (None, 0))
+            if record is not None and (not self.ttl or now - built < self.ttl):
+                self.records.move_to_end(mov_id)
+                return record
+        record = self.from_snapshot(mov_id)
+        if record is None:
+            row = self.graph.run(DETAIL_QUERY, mov_id=mov_id, posts=self.posts).data()
+            if not row:
+                return None
+            record = MovieRecord.from_row(row[0])
+        with self.lock:
+            self.records[mov_id] = (record, now)
+            self.records.move_to_end(mov_id)
+            while len(self.records) > self.size:
+                self.records.popitem(last=False)
+        return record
+
+    # Function: From Snapshot
+    # Inputs: Self, movie id
+    # Output: MovieRecord, None if the snapshot doesnt hold the film
+    # Process: one graph query, for the latest posts
+    def from_snapshot(self, mov_id):
+        film = self.snapshot.film(mov_id)
+        if film is None:
+            return None
+        similar = self.snapshot.cards(self.snapshot.similar_films(mov_id, 10)) or []
+        posts, _ = feeds.page(self.graph, "movie", mov_id, self.posts)
+        return MovieRecord.make(film, self.snapshot.film_genres(mov_id),
+                                self.snapshot.film_keywords(mov_id), similar, posts)
+
+    # Function: Invalidate
+    # Inputs: Self, movie id
+    # Output: None
+    # Process: drops the film so its next view picks up new posts
+    def invalidate(self, mov_id):
+        with self.lock:
+            self.records.pop(mov_id, None)
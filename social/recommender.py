@@ -0,0 +1,253 @@
+# Import libraries
+import csv
+import threading
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import svds
+from . import config
+
+
+# Matrix factorisation recommender.
+# The user x movie rating matrix is held as a scipy CSR matrix and factorised
+# into user factors P and movie factors Q so that scores = P . Q^T.
+#  - "svd" is a truncated (pure) SVD: Q holds the right singular vectors,
+#    so a user's factors are just their rating row projected onto Q.
+#  - "nmf" is non-negative matrix factorisation with multiplicative updates.
+# A ranked top-n list is precomputed for every user so serving is a lookup,
+# and fold_in() updates a single user's factors when they rate something new.
+class Recommender:
+    # Function: Constructor Function
+    # Inputs: Self, method ("svd"/"nmf"), number of factors, top n to precompute
+    # Output: None
+    # Process: stores settings, the model is empty until fit is called
+    def __init__(self, method="svd", factors=50, top_n=50, nmf_iters=100):
+        if method not in ("svd", "nmf"):
+            raise ValueError("unknown recommender method: %s" % method)
+        self.method = method
+        self.factors = factors
+        self.top_n = top_n
+        self.nmf_iters = nmf_iters
+        self.lock = threading.Lock()
+        self.trained = False
+
+    # Function: Fit
+    # Inputs: Self, sequences of user ids, movie ids and ratings
+    # Output: Self
+    # Process: maps ids to dense indexes, builds the sparse rating matrix,
+    # factorises it and precomputes every user's top n
+    def fit(self, user_ids, movie_ids, ratings):
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        ratings = np.asarray(ratings, dtype=np.float32)
+        # dense index for every distinct user and movie id
+        users, rows = np.unique(user_ids, return_inverse=True)
+        movies, cols = np.unique(movie_ids, return_inverse=True)
+        # keep only the latest rating when a (user, movie) pair repeats
+        keys = rows.astype(np.int64) * len(movies) + cols
+        _, last = np.unique(keys[::-1], return_index=True)
+        keep = len(keys) - 1 - last
+        matrix = sparse.csr_matrix((ratings[keep], (rows[keep], cols[keep])),
+                                   shape=(len(users), len(movies)),
+                                   dtype=np.float32)
+        if self.method == "svd":
+            user_factors, item_factors = self._fit_svd(matrix)
+        else:
+            user_factors, item_factors = self._fit_nmf(matrix)
+        top = self._rank(user_factors, item_factors, matrix)
+        with self.lock:
+            self.movies = movies
+            self.movie_index = {int(m): i for i, m in enumerate(movies)}
+            self.user_index = {int(u): i for i, u in enumerate(users)}
+            self.matrix = matrix.tolil()
+            self.user_factors = user_factors
+            self.item_factors = item_factors
+            self.item_gram = item_factors.T @ item_factors
+            self.top = top
+            self.trained = True
+        return self
+
+    # Function: Fit CSV
+    # Inputs: Self, path to a ratings csv (rating,userId,movieId)
+    # Output: Self
+    # Process: reads the csv into arrays and fits the model
+    def fit_csv(self, path=config.RATINGS_CSV):
+        users, movies, ratings = [], [], []
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                users.append(int(row["userId"]))
+                movies.append(int(row["movieId"]))
+                ratings.append(float(row["rating"]))
+        return self.fit(users, movies, ratings)
+
+    # Function: Fit Graph
+    # Inputs: Self, py2neo graph
+    # Output: Self
+    # Process: pulls every RATED edge in one query and fits the model
+    def fit_graph(self, graph):
+        query = """
+        MATCH (u:User)-[r:RATED]->(m:Movie)
+        RETURN u.userid as userid, m.movieID as movieID, toFloat(r.rating) as rating
+        """
+        users, movies, ratings = [], [], []
+        for row in graph.run(query):
+            if row["userid"] is None or row["movieID"] is None or row["rating"] is None:
+                continue
+            users.append(row["userid"])
+            movies.append(row["movieID"])
+            ratings.append(row["rating"])
+        return self.fit(users, movies, ratings)
+
+    # Function: Fit SVD
+    # Inputs: Self, sparse rating matrix
+    # Output: user factors, item factors
+    # Process: truncated svd, user factors are R.V so fold in is exact
+    def _fit_svd(self, matrix):
+        k = max(1, min(self.factors, min(matrix.shape) - 1))
+        _, _, vt = svds(matrix.astype(np.float64), k=k)
+        item_factors = np.ascontiguousarray(vt.T, dtype=np.float32)
+        user_factors = np.asarray(matrix @ item_factors, dtype=np.float32)
+        return user_factors, item_factors
+
+    # Function: Fit NMF
+    # Inputs: Self, sparse rating matrix
+    # Output: user factors, item factors
+    # Process: Lee & Seung multiplicative updates on R ~ W.H
+    def _fit_nmf(self, matrix):
+        k = max(1, min(self.factors, min(matrix.shape)))
+        rng = np.random.RandomState(0)
+        scale = np.sqrt(matrix.data.mean() / k) if matrix.nnz else 1.0
+        w = rng.rand(matrix.shape[0], k).astype(np.float32) * scale
+        h = rng.rand(k, matrix.shape[1]).astype(np.float32) * scale
+        eps = np.float32(1e-9)
+        matrix_t = matrix.T.tocsr()
+        for _ in range(self.nmf_iters):
+            h *= np.asarray(matrix_t @ w).T / (w.T @ w @ h + eps)
+            w *= np.asarray(matrix @ h.T) / (w @ (h @ h.T) + eps)
+        return w, np.ascontiguousarray(h.T)
+
+    # Function: Rank
+    # Inputs: Self, user factors, item factors, rating matrix, block size
+    # Output: int32 array of item indexes, one ranked row per user
+    # Process: scores users a block at a time, masks films already rated
+    # and keeps the top n of each row
+    def _rank(self, user_factors, item_factors, matrix, block=1024):
+        n = min(self.top_n, item_factors.shape[0])
+        top = np.empty((user_factors.shape[0], n), dtype=np.int32)
+        for start in range(0, user_factors.shape[0], block):
+            stop = min(start + block, user_factors.shape[0])
+            scores = user_factors[start:stop] @ item_factors.T
+            seen = matrix[start:stop].tocoo()
+            scores[seen.row, seen.col] = -np.inf
+            top[start:stop] = self._top_rows(scores, n)
+        return top
+
+    # Function: Top Rows
+    # Inputs: 2d score array, n
+    # Output: indexes of the n best scores per row, best first
+    # Process: argpartition then sort only the n kept columns
+    @staticmethod
+    def _top_rows(scores, n):
+        if n < scores.shape[1]:
+            part = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+        else:
+            part = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+        order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1)
+        return np.take_along_axis(part, order, axis=1)
+
+    # Function: Recommend
+    # Inputs: Self, user id, number of films
+    # Output: list of movie ids best first, or None if the user is unknown
+    # Process: reads the precomputed top n for the user
+    def recommend(self, user_id, n=10):
+        if not self.trained:
+            return None
+        row = self.user_index.get(int(user_id))
+        if row is None:
+            return None
+        return self.movies[self.top[row, :n]].tolist()
+
+    # Function: Fold In
+    # Inputs: Self, user id, movie id, rating
+    # Output: None
+    # Process: writes the rating into the user's row, recomputes that user's
+    # factors against the fixed item factors and re-ranks just that user.
+    # Films unknown to the model are ignored until the next full retrain.
+    def fold_in(self, user_id, movie_id, rating):
+        if not self.trained:
+            return
+        col = self.movie_index.get(int(movie_id))
+        if col is None:
+            return
+        with self.lock:
+            row = self.user_index.get(int(user_id))
+            if row is None:
+                # first rating for a new user, grow the model by one row
+                row = len(self.user_index)
+                self.matrix.resize((row + 1, self.matrix.shape[1]))
+                self.user_factors = np.vstack(
+                    [self.user_factors, np.zeros((1, self.item_factors.shape[1]), dtype=np.float32)])
+                self.top = np.vstack([self.top, np.zeros((1, self.top.shape[1]), dtype=np.int32)])
+                self.user_index[int(user_id)] = row
+            self.matrix[row, col] = float(rating)
+            ratings = self.matrix.getrowview(row)
+            cols = np.asarray(ratings.rows[0], dtype=np.int64)
+            values = np.asarray(ratings.data[0], dtype=np.float32)
+            self.user_factors[row] = self._fold_in_factors(cols, values)
+            scores = self.item_factors @ self.user_factors[row]
+            scores[cols] = -np.inf
+            self.top[row] = self._top_rows(scores[np.newaxis, :], self.top.shape[1])[0]
+
+    # Function: Fold In Factors
+    # Inputs: Self, rated item indexes, rating values
+    # Output: the user's factor vector
+    # Process: svd is the exact projection r.V, nmf solves for w with H fixed
+    def _fold_in_factors(self, cols, values):
+        q = self.item_factors[cols]
+        if self.method == "svd":
+            return values @ q
+        w = np.full(q.shape[1], np.sqrt(values.mean() / q.shape[1]), dtype=np.float32)
+        numerator = values @ q
+        for _ in range(50):
+            w *= numerator / (self.item_gram @ w + 1e-9)
+        return w
+
+    # Function: Save
+    # Inputs: Self, path to a .npz file
+    # Output: None
+    # Process: stores the trained model so restarts can skip training
+    def save(self, path):
+        matrix = self.matrix.tocsr()
+        users = np.empty(len(self.user_index), dtype=np.int64)
+        for user, row in self.user_index.items():
+            users[row] = user
+        np.savez(path, method=self.method, users=users, movies=self.movies,
+                 user_factors=self.user_factors, item_factors=self.item_factors,
+                 top=self.top, data=matrix.data, indices=matrix.indices,
+                 indptr=matrix.indptr, shape=matrix.shape)
+
+    # Function: Load
+    # Inputs: Self, path to a .npz file written by save
+    # Output: Self
+    # Process: restores a trained model
+    def load(self, path):
+        saved = np.load(path)
+        matrix = sparse.csr_matrix((saved["data"], saved["indices"], saved["indptr"]),
+                                   shape=tuple(saved["shape"]))
+        with self.lock:
+            self.method = str(saved["method"])
+            self.movies = saved["movies"]
+            self.movie_index = {int(m): i for i, m in enumerate(self.movies)}
+            self.user_index = {int(u): i for i, u in enumerate(saved["users"])}
+            self.matrix = matrix.tolil()
+            self.user_factors = saved["user_factors"]
+            self.item_factors = saved["item_factors"]
+            self.item_gram = self.item_factors.T @ self.item_factors
+            self.top = saved["top"]
+            self.trained = True
+        return self
+
+
+# shared engine used by the models
+engine = Recommender(method=config.RECOMMENDER_METHOD,
+                     factors=config.RECOMMENDER_FACTORS,
+                     top_n=config.RECOMMENDER_TOP_N)
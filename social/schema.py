@@ -0,0 +1,112 @@
+# Import libraries
+import logging
+from .ids import IdAllocator
+from .likes import backfill
+
+# Constraints, indexes and versioned migrations the app relies on.
+# Each migration runs once per graph: applying it records a
+# (:Migration {version}) node and migrate() only runs the versions the
+# graph hasnt recorded, so a restart costs one read instead of the whole
+# schema. Every step is also safe to run again, so a migration that failed
+# halfway, or two processes migrating at once, only need a rerun. Add a
+# step by appending a new version, never by editing one that has shipped.
+#
+# Usage: python -m social.migrate [--status]
+
+log = logging.getLogger(__name__)
+
+SCHEMA = [
+    # Uniqueness Contraints
+    "CREATE CONSTRAINT ON (n:User) ASSERT n.username IS UNIQUE",
+    "CREATE CONSTRAINT ON (n:User) ASSERT n.userid IS UNIQUE",
+    "CREATE CONSTRAINT ON (m:Movie) ASSERT m.movieID IS UNIQUE",
+    # on the wrong property, replaced by migration 4
+    "CREATE CONSTRAINT ON (g:Genre) ASSERT g.genreID IS UNIQUE",
+    "CREATE CONSTRAINT ON (p:Post) ASSERT p.postid IS UNIQUE",
+    "CREATE CONSTRAINT ON (t:Tag) ASSERT t.name IS UNIQUE",
+    "CREATE CONSTRAINT ON (s:Sequence) ASSERT s.name IS UNIQUE",
+    "CREATE CONSTRAINT ON (m:Migration) ASSERT m.version IS UNIQUE",
+    # Indexes
+    "CREATE INDEX ON :Post(date)",
+    # feeds page on (timestamp, postid), newest first
+    "CREATE INDEX ON :Post(timestamp)",
+]
+
+APPLIED_QUERY = "MATCH (m:Migration) RETURN m.version AS version"
+
+CONSTRAINTS_QUERY = "CALL db.constraints() YIELD description RETURN description"
+
+INDEXES_QUERY = "CALL db.indexes() YIELD description RETURN description"
+
+RECORD_QUERY = """
+MERGE (m:Migration {version: {version}})
+ON CREATE SET m.name = {name}, m.applied = timestamp()
+"""
+
+
+# Function: Create Schema
+# Inputs: graph
+# Output: None
+def create_schema(graph):
+    for statement in SCHEMA:
+        graph.run(statement)
+
+
+# Function: Create Sequences
+# Inputs: graph
+# Output: None
+# Process: the user id sequence starts after the highest id loaded
+def create_sequences(graph):
+    IdAllocator(graph, "User").ensure()
+
+
+# Function: Fix Genre Constraint
+# Inputs: graph
+# Output: None
+# Process: genres are merged on genreId but the constraint was on genreID.
+# Drops that constraint and any plain index on genreId, which Neo4j won't
+# put a constraint over, then adds the constraint on genreId. Checks what
+# is there first, as dropping what isnt fails
+def fix_genre_constraint(graph):
+    constraints = [row["description"] for row in graph.run(CONSTRAINTS_QUERY).data()]
+    if any(":Genre" in c and ".genreId IS UNIQUE" in c for c in constraints):
+        return
+    if any(":Genre" in c and ".genreID IS UNIQUE" in c for c in constraints):
+        graph.run("DROP CONSTRAINT ON (g:Genre) ASSERT g.genreID IS UNIQUE")
+    indexes = [row["description"] for row in graph.run(INDEXES_QUERY).data()]
+    if "INDEX ON :Genre(genreId)" in indexes:
+        graph.run("DROP INDEX ON :Genre(genreId)")
+    graph.run("CREATE CONSTRAINT ON (g:Genre) ASSERT g.genreId IS UNIQUE")
+
+
+# versions in the order they are applied, with what they do
+MIGRATIONS = [
+    (1, "constraints and indexes", create_schema),
+    (2, "user id sequence", create_sequences),
+    # posts from before like counts were kept get theirs
+    (3, "post like counts", backfill),
+    (4, "genre id constraint", fix_genre_constraint),
+]
+
+
+# Function: Pending
+# Inputs: graph
+# Output: list of (version, name, step) the graph hasnt recorded, in order
+def pending(graph):
+    applied = {row["version"] for row in graph.run(APPLIED_QUERY).data()}
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+
+# Function: Migrate
+# Inputs: graph
+# Output: list of (version, name) applied
+# Process: runs each pending step then records it, so a step that raises
+# stays pending
+def migrate(graph):
+    done = []
+    for version, name, step in pending(graph):
+        log.info("applying migration %d: %s", version, name)
+        step(graph)
+        graph.run(RECORD_QUERY, version=version, name=name)
+        done.append((version, name))
+    return done
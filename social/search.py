@@ -0,0 +1,271 @@
+# Import libraries
+import heapq
+import json
+import os
+import threading
+from array import array
+import numpy as np
+
+# In process search over movie titles and usernames.
+# Every lower cased text is split into trigrams and each trigram keeps a
+# sorted list of the integer ids of the texts containing it. A query word
+# of three or more letters can only be in texts holding all of its
+# trigrams, so candidates are the intersection of those lists, starting
+# with the shortest. Shorter words match the first one or two letters of a
+# word instead. Candidates are checked and ranked: exact match, then prefix,
+# then word prefix, then anywhere, shorter texts first. Bulk built texts are
+# numbered shortest first, so once enough exact or prefix matches are found
+# no later text can outrank them and the scan stops early.
+#
+# Postings built in bulk are frozen into two numpy arrays (offsets and ids)
+# which save() writes to disk and load() memory maps. Texts added later go
+# into small per trigram arrays searched alongside the frozen ones.
+
+# marks the start of a word in the short word grams
+WORD_START = "\x02"
+
+
+# Function: Grams
+# Inputs: lower cased text
+# Output: set of trigrams plus the first one and two letters of each word
+def grams(text):
+    found = {text[i:i + 3] for i in range(len(text) - 2)}
+    for word in text.split():
+        found.add(WORD_START + word[:1])
+        found.add(WORD_START + word[:2])
+    return found
+
+
+# Function: Query Grams
+# Inputs: list of lower cased query words
+# Output: set of grams every matching text must have
+def query_grams(words):
+    found = set()
+    for word in words:
+        if len(word) >= 3:
+            found.update(word[i:i + 3] for i in range(len(word) - 2))
+        else:
+            found.add(WORD_START + word)
+    return found
+
+
+class SearchIndex:
+    # Function: Constructor Function
+    # Inputs: Self
+    # Output: None
+    # Process: an empty index, fill it with build, add or load
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.docs = []
+        self.texts = []
+        self.keys = {}
+        self.offsets = np.zeros(1, dtype=np.uint32)
+        self.postings = np.zeros(0, dtype=np.uint32)
+        self.delta = {}
+        # number of bulk built texts, the rest were added one by one
+        self.frozen = 0
+        # what the graph looked like when the loaded snapshot was saved
+        self.fingerprint = None
+
+    # Function: Build
+    # Inputs: Self, iterable of (doc, text) pairs
+    # Output: Self
+    # Process: replaces the index with frozen postings for all the texts
+    def build(self, items):
+        docs, texts, lists = [], [], {}
+        items = [(doc, str(text or "").lower()) for doc, text in items]
+        # shortest first so searches can stop early
+        items.sort(key=lambda item: len(item[1]))
+        for doc, text in items:
+            for gram in grams(text):
+                lists.setdefault(gram, array("I")).append(len(docs))
+            docs.append(doc)
+            texts.append(text)
+        keys = sorted(lists)
+        offsets = np.zeros(len(keys) + 1, dtype=np.uint32)
+        offsets[1:] = np.cumsum([len(lists[k]) for k in keys])
+        postings = np.zeros(int(offsets[-1]), dtype=np.uint32)
+        for i, key in enumerate(keys):
+            postings[offsets[i]:offsets[i + 1]] = lists[key]
+        with self.lock:
+            self.docs, self.texts = docs, texts
+            self.keys = {key: i for i, key in enumerate(keys)}
+            self.offsets, self.postings = offsets, postings
+            self.delta = {}
+            self.frozen = len(docs)
+        return self
+
+    # Function: Add
+    # Inputs: Self, doc to return from searches, text to search it by
+    # Output: None
+    # Process: appends the doc and its grams to the delta postings
+    def add(self, doc, text):
+        text = str(text or "").lower()
+        with self.lock:
+            docid = len(self.docs)
+            self.docs.append(doc)
+            self.texts.append(text)
+            for gram in grams(text):
+                self.delta.setdefault(gram, array("I")).append(docid)
+
+    # Function: Gram Postings
+    # Inputs: Self, gram
+    # Output: sorted numpy array of the ids of texts containing the gram
+    # Process: frozen ids followed by delta ids, which are always higher
+    def _gram_postings(self, gram):
+        i = self.keys.get(gram)
+        base = self.postings[self.offsets[i]:self.offsets[i + 1]] if i is not None else None
+        extra = self.delta.get(gram)
+        if extra is None:
+            return base if base is not None else np.zeros(0, dtype=np.uint32)
+        extra = np.frombuffer(extra, dtype=np.uint32)
+        return extra if base is None else np.concatenate([base, extra])
+
+    # Function: Candidates
+    # Inputs: Self, list of query words
+    # Output: numpy array of candidate ids
+    # Process: intersects the postings of every gram of the query,
+    # shortest list first
+    def _candidates(self, words):
+        lists = sorted((self._gram_postings(g) for g in query_grams(words)), key=len)
+        result = lists[0]
+        for other in lists[1:]:
+            if not len(result):
+                break
+            result = np.intersect1d(result, other, assume_unique=True)
+        return result
+
+    # Function: Search
+    # Inputs: Self, query text, most results to return
+    # Output: list of docs, best match first
+    # Process: every word of the query has to appear in the text
+    def search(self, query, limit=20):
+        query = str(query or "").lower().strip()
+        words = query.split()
+        if not words:
+            return []
+        with self.lock:
+            candidates = self._candidates(words)
+            split = int(np.searchsorted(candidates, self.frozen))
+            ranked = []
+            strong = 0
+            for docid in candidates[:split].tolist():
+                rank = self._rank(docid, query, words)
+                if rank is None:
+                    continue
+                ranked.append((rank, len(self.texts[docid]), docid))
+                if rank <= 1:
+                    strong += 1
+                    # later texts are longer so can't beat these
+                    if strong == limit:
+                        break
+            for docid in candidates[split:].tolist():
+                rank = self._rank(docid, query, words)
+                if rank is not None:
+                    ranked.append((rank, len(self.texts[docid]), docid))
+            best = heapq.nsmallest(limit, ranked)
+            return [self.docs[docid] for _, _, docid in best]
+
+    # Function: Rank
+    # Inputs: Self, text id, query, query words
+    # Output: 0 exact, 1 prefix, 2 word prefix, 3 anywhere, None no match
+    def _rank(self, docid, query, words):
+        text = self.texts[docid]
+        if not all(w in text for w in words):
+            return None
+        if text == query:
+            return 0
+        if text.startswith(query):
+            return 1
+        if (" " + query) in text:
+            return 2
+        return 3
+
+    # Function: Save
+    # Inputs: Self, directory, fingerprint of the nodes it was built from
+    # Output: None
+    # Process: folds the delta into the frozen postings and writes them as
+    # .npy files next to a json file of the keys, docs, texts and fingerprint
+    def save(self, path, fingerprint=None):
+        self.build(list(zip(self.docs, self.texts)))
+        os.makedirs(path, exist_ok=True)
+        with self.lock:
+            np.save(os.path.join(path, "offsets.npy"), self.offsets)
+            np.save(os.path.join(path, "postings.npy"), self.postings)
+            keys = sorted(self.keys, key=self.keys.get)
+            with open(os.path.join(path, "meta.json"), "w") as f:
+                json.dump({"keys": keys, "docs": self.docs, "texts": self.texts,
+                           "fingerprint": fingerprint}, f)
+            self.fingerprint = fingerprint
+
+    # Function: Load
+    # Inputs: Self, directory written by save
+    # Output: Self
+    # Process: memory maps the postings so forked workers share the pages
+    def load(self, path):
+        offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        postings = np.load(os.path.join(path, "postings.npy"), mmap_mode="r")
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        with self.lock:
+            self.docs, self.texts = meta["docs"], meta["texts"]
+            self.keys = {key: i for i, key in enumerate(meta["keys"])}
+            self.offsets, self.postings = offsets, postings
+            self.delta = {}
+            self.frozen = len(self.docs)
+            self.fingerprint = meta.get("fingerprint")
+        return self
+
+    def __len__(self):
+        return len(self.docs)
+
+
+MOVIES_QUERY = """
+MATCH (m:Movie)
+RETURN m.movieID as movieID, m.title as title, m.year as year
+"""
+
+USERS_QUERY = """
+MATCH (u:User)
+RETURN u.username as username, u.userid as userid
+"""
+
+# the node count with the highest and total ids: a node added or removed
+# changes it, as does one removed and another added in its place
+FINGERPRINT_QUERY = """
+MATCH (n:%s)
+RETURN count(n) AS count, MAX(n.%s) AS top, SUM(n.%s) AS total
+"""
+
+
+# Function: Movie Text
+# Inputs: title, year
+# Output: text a movie is searched by, its title and year
+def movie_text(title, year):
+    return "%s %s" % (title or "", year or "")
+
+
+# Function: Load Indexes
+# Inputs: graph, movie SearchIndex, user SearchIndex, snapshot directory
+# (None for no snapshot)
+# Output: None
+# Process: memory maps each snapshot if the graph's fingerprint for the
+# label (one cheap aggregate) matches the one it was saved with, otherwise
+# rebuilds it from the graph and saves a new snapshot
+def load_indexes(graph, movies, users, snapshot=None):
+    for name, index, label, key, query, item in (
+            ("movies", movies, "Movie", "movieID", MOVIES_QUERY,
+             lambda r: ({"movieID": r["movieID"], "title": r["title"], "year": r["year"]},
+                        movie_text(r["title"], r["year"]))),
+            ("users", users, "User", "userid", USERS_QUERY,
+             lambda r: ({"username": r["username"], "userid": r["userid"]}, r["username"]))):
+        path = os.path.join(snapshot, name) if snapshot else None
+        row = graph.run(FINGERPRINT_QUERY % (label, key, key)).data()[0]
+        fingerprint = [row["count"], row["top"], row["total"]]
+        if path and os.path.exists(os.path.join(path, "meta.json")):
+            index.load(path)
+            if index.fingerprint == fingerprint and len(index) == row["count"]:
+                continue
+        index.build(item(row) for row in graph.run(query))
+        if path:
+            index.save(path, fingerprint)
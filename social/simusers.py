@@ -0,0 +1,183 @@
+# Import libraries
+import threading
+import zlib
+import numpy as np
+
+# Similar users.
+# Each user is described by the tags they have used and the films they have
+# rated. A MinHash signature of that feature set is split into bands and
+# every band is bucketed, so users sharing a bucket in any band are likely to
+# overlap and become candidates (locality sensitive hashing). Candidates are
+# then re-ranked exactly: Jaccard over tags plus cosine over rated films.
+# If LSH finds too few candidates the users sharing a tag are added, so
+# anyone the old tag join would have found can still show up.
+# Adding a post updates the user's features, signature and buckets in place.
+
+# large prime for the hash permutations, keeps a * x + b inside int64
+PRIME = (1 << 31) - 1
+
+TAGS_QUERY = """
+MATCH (u:User)-[:PUBLISHED]->(:Post)<-[:TAGGED]-(t:Tag)
+RETURN u.username as username, COLLECT(DISTINCT t.name) as tags
+"""
+
+RATED_QUERY = """
+MATCH (u:User)-[:RATED]->(m:Movie)
+RETURN u.username as username, COLLECT(DISTINCT m.movieID) as movies
+"""
+
+
+# Function: Feature Hash
+# Inputs: feature string
+# Output: stable 32 bit hash
+def feature_hash(feature):
+    return zlib.crc32(feature.encode("utf-8"))
+
+
+class SimilarUsers:
+    # Function: Constructor Function
+    # Inputs: Self, hash permutations, bands (must divide permutations),
+    # weight of the tag score against the rated film score
+    # Output: None
+    def __init__(self, num_perm=64, bands=32, tag_weight=0.7):
+        if num_perm % bands:
+            raise ValueError("bands must divide num_perm")
+        rng = np.random.RandomState(1)
+        self.a = rng.randint(1, PRIME, size=num_perm).astype(np.int64)
+        self.b = rng.randint(0, PRIME, size=num_perm).astype(np.int64)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.tag_weight = tag_weight
+        self.lock = threading.Lock()
+        self.tags = {}
+        self.movies = {}
+        self.signatures = {}
+        self.buckets = {}
+        self.tag_users = {}
+
+    # Function: Signature
+    # Inputs: Self, iterable of feature strings
+    # Output: MinHash signature as an int64 array
+    # Process: applies every permutation to every feature hash at once and
+    # keeps the minimum of each permutation
+    def _signature(self, features):
+        hashes = np.fromiter((feature_hash(f) for f in features), dtype=np.int64)
+        if not len(hashes):
+            return np.full(len(self.a), PRIME, dtype=np.int64)
+        return ((self.a[:, None] * hashes[None, :] + self.b[:, None]) % PRIME).min(axis=1)
+
+    # Function: Band Keys
+    # Inputs: Self, signature
+    # Output: list of (band number, band values) bucket keys
+    def _band_keys(self, signature):
+        return [(i, signature[i * self.rows:(i + 1) * self.rows].tobytes())
+                for i in range(self.bands)]
+
+    # Function: Index
+    # Inputs: Self, username, new signature
+    # Output: None
+    # Process: moves the user from their old buckets to the new ones,
+    # caller holds the lock
+    def _index(self, username, signature):
+        old = self.signatures.get(username)
+        if old is not None:
+            for key in self._band_keys(old):
+                bucket = self.buckets.get(key)
+                if bucket is not None:
+                    bucket.discard(username)
+                    if not bucket:
+                        del self.buckets[key]
+        self.signatures[username] = signature
+        for key in self._band_keys(signature):
+            self.buckets.setdefault(key, set()).add(username)
+
+    # Function: Build
+    # Inputs: Self, dict username -> tags, dict username -> rated movie ids
+    # Output: Self
+    def build(self, tags, movies):
+        with self.lock:
+            self.tags = {u: set(t) for u, t in tags.items()}
+            self.movies = {u: set(m) for u, m in movies.items()}
+            self.signatures, self.buckets, self.tag_users = {}, {}, {}
+            for username, user_tags in self.tags.items():
+                for tag in user_tags:
+                    self.tag_users.setdefault(tag, set()).add(username)
+            for username in set(self.tags) | set(self.movies):
+                self._index(username, self._signature(self._features(username)))
+        return self
+
+    # Function: Build From Graph
+    # Inputs: Self, graph
+    # Output: Self
+    def build_graph(self, graph):
+        tags = {row["username"]: row["tags"] for row in graph.run(TAGS_QUERY)}
+        movies = {row["username"]: row["movies"] for row in graph.run(RATED_QUERY)}
+        return self.build(tags, movies)
+
+    # Function: Features
+    # Inputs: Self, username
+    # Output: list of the user's feature strings
+    def _features(self, username):
+        return (["t:" + t for t in self.tags.get(username, ())] +
+                ["m:%s" % m for m in self.movies.get(username, ())])
+
+    # Function: Add
+    # Inputs: Self, username, tags used, rated movie id
+    # Output: None
+    # Process: adds the new features and folds their hashes into the
+    # signature, only touching buckets of bands that changed
+    def add(self, username, tags=(), movid=None):
+        new = []
+        with self.lock:
+            user_tags = self.tags.setdefault(username, set())
+            for tag in tags:
+                if tag not in user_tags:
+                    user_tags.add(tag)
+                    self.tag_users.setdefault(tag, set()).add(username)
+                    new.append("t:" + tag)
+            user_movies = self.movies.setdefault(username, set())
+            if movid is not None and movid not in user_movies:
+                user_movies.add(movid)
+                new.append("m:%s" % movid)
+            if not new:
+                return
+            old = self.signatures.get(username)
+            signature = self._signature(new)
+            if old is not None:
+                signature = np.minimum(old, signature)
+            self._index(username, signature)
+
+    # Function: Similar
+    # Inputs: Self, username, number of users
+    # Output: list of {"similar_user", "tags"} best first, tags being the
+    # tags both users have used
+    # Process: LSH candidates, topped up from shared tags if short, then
+    # ranked by the exact score
+    def similar(self, username, n=5):
+        with self.lock:
+            signature = self.signatures.get(username)
+            if signature is None:
+                return []
+            candidates = set()
+            for key in self._band_keys(signature):
+                candidates |= self.buckets.get(key, set())
+            my_tags = self.tags.get(username, set())
+            if len(candidates) <= n:
+                for tag in my_tags:
+                    candidates |= self.tag_users.get(tag, set())
+            candidates.discard(username)
+            my_movies = self.movies.get(username, set())
+            scored = []
+            for other in candidates:
+                their_tags = self.tags.get(other, set())
+                their_movies = self.movies.get(other, set())
+                shared = my_tags & their_tags
+                union = len(my_tags | their_tags)
+                tag_score = len(shared) / union if union else 0.0
+                both = len(my_movies) * len(their_movies)
+                movie_score = len(my_movies & their_movies) / np.sqrt(both) if both else 0.0
+                score = self.tag_weight * tag_score + (1 - self.tag_weight) * movie_score
+                if score > 0:
+                    scored.append((score, other, sorted(shared)))
+            scored.sort(key=lambda s: (-s[0], s[1]))
+            return [{"similar_user": other, "tags": shared} for _, other, shared in scored[:n]]
@@ -0,0 +1,417 @@
+# Import libraries
+import csv
+import logging
+import os
+import sys
+import threading
+import time
+import numpy as np
+
+# In process read snapshot of the mostly static part of the graph.
+# Movie, Genre, Tag and User nodes get dense integer ids (position in an
+# array, with a dict from the graph key back to it) and the RATED, SIMILAR,
+# KEYWORD and HAS_GENRE edges are held as CSR adjacency arrays: indptr[i]
+# to indptr[i + 1] slices row i's neighbours out of indices (and weights
+# out of data). KEYWORD and HAS_GENRE are also kept reversed so "movies with
+# this tag/genre" is a slice too.
+#
+# Ratings written after the snapshot was built are kept in a small delta
+# map and read alongside the arrays. Once enough pile up, or the snapshot
+# gets old, compact() folds them into fresh arrays.
+#
+# Build it from the csv exports (from_csv) or the live graph (from_graph).
+
+log = logging.getLogger(__name__)
+
+# movie properties kept for serving film data without the graph
+MOVIE_FIELDS = ("title", "poster", "year", "overview", "budget", "revenue", "runtime",
+                "lang", "featcrew", "ytlink")
+
+EXPORT_QUERIES = {
+    "movies": "MATCH (m:Movie) RETURN m.movieID as movieID, " +
+              ", ".join("m.%s as %s" % (f, f) for f in MOVIE_FIELDS),
+    "genres": "MATCH (g:Genre) RETURN g.genreId as genreId, g.name as name",
+    "users": "MATCH (u:User) RETURN u.userid as userid",
+    "rated": "MATCH (u:User)-[r:RATED]->(m:Movie) "
+             "RETURN u.userid as userid, m.movieID as movieID, r.rating as rating",
+    "similar": "MATCH (m:Movie)-[s:SIMILAR]->(m2:Movie) "
+               "RETURN m.movieID as movieID, m2.movieID as simID, s.score as score",
+    "keywords": "MATCH (t:Tag)-[:KEYWORD]->(m:Movie) RETURN m.movieID as movieID, t.name as tag",
+    "has_genre": "MATCH (m:Movie)-[:HAS_GENRE]->(g:Genre) "
+                 "RETURN m.movieID as movieID, g.genreId as genreId",
+}
+
+
+# Function: To Int
+# Inputs: csv value
+# Output: int or None, accepts "4", "4.0" and blanks
+def to_int(value):
+    if value is None or value == "":
+        return None
+    return int(float(value))
+
+
+# Function: Read CSV
+# Inputs: csv path
+# Output: list of row dicts, empty if the file doesnt exist
+def read_csv(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+# CSR: one edge type as compressed sparse rows
+class CSR:
+    __slots__ = ("indptr", "indices", "data")
+
+    # Function: Constructor Function
+    # Inputs: Self, source row per edge, target column per edge, number of
+    # rows, optional weight per edge, by_weight to order each row by
+    # weight, highest first, rather than by column
+    # Output: None
+    def __init__(self, rows, cols, n, data=None, by_weight=False):
+        rows = np.asarray(rows, dtype=np.int32)
+        cols = np.asarray(cols, dtype=np.int32)
+        if data is not None:
+            data = np.asarray(data, dtype=np.float32)
+        if by_weight and data is not None:
+            order = np.lexsort((-data, rows))
+        else:
+            order = np.lexsort((cols, rows))
+        self.indptr = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(np.bincount(rows, minlength=n), out=self.indptr[1:])
+        self.indices = cols[order]
+        self.data = data[order] if data is not None else None
+
+    # Function: Row
+    # Inputs: Self, row id
+    # Output: (neighbour ids, weights or None), empty for rows added since
+    # the arrays were built
+    def row(self, i):
+        if i is None or i + 1 >= len(self.indptr):
+            return self.indices[:0], (self.data[:0] if self.data is not None else None)
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:end], (self.data[start:end] if self.data is not None else None)
+
+    # Function: Edges
+    # Inputs: Self
+    # Output: (rows, cols, data) arrays of every edge
+    def edges(self):
+        rows = np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int32), np.diff(self.indptr))
+        return rows, self.indices, self.data
+
+    # Function: Nbytes
+    # Inputs: Self
+    # Output: bytes held by the arrays
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.indptr, self.indices, self.data) if a is not None)
+
+
+class GraphSnapshot:
+    # Function: Constructor Function
+    # Inputs: Self, ratings waiting before compaction, seconds before
+    # pending ratings are compacted regardless
+    # Output: None
+    # Process: an empty snapshot, fill it with build, from_csv or from_graph
+    def __init__(self, compact_at=1000, compact_every=600):
+        self.compact_at = compact_at
+        self.compact_every = compact_every
+        self.lock = threading.Lock()
+        self.built = 0
+        self.compacted = 0
+        self.movie_ids = np.zeros(0, dtype=np.int64)
+        self.movies = {}
+        self.props = {}
+        self.genre_names = []
+        self.genres = {}
+        self.tag_names = []
+        self.tags = {}
+        self.user_ids = []
+        self.users = {}
+        self.rated = self.similar = self.keywords = self.has_genre = None
+        self.keyword_movies = self.genre_movies = None
+        # user -> {movie: rating} written since the last compaction
+        self.delta = {}
+        self.pending = 0
+
+    # Function: Build
+    # Inputs: Self, dict of movieID -> property dict, dict of genreId ->
+    # name, iterable of userids, (userid, movieID, rating),
+    # (movieID, simID, score), (movieID, tag name) and (movieID, genreId)
+    # tuples
+    # Output: Self
+    # Process: numbers every node then turns each edge list into CSR arrays,
+    # dropping edges whose ends arent known
+    def build(self, movies, genres, users, rated, similar, keywords, has_genre):
+        rated, similar = list(rated), list(similar)
+        keywords, has_genre = list(keywords), list(has_genre)
+        movie_ids = set(movies)
+        movie_ids.update(m for _, m, _ in rated)
+        movie_ids.update(m for m, _, _ in similar)
+        movie_ids.update(s for _, s, _ in similar)
+        movie_ids.update(m for m, _ in keywords)
+        movie_ids.update(m for m, _ in has_genre)
+        movie_ids.discard(None)
+        movie_ids = np.array(sorted(movie_ids), dtype=np.int64)
+        movie_map = {int(m): i for i, m in enumerate(movie_ids)}
+        genre_keys = sorted(genres)
+        genre_map = {g: i for i, g in enumerate(genre_keys)}
+        tag_names = sorted({t for _, t in keywords if t is not None})
+        tag_map = {t: i for i, t in enumerate(tag_names)}
+        user_ids = sorted((set(users) | {u for u, _, _ in rated}) - {None})
+        user_map = {u: i for i, u in enumerate(user_ids)}
+        props = {}
+        for movie, fields in movies.items():
+            if movie in movie_map:
+                props[movie_map[movie]] = tuple(fields.get(f) for f in MOVIE_FIELDS)
+
+        def edges(pairs, left, right):
+            kept = [(left[a], right[b]) + tuple(rest) for a, b, *rest in pairs
+                    if a in left and b in right]
+            return list(zip(*kept)) if kept else [(), (), ()]
+
+        n_movies = len(movie_ids)
+        r_rows, r_cols, r_data = edges(rated, user_map, movie_map)
+        s_rows, s_cols, s_data = edges(similar, movie_map, movie_map)
+        k_rows, k_cols = edges(keywords, movie_map, tag_map)[:2]
+        g_rows, g_cols = edges(has_genre, movie_map, genre_map)[:2]
+        rated_csr = CSR(r_rows, r_cols, len(user_ids), r_data)
+        similar_csr = CSR(s_rows, s_cols, n_movies, s_data, by_weight=True)
+        with self.lock:
+            self.movie_ids, self.movies, self.props = movie_ids, movie_map, props
+            self.genre_names = [genres[g] for g in genre_keys]
+            self.genres = genre_map
+            self.tag_names, self.tags = tag_names, tag_map
+            self.user_ids, self.users = user_ids, user_map
+            self.rated, self.similar = rated_csr, similar_csr
+            self.keywords = CSR(k_rows, k_cols, n_movies)
+            self.keyword_movies = CSR(k_cols, k_rows, len(tag_names))
+            self.has_genre = CSR(g_rows, g_cols, n_movies)
+            self.genre_movies = CSR(g_cols, g_rows, len(genre_keys))
+            self.delta, self.pending = {}, 0
+            self.built = self.compacted = time.time()
+        return self
+
+    # Function: From CSV
+    # Inputs: Self, data folder
+    # Output: Self
+    # Process: reads the same exports the loader loads, movie properties
+    # come from movieinfo.csv when it is there
+    def from_csv(self, data_dir):
+        movies = {to_int(r["movieId"]): r
+                  for r in read_csv(os.path.join(data_dir, "movieinfo.csv"))}
+        genres = {to_int(r["GenreId"]): r["Name"]
+                  for r in read_csv(os.path.join(data_dir, "genresinfo.csv"))}
+        users = [to_int(r["userID"]) for r in read_csv(os.path.join(data_dir, "users.csv"))]
+        rated = [(to_int(r["userId"]), to_int(r["movieId"]), float(r["rating"]))
+                 for r in read_csv(os.path.join(data_dir, "ratings.csv"))]
+        similar = [(to_int(r["MovieId"]), to_int(r["SimMovieId"]), float(r.get("Score") or 0))
+                   for r in read_csv(os.path.join(data_dir, "movie_sim.csv"))]
+        keywords = [(to_int(r["movieId"]), r["keywords"])
+                    for r in read_csv(os.path.join(data_dir, "movie_keys.csv"))]
+        has_genre = [(to_int(r["movieId"]), to_int(r["code"]))
+                     for r in read_csv(os.path.join(data_dir, "genres.csv"))]
+        return self.build(movies, genres, users, rated, similar, keywords, has_genre)
+
+    # Function: From Graph
+    # Inputs: Self, graph
+    # Output: Self
+    # Process: exports each label and edge type with one query
+    def from_graph(self, graph):
+        rows = {name: graph.run(query).data() for name, query in EXPORT_QUERIES.items()}
+        return self.build(
+            {r["movieID"]: r for r in rows["movies"]},
+            {r["genreId"]: r["name"] for r in rows["genres"]},
+            [r["userid"] for r in rows["users"]],
+            [(r["userid"], r["movieID"], r["rating"] or 0.0) for r in rows["rated"]],
+            [(r["movieID"], r["simID"], r["score"] or 0.0) for r in rows["similar"]],
+            [(r["movieID"], r["tag"]) for r in rows["keywords"]],
+            [(r["movieID"], r["genreId"]) for r in rows["has_genre"]])
+
+    # Function: Has Movie
+    # Inputs: Self, movie id
+    # Output: True if the film is in the snapshot
+    def has_movie(self, mov_id):
+        return mov_id in self.movies
+
+    # Function: Film
+    # Inputs: Self, movie id
+    # Output: dict of the film's properties with movieID, None if the
+    # snapshot doesnt hold them
+    def film(self, mov_id):
+        fields = self.props.get(self.movies.get(mov_id))
+        if fields is None:
+            return None
+        film = dict(zip(MOVIE_FIELDS, fields))
+        film["movieID"] = mov_id
+        return film
+
+    # Function: Cards
+    # Inputs: Self, list of movie ids
+    # Output: list of {title, movieID, poster} in the same order, None if
+    # any film's properties arent in the snapshot
+    def cards(self, movie_ids):
+        films = []
+        for mov_id in movie_ids:
+            fields = self.props.get(self.movies.get(mov_id))
+            if fields is None:
+                return None
+            films.append({"title": fields[0], "movieID": mov_id, "poster": fields[1]})
+        return films
+
+    # Function: Film Genres
+    # Inputs: Self, movie id
+    # Output: list of genre names
+    def film_genres(self, mov_id):
+        genres, _ = self.has_genre.row(self.movies.get(mov_id))
+        return [self.genre_names[g] for g in genres.tolist()]
+
+    # Function: Film Keywords
+    # Inputs: Self, movie id
+    # Output: list of keyword tag names
+    def film_keywords(self, mov_id):
+        tags, _ = self.keywords.row(self.movies.get(mov_id))
+        return [self.tag_names[t] for t in tags.tolist()]
+
+    # Function: Similar Films
+    # Inputs: Self, movie id, number of films
+    # Output: list of movie ids along SIMILAR, best score first
+    def similar_films(self, mov_id, n=10):
+        films, _ = self.similar.row(self.movies.get(mov_id))
+        return self.movie_ids[films[:n]].tolist()
+
+    # Function: Related Films
+    # Inputs: Self, movie id, number of films
+    # Output: list of movie ids sharing a keyword and a genre with the film,
+    # most shared genres then most shared keywords first
+    # Process: counts shared keywords and genres for every film at once by
+    # walking the reversed KEYWORD and HAS_GENRE rows
+    def related_films(self, mov_id, n=10):
+        movie = self.movies.get(mov_id)
+        if movie is None:
+            return []
+        n_movies = len(self.movie_ids)
+        tags, _ = self.keywords.row(movie)
+        genres, _ = self.has_genre.row(movie)
+        shared_tags = np.bincount(
+            np.concatenate([self.keyword_movies.row(t)[0] for t in tags.tolist()] or
+                           [np.zeros(0, dtype=np.int32)]), minlength=n_movies)
+        shared_genres = np.bincount(
+            np.concatenate([self.genre_movies.row(g)[0] for g in genres.tolist()] or
+                           [np.zeros(0, dtype=np.int32)]), minlength=n_movies)
+        shared_tags[movie] = 0
+        found = np.flatnonzero((shared_tags > 0) & (shared_genres > 0))
+        order = np.lexsort((-shared_tags[found], -shared_genres[found]))[:n]
+        return self.movie_ids[found[order]].tolist()
+
+    # Function: Ratings
+    # Inputs: Self, user id
+    # Output: dict of movie row -> rating, snapshot merged with the delta
+    def _ratings(self, user_id):
+        user = self.users.get(user_id)
+        movies, ratings = self.rated.row(user)
+        merged = dict(zip(movies.tolist(), ratings.tolist()))
+        with self.lock:
+            merged.update(self.delta.get(user, {}))
+        return merged
+
+    # Function: Recommend
+    # Inputs: Self, user id, number of films, ratings above this count as liked
+    # Output: list of movie ids, None if the user has no ratings
+    # Process: walks RATED -> SIMILAR from every liked film, adding up the
+    # similarity scores of each film reached, and drops films already rated
+    def recommend(self, user_id, n=10, liked=3):
+        ratings = self._ratings(user_id)
+        if not ratings:
+            return None
+        scores = np.zeros(len(self.movie_ids), dtype=np.float32)
+        for movie, rating in ratings.items():
+            if rating > liked:
+                films, weights = self.similar.row(movie)
+                np.add.at(scores, films, weights)
+        scores[list(ratings)] = 0
+        found = np.flatnonzero(scores > 0)
+        order = found[np.argsort(-scores[found], kind="stable")][:n]
+        return self.movie_ids[order].tolist()
+
+    # Function: Add Rating
+    # Inputs: Self, user id, movie id, rating
+    # Output: None
+    # Process: records the RATED edge in the delta, numbering users the
+    # snapshot hasnt seen, and compacts when enough are waiting. A post's
+    # tags are TAGGED edges on the post, not KEYWORD edges, so the snapshot
+    # has nothing to record for them
+    def add_rating(self, user_id, mov_id, rating):
+        movie = self.movies.get(mov_id)
+        if movie is None:
+            return
+        with self.lock:
+            user = self.users.get(user_id)
+            if user is None:
+                user = self.users[user_id] = len(self.user_ids)
+                self.user_ids.append(user_id)
+            self.delta.setdefault(user, {})[movie] = float(rating)
+            self.pending += 1
+            due = (self.pending >= self.compact_at or
+                   time.time() - self.compacted >= self.compact_every)
+        if due:
+            self.compact()
+
+    # Function: Compact
+    # Inputs: Self
+    # Output: None
+    # Process: rebuilds the RATED arrays from the snapshot edges plus the
+    # delta, the delta winning where both rate the same film
+    def compact(self):
+        with self.lock:
+            if not self.delta:
+                self.compacted = time.time()
+                return
+            n_movies = len(self.movie_ids)
+            rows, cols, data = self.rated.edges()
+            d_rows, d_cols, d_data = [], [], []
+            for user, movies in self.delta.items():
+                for movie, rating in movies.items():
+                    d_rows.append(user)
+                    d_cols.append(movie)
+                    d_data.append(rating)
+            keys = np.concatenate([rows.astype(np.int64) * n_movies + cols,
+                                   np.array(d_rows, dtype=np.int64) * n_movies + d_cols])
+            values = np.concatenate([data, np.array(d_data, dtype=np.float32)])
+            # last occurrence wins, so look for the first in reverse
+            keys, values = keys[::-1], values[::-1]
+            keys, first = np.unique(keys, return_index=True)
+            self.rated = CSR(keys // n_movies, keys % n_movies, len(self.user_ids), values[first])
+            self.delta, self.pending = {}, 0
+            self.compacted = time.time()
+
+    # Function: Memory
+    # Inputs: Self
+    # Output: dict of part -> approximate bytes, with a "total"
+    def memory(self):
+        report = {name: csr.nbytes() for name, csr in (
+            ("rated", self.rated), ("similar", self.similar), ("keywords", self.keywords),
+            ("keyword_movies", self.keyword_movies), ("has_genre", self.has_genre),
+            ("genre_movies", self.genre_movies)) if csr is not None}
+        report["movie_ids"] = self.movie_ids.nbytes
+        report["id_maps"] = sum(sys.getsizeof(m) for m in (
+            self.movies, self.genres, self.tags, self.users, self.tag_names, self.user_ids))
+        report["props"] = sys.getsizeof(self.props) + sum(
+            sys.getsizeof(f) + sum(sys.getsizeof(v) for v in f) for f in self.props.values())
+        report["delta"] = sys.getsizeof(self.delta) + sum(
+            sys.getsizeof(m) for m in self.delta.values())
+        report["total"] = sum(report.values())
+        return report
+
+    # Function: Log Memory
+    # Inputs: Self
+    # Output: None
+    # Process: logs the memory report with node and edge counts
+    def log_memory(self):
+        report = self.memory()
+        log.info("graph snapshot: %d movies, %d users, %d tags, %d ratings, %.1f MB",
+                 len(self.movie_ids), len(self.user_ids), len(self.tag_names),
+                 len(self.rated.indices) + self.pending, report["total"] / 1e6)
+        for name, size in sorted(report.items()):
+            log.info("  %-16s %10d bytes", name, size)
@@ -0,0 +1,255 @@
+# Import libraries
+import threading
+import time
+import numpy as np
+
+# Trending films.
+# Activity per film (reviews, rating stars and likes) is counted into
+# rings of time buckets held in one numpy array per ring,
+# shape (buckets, films, kinds). Recording an event is an O(1) array update,
+# a bucket is cleared the first time it is reused.
+# A film's trending score for a window is the sum of its bucket counts,
+# each bucket decayed exponentially by its age and each kind weighted.
+# Scores are cached per window and recomputed at most every refresh seconds
+# (or hourly when nothing happened), so reads are normally a lookup.
+
+REVIEW, RATING, LIKE = 0, 1, 2
+
+# window name: (length in seconds, half life in seconds)
+WINDOWS = {
+    "24h": (24 * 3600, 6 * 3600),
+    "7d": (7 * 86400, 2 * 86400),
+    "30d": (30 * 86400, 7 * 86400),
+}
+
+# reviews since this many days ago are loaded at startup
+HISTORY = 30 * 86400
+
+REVIEWS_QUERY = """
+MATCH (post:Post)-[:REVIEWED]->(movie:Movie)
+WHERE toInteger(post.timestamp) > {since}
+RETURN movie.movieID as movieID, toInteger(post.timestamp) as timestamp,
+toInteger(post.rating) as rating
+"""
+
+LIKES_QUERY = """
+MATCH (:User)-[like:LIKES]->(post:Post)
+WHERE like.timestamp > {since}
+RETURN post.movid as movieID, like.timestamp as timestamp
+"""
+
+GENRES_QUERY = """
+MATCH (movie:Movie)-[:HAS_GENRE]->(genre:Genre)
+RETURN movie.movieID as movieID, genre.name as genre
+"""
+
+
+class BucketRing:
+    # Function: Constructor Function
+    # Inputs: Self, seconds per bucket, number of buckets, films, kinds
+    # Output: None
+    def __init__(self, bucket_seconds, buckets, capacity, kinds=3):
+        self.bucket_seconds = bucket_seconds
+        self.counts = np.zeros((buckets, capacity, kinds), dtype=np.float32)
+        # which bucket number (time // bucket_seconds) each slot holds
+        self.epochs = np.full(buckets, -1, dtype=np.int64)
+
+    # Function: Add
+    # Inputs: Self, film index, kind, amount, unix time
+    # Output: None
+    # Process: adds to the film's count in the slot for that time, clearing
+    # the slot first if it still holds an older bucket
+    def add(self, index, kind, amount, timestamp):
+        epoch = int(timestamp // self.bucket_seconds)
+        slot = epoch % len(self.epochs)
+        if self.epochs[slot] != epoch:
+            # too old for the ring
+            if epoch < self.epochs[slot]:
+                return
+            self.counts[slot] = 0
+            self.epochs[slot] = epoch
+        self.counts[slot, index, kind] += amount
+
+    # Function: Grow
+    # Inputs: Self, new number of films
+    # Output: None
+    def grow(self, capacity):
+        counts = np.zeros((self.counts.shape[0], capacity, self.counts.shape[2]), dtype=np.float32)
+        counts[:, :self.counts.shape[1]] = self.counts
+        self.counts = counts
+
+    # Function: Totals
+    # Inputs: Self, unix time now, window length, half life
+    # Output: films x kinds array of decayed counts in the window
+    # Process: weights each slot by its age, slots outside the window or
+    # never used weigh 0
+    def totals(self, now, window, half_life):
+        age = now - (self.epochs + 0.5) * self.bucket_seconds
+        valid = (self.epochs >= 0) & (age < window)
+        weights = np.where(valid, 0.5 ** (np.maximum(age, 0) / half_life), 0).astype(np.float32)
+        return np.tensordot(weights, self.counts, axes=(0, 0))
+
+
+class TrendingEngine:
+    # Function: Constructor Function
+    # Inputs: Self, initial number of films, seconds a cached score is
+    # reused after new events, weight of a review, rating star and like
+    # Output: None
+    # Process: an hourly ring covers the 24h window, a daily ring the others
+    def __init__(self, capacity=1024, refresh=30, weights=(1.0, 0.2, 0.5)):
+        self.lock = threading.Lock()
+        self.refresh = refresh
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.capacity = capacity
+        self.hourly = BucketRing(3600, 48, capacity)
+        self.daily = BucketRing(86400, 32, capacity)
+        self.index = {}
+        self.movies = np.zeros(capacity, dtype=np.int64)
+        self.genres = {}
+        self.version = 0
+        self.cache = {}
+
+    # Function: Film Index
+    # Inputs: Self, movie id
+    # Output: dense index of the film, doubling the arrays when full
+    # Process: caller holds the lock
+    def _film_index(self, movid):
+        index = self.index.get(movid)
+        if index is None:
+            index = len(self.index)
+            if index == self.capacity:
+                self.capacity *= 2
+                self.hourly.grow(self.capacity)
+                self.daily.grow(self.capacity)
+                movies = np.zeros(self.capacity, dtype=np.int64)
+                movies[:index] = self.movies
+                self.movies = movies
+                for name, mask in self.genres.items():
+                    self.genres[name] = np.concatenate([mask, np.zeros(index, dtype=bool)])
+            self.index[movid] = index
+            self.movies[index] = movid
+        return index
+
+    # Function: Record
+    # Inputs: Self, movie id, kind (REVIEW, RATING or LIKE), amount,
+    # unix time (defaults to now)
+    # Output: None
+    def record(self, movid, kind, amount=1, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        with self.lock:
+            index = self._film_index(int(movid))
+            self.hourly.add(index, kind, amount, timestamp)
+            self.daily.add(index, kind, amount, timestamp)
+            self.version += 1
+
+    # Function: Review
+    # Inputs: Self, movie id, rating, unix time
+    # Output: None
+    # Process: a post counts as a review plus its rating in stars
+    def review(self, movid, rating, timestamp=None):
+        self.record(movid, REVIEW, 1, timestamp)
+        if rating:
+            self.record(movid, RATING, rating, timestamp)
+
+    # Function: Like
+    # Inputs: Self, movie id of the liked post, unix time
+    # Output: None
+    def like(self, movid, timestamp=None):
+        self.record(movid, LIKE, 1, timestamp)
+
+    # Function: Set Genres
+    # Inputs: Self, iterable of (movie id, genre name)
+    # Output: None
+    # Process: builds a boolean mask over the films for each genre
+    def set_genres(self, pairs):
+        with self.lock:
+            # number every film first so the arrays are done growing
+            pairs = [(self._film_index(int(movid)), name) for movid, name in pairs]
+            genres = {}
+            for index, name in pairs:
+                if name not in genres:
+                    genres[name] = np.zeros(self.capacity, dtype=bool)
+                genres[name][index] = True
+            self.genres = genres
+
+    # Function: Scores
+    # Inputs: Self, window name
+    # Output: array of trending scores, one per film index
+    # Process: reuses the cached scores while they are younger than refresh
+    # seconds, or younger than an hour if there have been no new events
+    def _scores(self, window):
+        length, half_life = WINDOWS[window]
+        now = time.time()
+        cached = self.cache.get(window)
+        if cached:
+            age = now - cached[1]
+            if age < self.refresh or (cached[0] == self.version and age < 3600):
+                return cached[2]
+        ring = self.hourly if length <= 2 * 86400 else self.daily
+        scores = ring.totals(now, length, half_life) @ self.weights
+        self.cache[window] = (self.version, now, scores)
+        return scores
+
+    # Function: Top
+    # Inputs: Self, number of films, window ("24h", "7d" or "30d"),
+    # optional genre name
+    # Output: list of movie ids, most trending first
+    def top(self, n=10, window="7d", genre=None):
+        if window not in WINDOWS:
+            raise ValueError("unknown trending window: %s" % window)
+        with self.lock:
+            scores = self._scores(window)[:len(self.index)]
+            if genre is not None:
+                mask = self.genres.get(genre)
+                if mask is None:
+                    return []
+                scores = np.where(mask[:len(scores)], scores, 0)
+            n = min(n, len(scores))
+            if n == 0:
+                return []
+            best = np.argpartition(-scores, n - 1)[:n]
+            best = best[np.argsort(-scores[best])]
+            return [int(self.movies[i]) for i in best if scores[i] > 0]
+
+    # Function: Counts
+    # Inputs: Self, movie id, window name
+    # Output: dict of decayed review, rating and like counts in the window
+    def counts(self, movid, window="7d"):
+        length, half_life = WINDOWS[window]
+        with self.lock:
+            index = self.index.get(int(movid))
+            if index is None:
+                return {"reviews": 0.0, "ratings": 0.0, "likes": 0.0}
+            ring = self.hourly if length <= 2 * 86400 else self.daily
+            totals = ring.totals(time.time(), length, half_life)[index]
+        return {"reviews": float(totals[REVIEW]), "ratings": float(totals[RATING]),
+                "likes": float(totals[LIKE])}
+
+    # Function: Rebuild
+    # Inputs: Self, graph
+    # Output: None
+    # Process: replays the last 30 days of reviews and likes and reloads the
+    # genre masks from the graph into a fresh engine, then swaps its rings,
+    # films and genres in at once, so readers see the old scores until then
+    def rebuild(self, graph):
+        since = int(time.time()) - HISTORY
+        reviews = graph.run(REVIEWS_QUERY, since=since).data()
+        likes = graph.run(LIKES_QUERY, since=since).data()
+        genres = [(row["movieID"], row["genre"]) for row in graph.run(GENRES_QUERY)]
+        fresh = TrendingEngine(self.capacity, self.refresh, self.weights)
+        events = [(row["timestamp"], row["movieID"], row["rating"]) for row in reviews]
+        events += [(row["timestamp"], row["movieID"], None) for row in likes
+                   if row["movieID"] is not None]
+        # replay oldest first so no bucket is skipped as too old
+        for timestamp, movid, rating in sorted(events, key=lambda e: e[0]):
+            if rating is None:
+                fresh.like(movid, timestamp)
+            else:
+                fresh.review(movid, rating, timestamp)
+        fresh.set_genres(genres)
+        with self.lock:
+            (self.capacity, self.hourly, self.daily, self.index, self.movies, self.genres,
+             self.cache) = (fresh.capacity, fresh.hourly, fresh.daily, fresh.index,
+                            fresh.movies, fresh.genres, {})
+            self.version += 1
@@ -1,22 +1,85 @@
 #import necessary libraries
-from flask import Flask, request, session, redirect, url_for, render_template, flash
-from .models import User, todays_recent_posts, Movie, query_search
-from pandas import DataFrame
-import ast
+from flask import Flask, request, session, redirect, url_for, render_template, flash, jsonify, g, Response
+from .models import User, todays_recent_posts, Movie, query_search, autocomplete, user_logins, ip_logins, metrics_registry, feed_page, like_buffer, browse_films, browse_index
+from . import config, feeds
+from .auth import AuthBusy
+from . import metrics
+from .fanout import Query, load_page
+from concurrent.futures import TimeoutError
+from functools import partial
+import json
 
 #store Flask constructor in app variable
 app = Flask(__name__)
 
+# data each page loads, fetched concurrently by load_page.
+# Queries served from memory run inline in the request thread
+INDEX_PAGE = {
+    "posts": Query(partial(todays_recent_posts, 5), default=[], inline=True),
+    "toprated": Query(partial(Movie.rated_films, "top"), default=[], inline=True),
+    "trending": Query(partial(Movie.rated_films, "trending"), default=[], inline=True),
+}
+
+PROFILE_PAGE = {
+    "trending": Query(partial(Movie.rated_films, "trending"), default=[], inline=True),
+    "recs": Query(Movie.recommend_films, "userid", default=[]),
+    "recrecs": Query(Movie.recommend_recent_films, "userid", default=[]),
+    "posts": Query(lambda username: User(username).recent_posts(5), "username", default=[]),
+}
+
+# only loaded when users view their own profile
+SIMILAR_USERS = Query(lambda username: User(username).get_similar_users(), "username", default=[])
+
+MOVIE_PAGE = {
+    "film": Query(Movie.get_details, "movie_id"),
+}
+
+# start counting the queries each request makes
+@app.before_request
+def start_metrics():
+    rule = request.url_rule
+    g.metrics_token = metrics.start_request(rule.rule if rule else "unmatched")
+
+# record the request and tell the browser where its time went
+@app.after_request
+def finish_metrics(response):
+    token = g.pop("metrics_token", None)
+    if token is None:
+        return response
+    return metrics.finish_request(metrics_registry, token, response)
+
+# requests that raised skip after_request, stop tracking them here
+@app.teardown_request
+def drop_metrics(exc):
+    token = g.pop("metrics_token", None)
+    if token is not None:
+        metrics.current.reset(token)
+
+# lets the post templates show like counts, including likes not yet written
+@app.context_processor
+def like_counts():
+    def like_count(row):
+        likes = row.get("likes")
+        if likes is None:
+            likes = row["post"].get("like_count") or 0
+        elif not isinstance(likes, int):
+            # the index page ring buffer holds who liked each post
+            likes = len(likes)
+        return like_buffer.count(row["post"]["postid"], likes)
+    return {"like_count": like_count}
+
+# metrics decorator used to expose query and request metrics to prometheus
+@app.route("/metrics")
+def metrics_page():
+    return Response(metrics_registry.render(), mimetype="text/plain; version=0.0.4")
+
 # index decorator used to associate index functions to url
 @app.route("/")
 def index():
-    # store the 5 most recent posts in variable
-    posts = todays_recent_posts(5)
-    toprated = Movie.rated_films("top")
-    trending = Movie.rated_films("trending")
-
+    # load the 5 most recent posts, top rated and trending films
+    page, _ = load_page(INDEX_PAGE)
     # return the rendered index template passing posts variable to webpage
-    return render_template("index.html", posts=posts, toprated=toprated, trending=trending)
+    return render_template("index.html", **page)
 
 # register decorator used to associate register functions to url,
 #using both get and post methods
@@ -29,8 +92,18 @@ def register():
         password = request.form["password"]
         #init user node with username and store in variable
         user = User(username)
+        #hashing is limited per ip like logins
+        if not ip_logins.hit(request.remote_addr):
+            flash("Too many attempts, try again later.")
+            return render_template("register.html"), 429
+        try:
+            registered = user.register(password)
+        except AuthBusy:
+            #every hashing slot is taken, turn the request away
+            flash("We're busy right now, try again in a moment.")
+            return render_template("register.html"), 503
         #if the register function returns false
-        if not user.register(password):
+        if not registered:
             # print message to tell user the username already exists
             flash("A user with that username already exists.")
         #if the register function returns True
@@ -52,14 +125,26 @@ def login():
         password = request.form["password"]
         #init user node with username and store in variable
         user = User(username)
+        #refuse before hashing if the user or ip has had too many tries
+        if not user_logins.hit(username) or not ip_logins.hit(request.remote_addr):
+            flash("Too many login attempts, try again later.")
+            return render_template("login.html"), 429
+        try:
+            verified = user.verify_password(password)
+        except AuthBusy:
+            #every hashing slot is taken, turn the request away
+            flash("We're busy right now, try again in a moment.")
+            return render_template("login.html"), 503
         #if verify password funct returns false
-        if not user.verify_password(password):
+        if not verified:
             #show invalid login message
             flash("Invalid login.")
         #if verify password funct returns true
         else:
             #show confirmation message
             flash("Successfully logged in.")
+            #clear the failed attempts for this user
+            user_logins.reset(username)
             #save the username in the session, to keep track of whos logged in
             session["username"] = user.username
             #send user to index page
@@ -93,10 +178,15 @@ def add_post():
         #tell them
         flash('you must fill the form out correctly')
     else:
+        #use the add post function using the form inputs as parameters
+        try:
+            user.add_post(title, tags, rating, text, movid)
+        except TimeoutError:
+            #the post wasnt committed in time, it may still be
+            flash("Your post is taking a while to save, check back in a moment before posting it again.")
+            return render_template("layout.html"), 503
         #confirmation message
         flash('post added')
-        #use the add post function using the form inputs as parameters
-        user.add_post(title, tags, rating, text, movid)
     #take the user to the index page
     return redirect(request.referrer)
 
@@ -118,77 +208,98 @@ def like_post(postid):
     #take the user back to where they were
     return redirect(request.referrer)
 
+# likes decorator used to like and unlike many posts at once, takes json
+# {"like": [postids], "unlike": [postids]} and returns the posts that changed
+# and their like counts, null for posts whose count isnt in memory yet
+@app.route("/likes", methods=["POST"])
+def likes():
+    username = session.get('username')
+    if not username:
+        return jsonify(error="you must be logged in to like posts"), 401
+    body = request.get_json(silent=True) or {}
+    like, unlike = body.get("like", []), body.get("unlike", [])
+    if not isinstance(like, list) or not isinstance(unlike, list):
+        return jsonify(error="like and unlike must be lists of post ids"), 400
+    user = User(username)
+    liked = user.like_posts([str(p) for p in like])
+    unliked = user.unlike_posts([str(p) for p in unlike])
+    counts = {p: like_buffer.count(p) for p in liked + unliked}
+    return jsonify(liked=liked, unliked=unliked, counts=counts)
+
 # profile decorator used to associate profile functions to url
 @app.route("/profile/<username>")
 def profile(username):
     #store logged in username into variable
     logged_in_username = session.get('username')
-    userid = DataFrame(User.get_userid(str(username)))["userid"][0]
-    trending = Movie.rated_films("trending")
-    recs = Movie.recommend_films(int(userid))
-    recrecs = Movie.recommend_recent_films(int(userid))
-    #store the username of the profile being viewed into variable
-    user_being_viewed_username = username
-    #store user node of of the profile being viewed into variable
-    user_being_viewed = User(user_being_viewed_username)
-    #get the five most recent posts of the user and store in variable
-    posts = user_being_viewed.recent_posts(5)
-    #init list for similar users
-    similar = []
-    #if the user is logged in
-    if logged_in_username:
-        #store the user node into a variable
-        logged_in_user = User(logged_in_username)
-        #if the profile being viewed is that of the user whos logged in
-        if logged_in_user.username == user_being_viewed.username:
-            #store the similar users into the similar list
-            similar = logged_in_user.get_similar_users()
+    #the recommendations are looked up by userid so find that first
+    user = User.get_userid(str(username))
+    if not user:
+        flash("User doesn't exist")
+        return redirect(url_for('index'))
+    userid = int(user[0]["userid"])
+    queries = dict(PROFILE_PAGE)
+    #if the logged in user is viewing their own profile show similar users
+    if logged_in_username and logged_in_username == username:
+        queries["similar"] = SIMILAR_USERS
+    #load the trending films, recommendations, five most recent posts
+    #and similar users at the same time
+    page, _ = load_page(queries, username=username, userid=userid)
     #return the profile page, taking username, recent posts and similar users as
     #parameters
     return render_template(
         'profile.html',
         username=username,
-        posts=posts,
-        similar=similar,
-        recs=recs, recrecs=recrecs, trending=trending
+        posts=page["posts"],
+        similar=page.get("similar", []),
+        recs=page["recs"], recrecs=page["recrecs"], trending=page["trending"]
     )
 
 @app.route("/movie/<movie_id>")
 def movie(movie_id):
-    mov = Movie.get_film_data(int(movie_id))
-    if not mov:
+    page, missing = load_page(MOVIE_PAGE, movie_id=int(movie_id))
+    film = page["film"]
+    #the film query failed or timed out, the film may well exist
+    if "film" in missing:
+        flash("We couldn't load this film right now, try again in a moment.")
+        return render_template("layout.html"), 503
+    if film is None:
         flash("Film isn't in database")
         return redirect(url_for('index'))
-    else:
-        posts = Movie.movie_recent_posts(5, int(movie_id))
-        sim_films = Movie.get_similar_films(int(movie_id))
-        genres = DataFrame(Movie.get_film_genres(int(movie_id)))
-        genres = str(genres['genres'][0]).replace("'", "").strip("[]")
-        film = DataFrame(mov)
-        title = film["title"][0]
-        id = film["movieID"][0]
-        year = film["year"][0]
-        overview = film["overview"][0]
-        poster = film["poster"][0]
-        lang = film["lang"][0]
-        ytlink = film["ytlink"][0].replace("watch?v=", "embed/")
-        runtime = film["runtime"][0]
-        budget = film["budget"][0]
-        featcrew = film["featcrew"][0]
-        if(featcrew == None):
-            featcrew = ""
-        else:
-            featcrew = ast.literal_eval(film["featcrew"][0])
-        revenue = film["revenue"][0]
-        keywords = str(film["keywords"][0])
-        keywords = keywords.replace("'", "").strip("[]")
+    return render_template("movie.html", title=film.title, year=film.year,
+                           overview=film.overview, poster=film.poster, lang=film.lang,
+                           runtime=film.runtime, budget=film.budget, genres=film.genres,
+                           revenue=film.revenue, keywords=film.keywords, ytlink=film.ytlink,
+                           featcrew=film.featcrew, id=film.movieID, posts=film.posts,
+                           simfilms=film.similar)
+
 
+# feed decorators used to page through posts for infinite scroll,
+# ?after=<cursor from the last page>&n=<posts>. Each line of the response is
+# one post as json, newest first, and the cursor for the next page is in the
+# X-Next-Cursor header, left out after the last page
+@app.route("/feed")
+def feed():
+    return feed_response("all")
 
-    return render_template("movie.html", title=title, year=year, overview=overview,
-                           poster=poster, lang=lang,
-                           runtime=runtime, budget=budget,genres=genres,
-                           revenue=revenue,keywords=keywords, ytlink=ytlink,
-                           featcrew=featcrew, id=id, posts=posts, simfilms=sim_films)
+@app.route("/feed/user/<username>")
+def user_feed(username):
+    return feed_response("user", username)
+
+@app.route("/feed/movie/<movie_id>")
+def movie_feed(movie_id):
+    return feed_response("movie", int(movie_id))
+
+def feed_response(scope, key=None):
+    try:
+        n = int(request.args.get("n", config.FEED_PAGE_SIZE))
+        rows, following = feed_page(scope, key, n, request.args.get("after"))
+    except ValueError:
+        return jsonify(error="after must be a cursor from a previous page and n a number"), 400
+    body = "".join(json.dumps(feeds.row_json(row)) + "\n" for row in rows)
+    response = Response(body, mimetype="application/x-ndjson")
+    if following:
+        response.headers["X-Next-Cursor"] = following
+    return response
 
 
 @app.route("/results", methods=["POST"])
@@ -207,4 +318,37 @@ def results():
                 queryresults = query_search("User", str(text))
             elif request.form['searchobj'] == "Movie":
                 queryresults = query_search("Movie", str(text))
-            return render_template("results.html", queryresults=queryresults, searchobj=searchobj)
\ No newline at end of file
+            return render_template("results.html", queryresults=queryresults, searchobj=searchobj)
+
+
+# browse decorator used to page through films by facet, returns json
+# ?genre=<name>&genre=...&decade=1990&min_rating=4&sort=rating|reviews|recent
+# &n=<films>&after=<cursor>, films must have every genre given. The cursor
+# for the next page is "next", null after the last page
+@app.route("/browse")
+def browse():
+    try:
+        decade = request.args.get("decade")
+        min_rating = request.args.get("min_rating")
+        films, following = browse_films(
+            request.args.getlist("genre"), int(decade) // 10 * 10 if decade else None,
+            float(min_rating) if min_rating else None, request.args.get("sort", "reviews"),
+            int(request.args.get("n", config.BROWSE_PAGE_SIZE)), request.args.get("after"))
+    except KeyError:
+        return jsonify(error="genre must be one of %s and sort one of rating, reviews, recent"
+                             % ", ".join(browse_index.genre_list())), 400
+    except ValueError:
+        return jsonify(error="decade and n must be numbers, min_rating a rating and after "
+                             "a cursor from a previous page"), 400
+    return jsonify(films=films, next=following)
+
+
+# autocomplete decorator used to associate autocomplete functions to url
+# returns json suggestions for the search box, ?q=text&searchobj=Movie|User
+@app.route("/autocomplete")
+def search_autocomplete():
+    text = request.args.get("q", "")
+    searchobj = request.args.get("searchobj", "Movie")
+    if searchobj not in ("Movie", "User"):
+        return jsonify(error="searchobj must be Movie or User"), 400
+    return jsonify(autocomplete(searchobj, text))
@@ -0,0 +1,169 @@
+# Import libraries
+import os
+import queue
+import threading
+import uuid
+from concurrent.futures import Future
+from datetime import datetime
+from . import config
+
+# Post write path.
+# A post, its PUBLISHED/REVIEWED/RATED relationships and all of its tag
+# merges are written by one parameterised UNWIND statement, so a post costs
+# one round trip and either lands completely or not at all.
+# Posts submitted from request threads go through a write-behind queue: a
+# single flusher thread drains whatever has queued up (up to a batch size)
+# and writes it as one grouped transaction, so a burst of posts shares a
+# round trip. Callers wait on a future, so nothing is acknowledged before it
+# is committed.
+
+POST_QUERY = """
+UNWIND {posts} AS row
+MATCH (user:User {username: row.username})
+MATCH (movie:Movie {movieID: row.movid})
+OPTIONAL MATCH (user)-[old:RATED]->(movie)
+WITH row, user, movie, old.rating AS previous
+CREATE (post:Post {postid: row.postid, title: row.title, rating: row.rating,
+                   text: row.text, movid: row.movid,
+                   timestamp: row.timestamp, date: row.date, like_count: 0})
+CREATE (user)-[:PUBLISHED]->(post)
+CREATE (post)-[:REVIEWED]->(movie)
+MERGE (user)-[rated:RATED]->(movie)
+SET rated.rating = row.rating
+FOREACH (name IN row.tags |
+    MERGE (tag:Tag {name: name})
+    CREATE (tag)-[:TAGGED]->(post))
+RETURN row.postid AS postid, user.userid AS userid,
+       movie.title AS movTitle, movie.poster AS poster, previous
+"""
+
+
+# Function: Make Post
+# Inputs: username, title, tags (comma separated string or list), rating,
+# text, movie id, optional unix timestamp
+# Output: dict of post parameters for POST_QUERY
+# Process: gives the post its id and dates and strips, lower cases and
+# de-duplicates the tags
+def make_post(username, title, tags, rating, text, movid, timestamp=None):
+    if timestamp is None:
+        timestamp = int(datetime.now().timestamp())
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    tags = sorted({x.strip().lower() for x in tags if x.strip()})
+    return {
+        "postid": str(uuid.uuid4()),
+        "username": username,
+        "title": title,
+        "rating": int(rating),
+        "text": text,
+        "movid": int(movid),
+        "timestamp": int(timestamp),
+        "date": datetime.fromtimestamp(timestamp).strftime("%F"),
+        "tags": tags,
+    }
+
+
+class PostWriter:
+    # Function: Constructor Function
+    # Inputs: Self, graph, largest group per transaction, seconds to wait
+    # for more posts before flushing a group
+    # Output: None
+    # Process: the flusher thread is started on first submit
+    def __init__(self, graph, batch_size=100, max_delay=0.005):
+        self.graph = graph
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = os.getpid()
+
+    # Function: Write
+    # Inputs: Self, list of post dicts from make_post
+    # Output: list of {"postid", "userid", "movTitle", "poster", "previous"}
+    # rows, one per post written, previous being the user's rating of the
+    # film this post replaced, None for their first
+    # Process: writes the posts in one explicit transaction
+    def write(self, posts):
+        tx = self.graph.begin()
+        try:
+            rows = tx.run(POST_QUERY, posts=posts).data()
+            tx.commit()
+        except Exception:
+            tx.rollback()
+            raise
+        return rows
+
+    # Function: Write Many
+    # Inputs: Self, iterable of post dicts
+    # Output: list of rows written
+    # Process: bulk import path, writes the posts in batch sized transactions
+    def write_many(self, posts):
+        rows, batch = [], []
+        for post in posts:
+            batch.append(post)
+            if len(batch) == self.batch_size:
+                rows.extend(self.write(batch))
+                batch = []
+        if batch:
+            rows.extend(self.write(batch))
+        return rows
+
+    # Function: Submit
+    # Inputs: Self, post dict
+    # Output: future resolving to the post's row, or None if its user or
+    # movie doesn't exist
+    # Process: queues the post for the flusher thread, a forked child
+    # starts its own flusher, as does a process whose flusher died
+    def submit(self, post):
+        future = Future()
+        self.queue.put((post, future))
+        if self.thread is None or self.pid != os.getpid() or not self.thread.is_alive():
+            with self.lock:
+                if self.thread is None or self.pid != os.getpid() or not self.thread.is_alive():
+                    self.pid = os.getpid()
+                    self.thread = threading.Thread(target=self._run, name="post-writer", daemon=True)
+                    self.thread.start()
+        return future
+
+    # Function: Run
+    # Inputs: Self
+    # Output: None
+    # Process: flusher loop, blocks for the first post then gathers any
+    # that arrive within max_delay into the same group
+    def _run(self):
+        while True:
+            group = [self.queue.get()]
+            try:
+                while len(group) < self.batch_size:
+                    group.append(self.queue.get(timeout=self.max_delay))
+            except queue.Empty:
+                pass
+            self._flush(group)
+
+    # Function: Flush
+    # Inputs: Self, list of (post, future)
+    # Output: None
+    # Process: writes the group in one transaction. If it fails the posts
+    # are retried one by one so one bad post can't fail its neighbours
+    def _flush(self, group):
+        try:
+            rows = self.write([post for post, _ in group])
+        except Exception as e:
+            if len(group) == 1:
+                group[0][1].set_exception(e)
+            else:
+                for item in group:
+                    self._flush([item])
+            return
+        written = {row["postid"]: row for row in rows}
+        for post, future in group:
+            future.set_result(written.get(post["postid"]))
+
+
+# Function: Post Writer
+# Inputs: graph
+# Output: PostWriter configured from config
+def post_writer(graph):
+    return PostWriter(graph, batch_size=config.WRITE_BATCH_SIZE,
+                      max_delay=config.WRITE_MAX_DELAY)
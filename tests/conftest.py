@@ -0,0 +1,51 @@
+# Import libraries
+import multiprocessing
+import os
+import sys
+from multiprocessing.managers import BaseManager
+import pytest
+
+# Tests run against the stand-in graph store in benchmarks/store.py, so no
+# Neo4j is needed. Run from the repository root with python -m pytest.
+#
+# The app builds its graph on import, so the store the app uses is installed
+# here, before any test imports social. It is served from a manager process
+# so processes a test forks share it the way they would share Neo4j. Tests
+# of code that takes a graph argument make their own StandInGraph.
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.store import StandInGraph, install
+
+
+class SharedStore(StandInGraph):
+    # Function: User Ids
+    # Inputs: Self
+    # Output: list of every user's userid
+    def userids(self):
+        with self.lock:
+            return [u["userid"] for u in self.users.values()]
+
+
+class StoreManager(BaseManager):
+    pass
+
+
+StoreManager.register("SharedStore", SharedStore,
+                      exposed=("run", "evaluate", "round_trip", "userids"))
+
+manager = StoreManager(ctx=multiprocessing.get_context("fork"))
+manager.start()
+app_graph = manager.SharedStore()
+install(app_graph)
+# cheap hashes, the tests aren't measuring bcrypt
+os.environ["RECFLIX_BCRYPT_ROUNDS"] = "4"
+
+
+def pytest_unconfigure(config):
+    manager.shutdown()
+
+
+@pytest.fixture(scope="session")
+def app_store():
+    return app_graph
@@ -0,0 +1,55 @@
+# Import libraries
+import time
+import pytest
+from benchmarks.store import StandInGraph
+from social import config, fanout, schema
+from social.fanout import Query, load_page
+
+# Page loading against a slow graph: a query the page gives up on keeps its
+# thread until the graph answers, and later pages don't queue more queries
+# behind it, they fall back to their defaults by their deadline.
+
+
+@pytest.fixture
+def two_threads(monkeypatch):
+    monkeypatch.setattr(config, "QUERY_WORKERS", 2)
+    monkeypatch.setattr(fanout, "_executor", (None, None, None))
+    yield
+    fanout.executor()[0].shutdown(wait=True)
+
+
+def test_abandoned_queries_dont_queue_later_pages(two_threads):
+    slow = StandInGraph(rtt=0.5)
+    calls = []
+
+    def slow_query():
+        calls.append(time.monotonic())
+        return slow.run(schema.APPLIED_QUERY)
+
+    slow_page = {"slow": Query(slow_query, default=[])}
+    fast_page = {"fast": Query(lambda: "done", default="default")}
+
+    # two pages give up on the slow query, which still holds both threads
+    for _ in range(2):
+        page, missing = load_page(slow_page, timeout=0.05)
+        assert page == {"slow": []} and missing == ["slow"]
+
+    started = time.monotonic()
+    page, missing = load_page(dict(fast_page, **slow_page), timeout=0.1)
+    assert time.monotonic() - started < 0.3
+    assert page == {"fast": "default", "slow": []}
+    assert missing == ["fast", "slow"]
+
+    # once the graph answers the threads are free again, and nothing the
+    # pages gave up on before submitting ran in the meantime
+    time.sleep(0.6)
+    assert len(calls) == 2
+    page, missing = load_page(fast_page, timeout=0.1)
+    assert page == {"fast": "done"} and not missing
+
+
+def test_waits_for_a_thread_within_the_deadline(two_threads):
+    page = {name: Query(lambda name=name: time.sleep(0.05) or name, default=None)
+            for name in ("a", "b", "c")}
+    results, missing = load_page(page, timeout=1.0)
+    assert results == {"a": "a", "b": "b", "c": "c"} and not missing
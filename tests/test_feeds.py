@@ -0,0 +1,44 @@
+# Import libraries
+import csv
+from benchmarks.store import StandInGraph
+from pipeline import loader
+from social import feeds
+
+# Paging the global feed past posts the loader wrote without their author:
+# short pages don't end the feed, and every complete post is reached once.
+
+
+# Function: Write CSV
+# Inputs: path, header, rows
+# Output: None
+def write_csv(path, header, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def test_feed_pages_past_posts_without_an_author(tmp_path):
+    write_csv(str(tmp_path / "users.csv"), ["userID", "username", "password"],
+              [[1, "ann", "x"], [2, "bob", "x"]])
+    write_csv(str(tmp_path / "movieinfo.csv"), ["movieId", "title"], [[1, "Film"]])
+    # every post from user 3, who isnt loaded, comes in runs of four
+    write_csv(str(tmp_path / "reviews.csv"),
+              ["id", "userId", "movieId", "title", "rating", "text", "timestamp", "date"],
+              [["p%02d" % i, 3 if i % 10 < 4 else 1 + i % 2, 1, "Review", 4, "", 1000 + i,
+                "2017-07-14"] for i in range(40)])
+    store = StandInGraph()
+    loader.load(store, str(tmp_path), log=lambda line: None)
+    assert len(store.loose_posts) == 16
+
+    seen, after, pages = [], None, 0
+    while True:
+        rows, after = feeds.page(store, "all", n=3, after=after)
+        seen.extend(row["post"]["postid"] for row in rows)
+        pages += 1
+        if after is None:
+            break
+    assert sorted(seen) == sorted(store.posts)
+    assert len(seen) == len(set(seen))
+    assert seen == sorted(seen, reverse=True)
+    assert pages == 14
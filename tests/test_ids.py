@@ -0,0 +1,57 @@
+# Import libraries
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+# User ids handed out by concurrent signups never repeat, from threads of
+# one process or from processes forked after it reserved a block, all
+# registering in the shared stand-in store from conftest.py.
+
+THREADS = 8
+PROCESSES = 4
+PER_WORKER = 30
+
+
+@pytest.fixture(scope="module")
+def social(app_store):
+    app_store.run("MERGE (u:User {username: {username}}) ON CREATE SET u.userid = {userid}, "
+                  "u.password = {password} RETURN u.userid = {userid}",
+                  username="loaded", userid=41, password="x")
+    import social
+    social.schema.migrate(social.graph)
+    return social, app_store
+
+
+# Function: Register All
+# Inputs: social package, usernames
+# Output: None, raises if a signup failed (a child exits non-zero)
+def register_all(social, names):
+    for name in names:
+        assert social.models.User(name).register("password")
+
+
+def test_thread_and_forked_signups_get_unique_ids(social):
+    social, store = social
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        names = [["t%d_%d" % (n, i) for i in range(PER_WORKER)] for n in range(THREADS)]
+        list(pool.map(lambda batch: register_all(social, batch), names))
+
+    # the parent now holds part of a reserved block, which the children
+    # inherit and must not hand out again
+    register_all(social, ["before_fork"])
+    fork = multiprocessing.get_context("fork")
+    children = [fork.Process(target=register_all,
+                             args=(social, ["p%d_%d" % (n, i) for i in range(PER_WORKER)]))
+                for n in range(PROCESSES)]
+    for child in children:
+        child.start()
+    register_all(social, ["parent_%d" % i for i in range(PER_WORKER)])
+    for child in children:
+        child.join()
+        assert child.exitcode == 0
+
+    ids = store.userids()
+    assert len(ids) == 2 + (THREADS + PROCESSES + 1) * PER_WORKER
+    assert len(set(ids)) == len(ids)
+    # signups start after the highest id that was loaded
+    assert min(i for i in ids if i != 41) > 41
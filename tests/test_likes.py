@@ -0,0 +1,113 @@
+# Import libraries
+from benchmarks.store import StandInGraph
+from social.likes import LikeBuffer
+
+# The like buffer against the stand-in store: pairs already liked in the
+# graph aren't liked again, a like undone before the flush never reaches
+# the graph, a failed group is retried pair by pair, and only likes the
+# flush really created are reported to the listeners.
+
+
+# Function: Store
+# Inputs: None
+# Output: StandInGraph with users ann and bob and posts p1 to p3 by ann
+def store():
+    graph = StandInGraph()
+    for userid, username in enumerate(("ann", "bob"), 1):
+        graph.users[username] = {"userid": userid, "username": username, "password": ""}
+        graph.user_names[userid] = username
+    for postid in ("p1", "p2", "p3"):
+        graph.posts[postid] = {"username": "ann", "tags": [],
+                               "post": {"postid": postid, "movid": 1, "like_count": 0}}
+    return graph
+
+
+# Function: Buffer
+# Inputs: graph
+# Output: (LikeBuffer that only flushes when told, list of likes reported)
+def buffer(graph):
+    likes = LikeBuffer(graph, interval=3600)
+    reported = []
+    likes.on_like = lambda postid, username, movid: reported.append((username, postid))
+    return likes, reported
+
+
+def test_already_liked_pairs_arent_liked_again():
+    graph = store()
+    graph.likes["p1"] = {"bob": 1}
+    likes, reported = buffer(graph)
+    likes.seen([{"post": {"postid": "p1"}, "likes": 1}])
+    # after a restart nothing is known about bob and p1
+    assert likes.like("bob", ["p1", "p2"]) == ["p2"]
+    assert likes.count("p1") == 1
+    assert likes.flush() == 1
+    assert reported == [("bob", "p2")]
+    assert likes.unlike("bob", ["p1", "p3"]) == ["p1"]
+
+
+def test_unlike_after_like_never_reaches_the_graph():
+    graph = store()
+    likes, reported = buffer(graph)
+    likes.seen([{"post": {"postid": "p1"}, "likes": 0}])
+    assert likes.like("bob", ["p1"]) == ["p1"]
+    assert likes.count("p1") == 1
+    assert likes.unlike("bob", ["p1"]) == ["p1"]
+    assert likes.count("p1") == 0
+    likes.flush()
+    assert not graph.likes.get("p1") and reported == []
+    assert likes.count("p1") == 0
+
+
+def test_like_made_elsewhere_before_the_flush_isnt_reported():
+    graph = store()
+    likes, reported = buffer(graph)
+    assert likes.like("bob", ["p1"]) == ["p1"]
+    # another worker's flush gets there first
+    graph.likes["p1"] = {"bob": 1}
+    likes.flush()
+    assert reported == []
+    assert likes.count("p1") == 1
+
+
+class FlakyGraph:
+    # Function: Constructor Function
+    # Inputs: Self, StandInGraph
+    # Output: None
+    # Process: transactions writing more than one like fail
+    def __init__(self, store):
+        self.store = store
+        self.failed = 0
+
+    def run(self, query, parameters=None, **params):
+        return self.store.run(query, parameters, **params)
+
+    def begin(self):
+        graph = self
+
+        class Transaction:
+            def run(self, query, parameters=None, **params):
+                if len(params.get("likes", [])) > 1:
+                    graph.failed += 1
+                    raise IOError("deadlock")
+                return graph.store.run(query, parameters, **params)
+
+            def commit(self):
+                pass
+
+            def rollback(self):
+                pass
+
+        return Transaction()
+
+
+def test_failed_group_is_retried_pair_by_pair():
+    graph = store()
+    flaky = FlakyGraph(graph)
+    likes, reported = buffer(flaky)
+    assert likes.like("bob", ["p1", "p2"]) == ["p1", "p2"]
+    assert likes.like("ann", ["p2"]) == ["p2"]
+    likes.flush()
+    assert flaky.failed == 1
+    assert sorted(reported) == [("ann", "p2"), ("bob", "p1"), ("bob", "p2")]
+    assert likes.count("p2") == 2 and likes.count("p1") == 1
+    assert graph.likes["p2"].keys() == {"ann", "bob"}
@@ -0,0 +1,176 @@
+# Import libraries
+import csv
+import json
+import os
+import threading
+import pytest
+from benchmarks.store import StandInGraph
+from pipeline import loader
+from social import schema
+
+# The bulk loader on the stand-in store: a load interrupted part way
+# through resumes from its checkpoint, and replaying the chunk that was
+# written but not checkpointed doesn't duplicate anything.
+
+FILES = {
+    "users.csv": (["userID", "username", "password"],
+                  [[u, "user%d" % u, "hash%d" % u] for u in range(1, 7)]),
+    "movieinfo.csv": (["movieId", "title", "year", "rating"],
+                      [[m, "Film %d" % m, 1990 + m, 3.5] for m in range(1, 9)]),
+    "genresinfo.csv": (["GenreId", "Name"], [[1, "Drama"], [2, "Comedy"]]),
+    "genres.csv": (["movieId", "code"], [[m, 1 + m % 2] for m in range(1, 9)]),
+    "movie_keys.csv": (["movieId", "keywords"],
+                       [[m, k] for m in range(1, 9) for k in ("space", "love")]),
+    "ratings.csv": (["userId", "movieId", "rating"],
+                    [[u, m, (u + m) % 5 + 1] for u in range(1, 7) for m in range(1, 9)]),
+    "movie_sim.csv": (["MovieId", "SimMovieId", "Score"],
+                      [[m, o, 0.5] for m in range(1, 9) for o in range(1, 9) if o != m]),
+    "reviews.csv": (["id", "userId", "movieId", "title", "rating", "text", "timestamp",
+                     "date"],
+                    [["p%d" % i, 1 + i % 6, 1 + i % 8, "Review", 4, "text", 1500000000 + i,
+                      "2017-07-14"] for i in range(20)]),
+    "tags.csv": (["id", "userId", "movieId", "tag"],
+                 [["p%d" % i, 1 + i % 6, 1 + i % 8, t] for i in range(20)
+                  for t in ("good", "long")]),
+}
+
+
+class Interrupted(Exception):
+    pass
+
+
+class FailingTransaction:
+    # Function: Constructor Function
+    # Inputs: Self, FailingGraph, the store's transaction
+    # Output: None
+    def __init__(self, graph, tx):
+        self.graph = graph
+        self.tx = tx
+
+    def run(self, query, parameters=None, **params):
+        return self.tx.run(query, parameters, **params)
+
+    # Function: Commit
+    # Inputs: Self
+    # Output: None
+    # Process: the chosen commit fails after its statement was applied, as
+    # if the connection dropped before the loader heard back
+    def commit(self):
+        with self.graph.lock:
+            self.graph.commits += 1
+            if self.graph.commits == self.graph.fail_at:
+                raise Interrupted("connection lost")
+        self.tx.commit()
+
+    def rollback(self):
+        self.tx.rollback()
+
+
+class FailingGraph:
+    # Function: Constructor Function
+    # Inputs: Self, StandInGraph, which commit fails
+    # Output: None
+    def __init__(self, store, fail_at):
+        self.store = store
+        self.fail_at = fail_at
+        self.commits = 0
+        self.lock = threading.Lock()
+
+    def run(self, query, parameters=None, **params):
+        return self.store.run(query, parameters, **params)
+
+    def evaluate(self, query, parameters=None, **params):
+        return self.store.evaluate(query, parameters, **params)
+
+    def begin(self):
+        return FailingTransaction(self, self.store.begin())
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    for name, (header, rows) in FILES.items():
+        with open(str(tmp_path / name), "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+    return str(tmp_path)
+
+
+# Function: Contents
+# Inputs: StandInGraph
+# Output: everything the loader writes, in a comparable form
+def contents(store):
+    return {
+        "users": sorted((u["userid"], u["username"]) for u in store.users.values()),
+        "movies": sorted(store.movies),
+        "genres": sorted(store.genres.items()),
+        "has_genre": sorted((m, g) for m, gs in store.movie_genres.items() for g in gs),
+        "keywords": sorted((m, k) for m, ks in store.keywords.items() for k in ks),
+        "rated": sorted(store.rated.items()),
+        "user_rated": sorted((u, len(ms)) for u, ms in store.user_rated.items()),
+        "similar": sorted((m, o, s) for m, fs in store.similar.items() for o, s in fs),
+        "posts": sorted((p, post["username"], tuple(post["tags"]))
+                        for p, post in store.posts.items()),
+    }
+
+
+@pytest.mark.parametrize("fail_at", [2, 4, 7])
+def test_interrupted_load_resumes_without_duplicates(data_dir, tmp_path, fail_at):
+    expected = StandInGraph()
+    loader.load(expected, data_dir, batch_size=7, log=lambda line: None)
+
+    store = StandInGraph()
+    checkpoint = str(tmp_path / "checkpoint.json")
+    with pytest.raises(Interrupted):
+        loader.load(FailingGraph(store, fail_at), data_dir, checkpoint=checkpoint,
+                    batch_size=7, log=lambda line: None)
+    with open(checkpoint) as f:
+        done = json.load(f)
+    assert done and contents(store) != contents(expected)
+
+    lines = []
+    loader.load(store, data_dir, checkpoint=checkpoint, batch_size=7, log=lines.append)
+    resumed = [line for line in lines if "resuming after" in line]
+    assert len(resumed) == len([entry for entry in done.values() if entry["rows"]])
+    assert contents(store) == contents(expected)
+    assert not store.loose_posts
+    assert not os.path.exists(checkpoint)
+
+
+def test_changed_csvs_are_loaded_from_the_top(data_dir, tmp_path):
+    store = StandInGraph()
+    checkpoint = str(tmp_path / "checkpoint.json")
+    with pytest.raises(Interrupted):
+        loader.load(FailingGraph(store, 6), data_dir, checkpoint=checkpoint,
+                    batch_size=7, log=lambda line: None)
+    with open(checkpoint) as f:
+        assert json.load(f)["users"]["rows"] == 6
+
+    # the exports are regenerated before the rerun, with new users
+    header, rows = FILES["users.csv"]
+    with open(os.path.join(data_dir, "users.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows([[u, "renamed%d" % u, "hash%d" % u] for u in range(1, 10)])
+    lines = []
+    loader.load(store, data_dir, checkpoint=checkpoint, batch_size=7, log=lines.append)
+    assert not any(line.startswith("users") and "resuming" in line for line in lines)
+    assert sorted(u["username"] for u in store.users.values()) == \
+        sorted("renamed%d" % u for u in range(1, 10))
+
+    # a finished load leaves no checkpoint, so the next one loads everything
+    assert not os.path.exists(checkpoint)
+    lines = []
+    loader.load(store, data_dir, checkpoint=checkpoint, batch_size=7, log=lines.append)
+    assert not any("resuming" in line for line in lines)
+
+
+def test_loaded_graph_matches_the_csv_files(data_dir):
+    store = StandInGraph()
+    report = loader.load(store, data_dir, batch_size=5, log=lambda line: None)
+    assert report["ratings"][0] == 48
+    assert len(store.rated) == 48
+    assert len(store.posts) == 20
+    assert all(post["tags"] == ["good", "long"] for post in store.posts.values())
+    assert all(len(films) == 7 for films in store.similar.values())
+    assert sorted(store.migrations) == [v for v, _, _ in schema.MIGRATIONS]
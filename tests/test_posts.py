@@ -0,0 +1,20 @@
+# Import libraries
+from concurrent.futures import Future
+from social import app, config, models
+
+# Adding a post when the writer doesnt answer: the request gives up after
+# POST_TIMEOUT with a 503 instead of holding its thread forever.
+
+
+def test_post_that_isnt_committed_in_time_is_a_503(monkeypatch):
+    monkeypatch.setattr(config, "POST_TIMEOUT", 0.05)
+    # a flush that never finishes
+    monkeypatch.setattr(models.post_queue, "submit", lambda post: Future())
+    monkeypatch.setattr(app, "secret_key", "test")
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["username"] = "ann"
+    response = client.post("/add_post", headers={"Referer": "/movie/1"}, data={
+        "title": "Review", "tags": "good", "rating": "4", "text": "", "movieID": "1"})
+    assert response.status_code == 503
+    assert b"taking a while to save" in response.data
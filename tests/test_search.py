@@ -0,0 +1,53 @@
+# Import libraries
+from benchmarks.store import StandInGraph
+from social.search import SearchIndex, load_indexes
+
+# Search index snapshots are only reused while the graph's nodes match the
+# fingerprint they were saved with, a user deleted and another registered
+# in their place included.
+
+
+# Function: Store
+# Inputs: dict of userid -> username
+# Output: StandInGraph holding those users and a couple of films
+def store(users):
+    graph = StandInGraph()
+    for userid, username in users.items():
+        graph.users[username] = {"userid": userid, "username": username, "password": ""}
+        graph.user_names[userid] = username
+    graph.movies = {m: {"movieID": m, "title": "Film %d" % m, "year": 1990 + m}
+                    for m in (1, 2)}
+    return graph
+
+
+# Function: Load
+# Inputs: StandInGraph, snapshot folder
+# Output: (movie index, user index, labels rebuilt from the graph)
+def load(graph, snapshot):
+    rebuilt = []
+
+    class Index(SearchIndex):
+        def build(self, items):
+            rebuilt.append(self)
+            return super().build(items)
+
+    movies, users = Index(), Index()
+    load_indexes(graph, movies, users, snapshot)
+    # save builds again, so an index can be in rebuilt twice
+    return movies, users, sorted({"movies" if i is movies else "users" for i in rebuilt})
+
+
+def test_snapshot_reused_until_the_users_change(tmp_path):
+    snapshot = str(tmp_path / "search_index")
+    _, _, rebuilt = load(store({1: "ann", 2: "bob", 3: "cat"}), snapshot)
+    assert rebuilt == ["movies", "users"]
+
+    _, users, rebuilt = load(store({1: "ann", 2: "bob", 3: "cat"}), snapshot)
+    assert rebuilt == []
+    assert [doc["username"] for doc in users.search("bob")] == ["bob"]
+
+    # bob deleted and dan registered, as many users as before
+    _, users, rebuilt = load(store({1: "ann", 3: "cat", 4: "dan"}), snapshot)
+    assert rebuilt == ["users"]
+    assert users.search("bob") == []
+    assert [doc["username"] for doc in users.search("dan")] == ["dan"]
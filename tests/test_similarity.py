@@ -0,0 +1,75 @@
+# Import libraries
+import csv
+import multiprocessing
+import pytest
+from benchmarks.store import StandInGraph
+from pipeline import similarity
+
+# The similarity builder scores the same whether its workers are forked or
+# spawned, and writing the neighbours to the graph replaces every scored
+# movie's SIMILAR edges, dropping them for movies left with none.
+
+
+@pytest.fixture
+def exports(tmp_path):
+    keys, genres = str(tmp_path / "movie_keys.csv"), str(tmp_path / "genres.csv")
+    with open(keys, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["movieId", "keywords"])
+        writer.writerows([[m, k] for m in range(1, 13) for k in ("space", "k%d" % (m % 3))])
+        # shares no keyword with anything
+        writer.writerow([13, "lonely"])
+    with open(genres, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["movieId", "code"])
+        writer.writerows([[m, 1 + m % 2] for m in range(1, 14)])
+    return keys, genres
+
+
+def test_spawned_workers_score_like_one_process(exports, monkeypatch):
+    expected = similarity.build(*exports, k=3, block=4, processes=1)
+    spawn = multiprocessing.get_context("spawn")
+    monkeypatch.setattr(similarity.multiprocessing, "Pool", spawn.Pool)
+    assert similarity.build(*exports, k=3, block=4, processes=2) == expected
+    assert not similarity._shared
+
+
+def test_write_graph_replaces_every_scored_movies_edges(exports):
+    movies, rows = similarity.build(*exports, k=3, processes=1)
+    assert 13 in movies and not [r for r in rows if r[0] == 13]
+    store = StandInGraph()
+    store.movies = {m: {"movieID": m, "title": "Film %d" % m, "poster": ""} for m in movies}
+    # edges from an earlier build, when 13 still had neighbours
+    store.similar = {m: [(1 + m % 13, 0.9)] for m in movies}
+
+    similarity.write_graph(rows, store, movies, batch=5)
+    assert 13 not in store.similar
+    written = sorted((m, o, s) for m, films in store.similar.items() for o, s in films)
+    assert written == sorted(rows)
+
+
+class BrokenTransaction:
+    def __init__(self):
+        self.rolled_back = False
+
+    def run(self, query, parameters=None, **params):
+        if "MERGE" in query:
+            raise IOError("connection lost")
+
+    def commit(self):
+        raise AssertionError("committed after a failed statement")
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+def test_write_graph_rolls_back_a_failed_batch():
+    tx = BrokenTransaction()
+
+    class Graph:
+        def begin(self):
+            return tx
+
+    with pytest.raises(IOError):
+        similarity.write_graph([(1, 2, 0.5)], Graph(), [1, 2])
+    assert tx.rolled_back
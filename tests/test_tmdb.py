@@ -0,0 +1,126 @@
+# Import libraries
+import asyncio
+import json
+import os
+from aiohttp import web
+from pipeline import tmdb
+
+# The TMDb fetcher against a local stub server serving a fixture page.
+# Films answered with a 200 or 404 are written, a 429 is retried, a 304
+# reuses the cached page, and any other answer leaves the film pending so
+# the next run fetches it again.
+
+PAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "tmdb_movie.html")
+
+# TMDb ids the stub answers with a 429 first, 403 always, 404, or an
+# unprompted 304 for a page the fetcher never cached. Any other id is the
+# fixture page
+THROTTLED, FORBIDDEN, GONE, UNCACHED = 2, 3, 4, 5
+
+LINKS = [(10 + i, i) for i in range(1, 6)]
+
+
+# StubTmdb: serves /movie/<id> and counts the requests for each id
+class StubTmdb:
+    def __init__(self):
+        with open(PAGE, "rb") as f:
+            self.page = f.read()
+        self.requests = {}
+        self.revalidated = 0
+
+    async def movie(self, request):
+        tmdb_id = int(request.match_info["id"])
+        self.requests[tmdb_id] = self.requests.get(tmdb_id, 0) + 1
+        if tmdb_id == THROTTLED and self.requests[tmdb_id] == 1:
+            return web.Response(status=429, headers={"Retry-After": "0"})
+        if tmdb_id == FORBIDDEN:
+            return web.Response(status=403)
+        if tmdb_id == GONE:
+            return web.Response(status=404, text="not found")
+        if tmdb_id == UNCACHED:
+            return web.Response(status=304)
+        if request.headers.get("If-None-Match") == '"v1"':
+            self.revalidated += 1
+            return web.Response(status=304, headers={"ETag": '"v1"'})
+        return web.Response(body=self.page, content_type="text/html", headers={"ETag": '"v1"'})
+
+
+# Function: Run
+# Inputs: StubTmdb, cache folder, max age of cached pages, output paths
+# Output: list of fetch_all's counts, one per output
+# Process: fetches into each output in turn from one stub server, the
+# cache is keyed by url so every run must see the same port
+def run(stub, cache, max_age, *outs):
+    async def fetch():
+        app = web.Application()
+        app.router.add_get("/movie/{id}", stub.movie)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        url = "http://127.0.0.1:%d" % runner.addresses[0][1]
+        try:
+            return [await tmdb.fetch_all(LINKS, out, cache, url, workers=2, rate=0,
+                                         max_age=max_age, processes=1, log=lambda *a: None)
+                    for out in outs]
+        finally:
+            await runner.cleanup()
+    return asyncio.run(fetch())
+
+
+# Function: Written
+# Inputs: output path
+# Output: dict of tmdb id -> record
+def written(out):
+    with open(out) as f:
+        return {r["tmdbId"]: r for r in map(json.loads, f)}
+
+
+def test_retries_throttled_and_leaves_failures_pending(tmp_path):
+    out, cache = str(tmp_path / "tmdb.jsonl"), str(tmp_path / "cache")
+    stub = StubTmdb()
+    counts, = run(stub, cache, 86400, out)
+    records = written(out)
+    assert sorted(records) == [1, THROTTLED, GONE]
+    assert counts["written"] == 3 and counts["failed"] == 2
+    assert stub.requests[THROTTLED] == 2 and counts["retries"] >= 1
+    assert records[THROTTLED]["status"] == 200
+    assert records[1]["ytlink"] == "https://www.youtube.com/watch?v=v-U9sH4P6XQ"
+    assert records[1]["lang"] == "English" and records[1]["keywords"] == ["toy", "friendship"]
+    assert records[GONE]["status"] == 404
+    # a 403 is not retried within a run
+    assert stub.requests[FORBIDDEN] == 1
+
+    # the rerun only asks again for the films that failed
+    stub.requests.clear()
+    counts, = run(stub, cache, 86400, out)
+    assert sorted(stub.requests) == [FORBIDDEN, UNCACHED]
+    assert counts["written"] == 0 and counts["failed"] == 2
+    assert tmdb.read_done(out) == {11, 10 + THROTTLED, 10 + GONE}
+
+
+def test_revalidates_stale_pages(tmp_path):
+    cache = str(tmp_path / "cache")
+    first, second = str(tmp_path / "first.jsonl"), str(tmp_path / "second.jsonl")
+    stub = StubTmdb()
+    # the second run starts a fresh output over the same cache, with every
+    # cached page stale
+    before, counts = run(stub, cache, 0, first, second)
+    assert before["revalidated"] == 0
+    records = written(second)
+    assert counts["revalidated"] == 2 and stub.revalidated == 2
+    assert counts["cached"] == 0
+    assert records[1] == written(first)[1]
+    assert sorted(records) == [1, THROTTLED, GONE]
+
+
+def test_read_done_skips_other_statuses(tmp_path):
+    out = tmp_path / "tmdb.jsonl"
+    out.write_text("\n".join([
+        json.dumps({"movieId": 1, "tmdbId": 1, "status": 200}),
+        json.dumps({"movieId": 2, "tmdbId": 2, "status": 404}),
+        json.dumps({"movieId": 3, "tmdbId": 3, "status": 403}),
+        json.dumps({"movieId": 4, "tmdbId": 4, "status": 304}),
+        '{"movieId": 5, "tmd',
+    ]) + "\n")
+    assert tmdb.read_done(str(out)) == {1, 2}
@@ -0,0 +1,24 @@
+from social import app, config, load
+from werkzeug.middleware.proxy_fix import ProxyFix
+import gc
+import os
+
+# Production entry point for a prefork server, see gunicorn.conf.py.
+# The master imports this once: it loads the read models (recommender,
+# snapshot with the movie data and similarity lists, leaderboards, search and
+# similar users indexes) and then forks the workers, which share those pages
+# copy on write instead of each building its own. Every worker connects to
+# the graph and starts its hashing processes after the fork.
+
+# every worker must sign sessions with the same key
+app.secret_key = config.SECRET_KEY or os.urandom(24)
+
+# behind the router every request comes from its address, take the client's
+# from X-Forwarded-For so login limits are per client rather than site wide
+if config.PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=config.PROXY_HOPS, x_proto=config.PROXY_HOPS)
+
+timings = load()
+# the collector never scans what is loaded so far, so it doesnt write to
+# those objects and unshare their pages in the workers
+gc.freeze()